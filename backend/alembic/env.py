@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 
 from app.config import settings
 from app.db.base import Base
-from app.models import user, folder, file, share
+from app.models import user, folder, file, share, upload, blob, outbox
 
 config = context.config
 config.set_main_option("sqlalchemy.url", settings.DATABASE_URL)
@@ -0,0 +1,34 @@
+"""Add content-addressed blobs table
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('mime_type', sa.String(length=100), nullable=True),
+    sa.Column('storage_key', sa.Text(), nullable=False),
+    sa.Column('storage_bucket', sa.String(length=255), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.create_index('ix_blobs_unreferenced', 'blobs', ['updated_at'], postgresql_where=sa.text('ref_count <= 0'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blobs_unreferenced', table_name='blobs')
+    op.drop_table('blobs')
@@ -0,0 +1,39 @@
+"""Add composite indexes for keyset pagination
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Built concurrently so live tables aren't locked against writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_files_owner_created', 'files', ['owner_user_id', 'created_at', 'id'],
+            postgresql_where=sa.text('deleted_at IS NULL'),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_shares_sender_created', 'shares', ['sender_user_id', 'created_at', 'id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_shares_recipient_created', 'shares', ['recipient_user_id', 'created_at', 'id'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shares_recipient_created', table_name='shares', postgresql_concurrently=True)
+        op.drop_index('ix_shares_sender_created', table_name='shares', postgresql_concurrently=True)
+        op.drop_index('ix_files_owner_created', table_name='files', postgresql_concurrently=True)
@@ -0,0 +1,35 @@
+"""Add indexes for hot query paths
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns)
+INDEXES = [
+    ('ix_files_folder_created', 'files', ['folder_id', 'created_at', 'id']),
+    ('ix_files_storage_key', 'files', ['storage_key']),
+    ('ix_shares_recipient_email', 'shares', ['recipient_email']),
+    ('ix_shares_file_id', 'shares', ['file_id']),
+    ('ix_folders_owner_name', 'folders', ['owner_user_id', 'name']),
+    ('ix_folders_parent', 'folders', ['parent_folder_id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
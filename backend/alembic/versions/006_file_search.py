@@ -0,0 +1,58 @@
+"""Add full-text search vector and indexes to files
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+# Kept in step with app.models.file.SEARCH_VECTOR_SQL
+SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('english'::regconfig, "
+    "regexp_replace(coalesce(filename, ''), '[[:punct:]]+', ' ', 'g')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, left(coalesce(ocr_text, ''), 200000)), 'C')"
+)
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+
+    # Stored generated column - rewrites the table once, then Postgres keeps it current
+    op.add_column('files', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(SEARCH_VECTOR_SQL, persisted=True),
+        nullable=True
+    ))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_files_search', 'files', ['owner_user_id', 'search_vector'],
+            postgresql_using='gin',
+            postgresql_where=sa.text('deleted_at IS NULL'),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_files_filename_trgm', 'files', ['owner_user_id', 'filename'],
+            postgresql_using='gin',
+            postgresql_ops={'filename': 'gin_trgm_ops'},
+            postgresql_where=sa.text('deleted_at IS NULL'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_files_filename_trgm', table_name='files', postgresql_concurrently=True)
+        op.drop_index('ix_files_search', table_name='files', postgresql_concurrently=True)
+    op.drop_column('files', 'search_vector')
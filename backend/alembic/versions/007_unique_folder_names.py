@@ -0,0 +1,53 @@
+"""Make folder names unique per owner
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Concurrent share deliveries could create the same target folder twice.
+    # Fold every duplicate into the oldest folder of that name before the
+    # unique index goes on.
+    op.execute("""
+        CREATE TEMP TABLE folder_merges ON COMMIT DROP AS
+        SELECT id AS duplicate_id, keep_id
+        FROM (
+            SELECT id,
+                   first_value(id) OVER (
+                       PARTITION BY owner_user_id, name ORDER BY created_at, id
+                   ) AS keep_id
+            FROM folders
+        ) ranked
+        WHERE id <> keep_id
+    """)
+    op.execute("""
+        UPDATE files SET folder_id = m.keep_id
+        FROM folder_merges m WHERE files.folder_id = m.duplicate_id
+    """)
+    op.execute("""
+        UPDATE folders SET parent_folder_id = m.keep_id
+        FROM folder_merges m WHERE folders.parent_folder_id = m.duplicate_id
+    """)
+    op.execute("""
+        UPDATE shares SET target_folder_id = m.keep_id
+        FROM folder_merges m WHERE shares.target_folder_id = m.duplicate_id
+    """)
+    op.execute("""
+        DELETE FROM folders USING folder_merges m WHERE folders.id = m.duplicate_id
+    """)
+    op.create_index('uq_folders_owner_name', 'folders', ['owner_user_id', 'name'], unique=True)
+    op.drop_index('ix_folders_owner_name', table_name='folders')
+
+
+def downgrade() -> None:
+    op.create_index('ix_folders_owner_name', 'folders', ['owner_user_id', 'name'])
+    op.drop_index('uq_folders_owner_name', table_name='folders')
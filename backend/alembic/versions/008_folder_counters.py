@@ -0,0 +1,116 @@
+"""Add maintained file counters to folders
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+# Kept in step with app.models.file.FOLDER_COUNT_DDL
+FOLDER_COUNT_DDL = (
+    """
+    CREATE OR REPLACE FUNCTION folders_count_files_stmt() RETURNS trigger AS $$
+    DECLARE
+        direction integer := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+    BEGIN
+        -- Lock in id order so concurrent multi-folder statements can't deadlock
+        PERFORM 1 FROM folders
+        WHERE id IN (
+            SELECT folder_id FROM changed_files
+            WHERE deleted_at IS NULL AND status IS DISTINCT FROM 'uploading'
+        )
+        ORDER BY id
+        FOR UPDATE;
+
+        UPDATE folders f
+        SET file_count = f.file_count + direction * d.n,
+            total_bytes = f.total_bytes + direction * d.bytes
+        FROM (
+            SELECT folder_id, count(*) AS n, sum(size_bytes) AS bytes
+            FROM changed_files
+            WHERE folder_id IS NOT NULL AND deleted_at IS NULL AND status IS DISTINCT FROM 'uploading'
+            GROUP BY folder_id
+        ) d
+        WHERE f.id = d.folder_id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION folders_count_files_row() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.folder_id IS NOT NULL AND OLD.deleted_at IS NULL AND OLD.status IS DISTINCT FROM 'uploading' THEN
+            UPDATE folders
+            SET file_count = file_count - 1, total_bytes = total_bytes - OLD.size_bytes
+            WHERE id = OLD.folder_id;
+        END IF;
+        IF NEW.folder_id IS NOT NULL AND NEW.deleted_at IS NULL AND NEW.status IS DISTINCT FROM 'uploading' THEN
+            UPDATE folders
+            SET file_count = file_count + 1, total_bytes = total_bytes + NEW.size_bytes
+            WHERE id = NEW.folder_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER files_folder_counts_insert AFTER INSERT ON files
+    REFERENCING NEW TABLE AS changed_files
+    FOR EACH STATEMENT EXECUTE FUNCTION folders_count_files_stmt()
+    """,
+    """
+    CREATE TRIGGER files_folder_counts_delete AFTER DELETE ON files
+    REFERENCING OLD TABLE AS changed_files
+    FOR EACH STATEMENT EXECUTE FUNCTION folders_count_files_stmt()
+    """,
+    """
+    CREATE TRIGGER files_folder_counts_update AFTER UPDATE OF folder_id, deleted_at, size_bytes, status ON files
+    FOR EACH ROW
+    WHEN (
+        OLD.folder_id IS DISTINCT FROM NEW.folder_id
+        OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+        OR OLD.size_bytes IS DISTINCT FROM NEW.size_bytes
+        OR (OLD.status = 'uploading') IS DISTINCT FROM (NEW.status = 'uploading')
+    )
+    EXECUTE FUNCTION folders_count_files_row()
+    """,
+)
+
+
+def upgrade() -> None:
+    op.add_column('folders', sa.Column('file_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('folders', sa.Column('total_bytes', sa.BigInteger(), nullable=False, server_default='0'))
+
+    # Triggers first: creating them locks files against writes until commit,
+    # so the backfill below can't miss a concurrent insert or delete
+    for statement in FOLDER_COUNT_DDL:
+        op.execute(statement)
+
+    op.execute("""
+        UPDATE folders f
+        SET file_count = d.n, total_bytes = d.bytes
+        FROM (
+            SELECT folder_id, count(*) AS n, sum(size_bytes) AS bytes
+            FROM files
+            WHERE folder_id IS NOT NULL AND deleted_at IS NULL AND status IS DISTINCT FROM 'uploading'
+            GROUP BY folder_id
+        ) d
+        WHERE f.id = d.folder_id
+    """)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS files_folder_counts_update ON files')
+    op.execute('DROP TRIGGER IF EXISTS files_folder_counts_delete ON files')
+    op.execute('DROP TRIGGER IF EXISTS files_folder_counts_insert ON files')
+    op.execute('DROP FUNCTION IF EXISTS folders_count_files_row()')
+    op.execute('DROP FUNCTION IF EXISTS folders_count_files_stmt()')
+    op.drop_column('folders', 'total_bytes')
+    op.drop_column('folders', 'file_count')
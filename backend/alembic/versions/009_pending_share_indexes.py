@@ -0,0 +1,41 @@
+"""Index pending shares by recipient email and phone
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+# The inbox no longer matches on email - pending shares are claimed by the
+# account on register/login - so only unclaimed shares need these lookups.
+PENDING = sa.text("recipient_user_id IS NULL")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_shares_pending_email', 'shares', ['recipient_email'],
+            postgresql_where=PENDING, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.create_index(
+            'ix_shares_pending_phone', 'shares', ['recipient_phone'],
+            postgresql_where=PENDING, postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_shares_recipient_email', table_name='shares', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_shares_recipient_email', 'shares', ['recipient_email'],
+            postgresql_concurrently=True, if_not_exists=True
+        )
+        op.drop_index('ix_shares_pending_phone', table_name='shares', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_shares_pending_email', table_name='shares', postgresql_concurrently=True, if_exists=True)
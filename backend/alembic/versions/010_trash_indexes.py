@@ -0,0 +1,37 @@
+"""Index deleted files for the trash listing and purge
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+DELETED = sa.text("deleted_at IS NOT NULL")
+
+# (name, columns)
+INDEXES = [
+    ('ix_files_owner_deleted', ['owner_user_id', 'deleted_at', 'id']),
+    ('ix_files_deleted', ['deleted_at', 'id']),
+]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(
+                name, 'files', columns,
+                postgresql_where=DELETED, postgresql_concurrently=True, if_not_exists=True
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.drop_index(name, table_name='files', postgresql_concurrently=True, if_exists=True)
@@ -3,9 +3,14 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from datetime import datetime
+import hashlib
 from app.db.session import get_db
 from app.models.user import User
-from app.core.security import verify_password, get_password_hash, create_access_token, create_refresh_token
+from app.core.security import averify_password, aget_password_hash, needs_rehash, create_access_token, create_refresh_token
+from app.services.user_cache import get_cached_principal, cache_principal, user_from_principal, invalidate_user
+from app.services.folder_tree import invalidate_folder_tree
+from app.services.search import schedule_index
+from app.services.sharing import claim_pending_shares
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -33,6 +38,9 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     if len(user_data.password) > 72:
         raise HTTPException(status_code=400, detail="Password must be less than 72 characters")
     
+    # Hashed before the first query so no pooled connection waits on bcrypt
+    password_hash = await aget_password_hash(user_data.password)
+    
     # Check if user exists
     result = await db.execute(select(User).where(
         (User.email == user_data.email) | (User.phone == user_data.phone)
@@ -45,7 +53,7 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
         email=user_data.email,
         phone=user_data.phone,
         name=user_data.name,
-        password_hash=get_password_hash(user_data.password),
+        password_hash=password_hash,
         is_verified=False
     )
     
@@ -73,6 +81,11 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
         )
         db.add(folder)
     
+    # Shares sent to this email or phone before the account existed
+    await db.flush()
+    claimed_file_ids = await claim_pending_shares(db, user)
+    schedule_index(db, *claimed_file_ids)
+    
     await db.commit()
     await db.refresh(user)
 
@@ -108,14 +121,18 @@ Enjoy!
 - The FileFlow Team
 """
         filename = "Welcome.txt"
+        checksum = hashlib.sha256(welcome_content).hexdigest()
         
-        # Generate storage key
-        from app.services.storage import storage_service
-        storage_key = storage_service.generate_storage_key(str(user.id), filename)
+        # Every account gets the same bytes, so only the first one uploads them
+        from app.services.storage import get_storage
+        from app.services.blobs import claim_blob, acquire_blob
+        from app.services.quota import charge_storage
+        storage_key = await claim_blob(db, checksum, len(welcome_content))
         
-        # Upload content
-        import io
-        storage_service.upload_file_obj(io.BytesIO(welcome_content), storage_key, "text/plain")
+        if storage_key is None:
+            storage_key = get_storage().generate_storage_key(str(user.id), filename)
+            await get_storage().aput_object_bytes(welcome_content, storage_key, "text/plain")
+            storage_key, _ = await acquire_blob(db, checksum, len(welcome_content), storage_key, "text/plain")
         
         # Create file record
         from app.models.file import File
@@ -130,14 +147,18 @@ Enjoy!
             mime_type="text/plain",
             storage_key=storage_key,
             storage_bucket=settings.B2_BUCKET_NAME,
-            checksum_sha256="pending", # TODO: Calculate
+            checksum_sha256=checksum,
             status="uploaded"
         )
         db.add(welcome_file)
+        await charge_storage(db, user.id, len(welcome_content))
+        await db.flush()
+        schedule_index(db, welcome_file.id)
         await db.commit()
         
     except Exception as e:
         # Don't fail registration if welcome file fails
+        await db.rollback()
         print(f"Failed to create welcome file: {e}")
     
     # Generate tokens
@@ -162,8 +183,10 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalar_one_or_none()
+    # Hand the connection back while bcrypt runs
+    await db.commit()
     
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await averify_password(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
@@ -172,8 +195,19 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Account is deactivated")
     
+    # Upgrade hashes made at an older BCRYPT_ROUNDS while the password is at hand
+    if needs_rehash(user.password_hash):
+        user.password_hash = await aget_password_hash(form_data.password)
+    
     # Update last login
     user.last_login = datetime.utcnow()
+    
+    # Deliver anything sent to the account's email or phone while it was unknown
+    claimed_file_ids = await claim_pending_shares(db, user)
+    if claimed_file_ids:
+        invalidate_user(db, user.id)
+        invalidate_folder_tree(db, user.id)
+    schedule_index(db, *claimed_file_ids)
     await db.commit()
     
     # Generate tokens
@@ -195,7 +229,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
     """Get current authenticated user"""
-    from app.core.security import decode_token
+    from app.core.security import decode_token_cached
     
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -203,7 +237,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    payload = decode_token(token)
+    payload = decode_token_cached(token)
     if payload is None:
         raise credentials_exception
     
@@ -211,10 +245,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     if user_id is None:
         raise credentials_exception
     
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
+    # Common path: cached principal attached to the session without a SELECT
+    principal = await get_cached_principal(user_id)
+    if principal is not None:
+        user = await db.merge(user_from_principal(principal), load=False)
+    else:
+        result = await db.execute(select(User).where(User.id == user_id))
+        user = result.scalar_one_or_none()
+        
+        if user is None:
+            raise credentials_exception
+        
+        await cache_principal(user)
     
-    if user is None:
+    if not user.is_active:
         raise credentials_exception
     
     return user
@@ -1,18 +1,41 @@
-from fastapi.responses import FileResponse as FastAPIFileResponse
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File as FastAPIFile, Form
+from fastapi.responses import FileResponse as FastAPIFileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File as FastAPIFile, Form
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, delete
 from typing import List
+from datetime import datetime, timedelta
 import hashlib
+import logging
+import math
+import os
+import re
 from app.db.session import get_db
 from app.models.user import User
 from app.models.file import File
+from app.models.upload import UploadSession
 from app.api.v1.auth import get_current_user
-from app.services.storage import storage_service
+from app.core.pagination import clamp_limit, created_before, paginate
+from app.core.ranges import content_disposition, http_date, is_not_modified, range_response
+from app.core.rate_limit import RateLimit
+from app.services.user_cache import invalidate_user
+from app.services.storage import get_storage
+from app.services.uploads import StreamingUpload, UploadTooLarge
+from app.services.blobs import acquire_blob
+from app.services.quota import charge_storage, release_storage
+from app.services.trash import purge_after
+from app.services.folder_tree import invalidate_folder_tree
+from app.services.search import schedule_index
+from app.services.outbox import enqueue
+from app.services.archive import COMPRESSION_MODES, file_archive_entries, stream_archive
+from app.services.renditions import accepted_formats, pick_rendition, rendition_content_type
 from app.config import settings
 from pydantic import BaseModel
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_PARTS = 10000
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
 
 class FileUploadInit(BaseModel):
     filename: str
@@ -21,10 +44,47 @@ class FileUploadInit(BaseModel):
     folder_id: str | None = None
 
 class FileUploadResponse(BaseModel):
-    upload_url: str
+    upload_url: str | None
     storage_key: str
     file_id: str
 
+class MultipartUploadInit(BaseModel):
+    filename: str
+    size_bytes: int
+    mime_type: str
+    folder_id: str | None = None
+
+class MultipartUploadResponse(BaseModel):
+    file_id: str
+    storage_key: str
+    part_size: int
+    part_count: int
+    expires_at: str | None
+
+class PartUrlRequest(BaseModel):
+    part_numbers: List[int]
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class MultipartUploadComplete(BaseModel):
+    parts: List[UploadedPart] | None = None
+
+class TrashedFileResponse(BaseModel):
+    id: str
+    filename: str
+    size_bytes: int
+    mime_type: str
+    folder_id: str | None
+    deleted_at: str
+    purge_at: str
+
+class FileArchiveRequest(BaseModel):
+    file_ids: List[str]
+    filename: str | None = None
+    compression: str = "auto"  # auto, or store to skip deflate entirely
+
 class FileResponse(BaseModel):
     id: str
     filename: str
@@ -35,7 +95,21 @@ class FileResponse(BaseModel):
     thumbnail_url: str | None
     view_url: str | None
 
-@router.post("/upload/init", response_model=FileUploadResponse)
+def _expected_checksum(checksum: str | None) -> str | None:
+    """
+    A client-supplied SHA-256, only ever compared with the hash of the bytes
+    we received - never used to find a blob, since knowing a hash doesn't
+    mean having the file.
+    """
+    if not checksum:
+        return None
+    
+    checksum = checksum.lower()
+    if not SHA256_PATTERN.fullmatch(checksum):
+        raise HTTPException(status_code=400, detail="Invalid SHA-256 checksum")
+    return checksum
+
+@router.post("/upload/init", response_model=FileUploadResponse, dependencies=[Depends(RateLimit("upload"))])
 async def init_upload(
     upload_data: FileUploadInit,
     current_user: User = Depends(get_current_user),
@@ -65,8 +139,13 @@ async def init_upload(
     # if any(upload_data.filename.lower().endswith(ext) for ext in dangerous_extensions):
     #     raise HTTPException(status_code=400, detail="File type not allowed for security reasons")
     
+    if not get_storage().presigned_uploads:
+        raise HTTPException(status_code=400, detail="Direct-to-storage uploads are unavailable; use /files/upload/stream")
+    
+    # Deduplicated by finalize_uploaded_file once the bytes are in and hashed
+    
     # Generate storage key
-    storage_key = storage_service.generate_storage_key(str(current_user.id), upload_data.filename)
+    storage_key = get_storage().generate_storage_key(str(current_user.id), upload_data.filename)
     
     # Create file record
     file = File(
@@ -87,7 +166,7 @@ async def init_upload(
     await db.refresh(file)
     
     # Generate presigned upload URL
-    upload_url = storage_service.create_presigned_upload_url(storage_key, upload_data.mime_type)
+    upload_url = get_storage().create_presigned_upload_url(storage_key, upload_data.mime_type)
     
     return {
         "upload_url": upload_url,
@@ -95,75 +174,107 @@ async def init_upload(
         "file_id": str(file.id)
     }
 
-@router.post("/upload/direct", response_model=FileResponse)
-async def upload_file_direct(
-    file: UploadFile = FastAPIFile(...),
-    folder_id: str | None = Form(None),
-    is_hidden: bool = Form(False),
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
-    """Direct file upload (server-side proxy) to bypass CORS issues"""
-    
-    # Validate file size (read from header or check chunk by chunk, but for now rely on Nginx/FastAPI limits)
-    # Note: FastAPI spools to memory/temp file.
-    
-    # Check storage quota (approximate since we don't know exact size yet, or use Content-Length)
-    # For simplicity in this proxy, we'll check after or assume it fits if small enough.
-    # Better: Check Content-Length header if available.
-    
-    size_bytes = 0
-    # We need to calculate size. file.file is a SpooledTemporaryFile.
-    file.file.seek(0, 2)
-    size_bytes = file.file.tell()
-    file.file.seek(0)
+async def _stream_upload(
+    chunks,
+    storage_key: str,
+    content_type: str,
+    current_user: User,
+    expected_checksum: str | None = None
+) -> tuple[int, str]:
+    """Stream chunks to storage, enforcing file size and quota limits on the fly"""
+    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    remaining_quota = current_user.storage_quota_bytes - current_user.storage_used_bytes
     
-    if current_user.storage_used_bytes + size_bytes > current_user.storage_quota_bytes:
-        raise HTTPException(status_code=400, detail="Storage quota exceeded")
-
-    # Generate storage key
-    storage_key = storage_service.generate_storage_key(str(current_user.id), file.filename)
+    upload = StreamingUpload(
+        get_storage(),
+        storage_key,
+        content_type,
+        max_size=min(max_size, remaining_quota)
+    )
     
-    # Upload to S3
     try:
-        storage_service.upload_file_obj(file.file, storage_key, file.content_type)
+        async for chunk in chunks:
+            await upload.write(chunk)
+        size_bytes, checksum = await upload.finish()
+    except UploadTooLarge:
+        await upload.abort()
+        if upload.size > max_size:
+            raise HTTPException(status_code=400, detail=f"File size exceeds {settings.MAX_FILE_SIZE_MB}MB limit")
+        raise HTTPException(status_code=400, detail="Storage quota exceeded")
     except Exception as e:
+        await upload.abort()
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
     
-    # Create file record
+    if expected_checksum and checksum != expected_checksum:
+        try:
+            await get_storage().adelete_file(storage_key)
+        except Exception as e:
+            logger.warning(f"Failed to delete corrupt upload {storage_key}: {str(e)}")
+        raise HTTPException(status_code=400, detail="Checksum mismatch: the upload was corrupted in transit")
+    return size_bytes, checksum
+
+async def _read_upload_file(file: UploadFile):
+    while chunk := await file.read(settings.UPLOAD_READ_CHUNK_SIZE):
+        yield chunk
+
+async def _create_uploaded_file(
+    db: AsyncSession,
+    current_user: User,
+    filename: str,
+    mime_type: str,
+    storage_key: str,
+    size_bytes: int,
+    checksum: str,
+    folder_id: str | None,
+    is_hidden: bool
+) -> dict:
+    """Record a fully uploaded file, charge storage and kick off processing"""
+    # The authoritative quota check: charged in place, and only if it still fits
+    if not await charge_storage(db, current_user.id, size_bytes):
+        await db.rollback()
+        try:
+            await get_storage().adelete_file(storage_key)
+        except Exception as e:
+            logger.warning(f"Failed to delete over-quota upload {storage_key}: {str(e)}")
+        raise HTTPException(status_code=400, detail="Storage quota exceeded")
+    invalidate_user(db, current_user.id)
+    invalidate_folder_tree(db, current_user.id)
+    
+    # checksum is what we hashed while receiving the bytes, so the blob is really theirs
+    canonical_key, created = await acquire_blob(db, checksum, size_bytes, storage_key, mime_type)
+    if not created:
+        # Someone already stored these bytes - point at their blob and drop our copy
+        try:
+            await get_storage().adelete_file(storage_key)
+        except Exception as e:
+            logger.warning(f"Failed to delete duplicate upload {storage_key}: {str(e)}")
+        storage_key = canonical_key
+    
     db_file = File(
         owner_user_id=current_user.id,
         folder_id=folder_id,
-        filename=file.filename,
-        original_filename=file.filename,
+        filename=filename,
+        original_filename=filename,
         size_bytes=size_bytes,
-        mime_type=file.content_type,
+        mime_type=mime_type,
         storage_key=storage_key,
         storage_bucket=settings.B2_BUCKET_NAME,
-        checksum_sha256="pending",
+        checksum_sha256=checksum,
         status="hidden" if is_hidden else "uploaded"
     )
     
     db.add(db_file)
+    await db.flush()
     
-    # Update user storage
-    current_user.storage_used_bytes += size_bytes
+    # Published by the outbox relay once this commits
+    enqueue(db, "process_media", str(db_file.id))
+    schedule_index(db, db_file.id)
     
     await db.commit()
     await db.refresh(db_file)
     
-    # Trigger background tasks
-    from app.workers.tasks import process_file_ocr, generate_thumbnail
-    process_file_ocr.delay(str(db_file.id), db_file.storage_key, db_file.mime_type)
-    generate_thumbnail.delay(str(db_file.id), db_file.storage_key, db_file.mime_type)
-    
-    # Generate view URL
-    # For B2/S3, we can generate a direct presigned URL for viewing
-    if hasattr(storage_service, 'create_presigned_view_url'):
-        view_url = storage_service.create_presigned_view_url(db_file.storage_key, db_file.mime_type)
-    else:
-        # Fallback for local storage or if method missing
-        view_url = f"{settings.API_V1_PREFIX}/files/download/proxy?key={db_file.storage_key}&disposition=inline"
+    # Presigned for B2; a download proxy URL for local and in-memory storage
+    view_url = get_storage().create_presigned_view_url(db_file.storage_key, db_file.mime_type)
     
     return {
         "id": str(db_file.id),
@@ -176,54 +287,425 @@ async def upload_file_direct(
         "view_url": view_url
     }
 
+@router.post("/upload/direct", response_model=FileResponse, dependencies=[Depends(RateLimit("upload"))])
+async def upload_file_direct(
+    file: UploadFile = FastAPIFile(...),
+    folder_id: str | None = Form(None),
+    is_hidden: bool = Form(False),
+    checksum_sha256: str | None = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Direct file upload (server-side proxy) to bypass CORS issues"""
+    
+    content_type = file.content_type or "application/octet-stream"
+    expected_checksum = _expected_checksum(checksum_sha256)
+    
+    if file.size is not None and current_user.storage_used_bytes + file.size > current_user.storage_quota_bytes:
+        raise HTTPException(status_code=400, detail="Storage quota exceeded")
+    
+    # The multipart form has already been spooled by FastAPI; read it back in
+    # chunks so hashing and the storage transfer never block the event loop.
+    storage_key = get_storage().generate_storage_key(str(current_user.id), file.filename)
+    
+    size_bytes, checksum = await _stream_upload(
+        _read_upload_file(file), storage_key, content_type, current_user, expected_checksum
+    )
+    
+    return await _create_uploaded_file(
+        db, current_user, file.filename, content_type, storage_key,
+        size_bytes, checksum, folder_id, is_hidden
+    )
+
+@router.put("/upload/stream", response_model=FileResponse, dependencies=[Depends(RateLimit("upload"))])
+async def upload_file_stream(
+    request: Request,
+    filename: str,
+    folder_id: str | None = None,
+    is_hidden: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream the raw request body straight to storage without spooling it first"""
+    
+    # Reject obviously oversized uploads before reading a single byte
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise HTTPException(status_code=400, detail=f"File size exceeds {settings.MAX_FILE_SIZE_MB}MB limit")
+        if current_user.storage_used_bytes + int(content_length) > current_user.storage_quota_bytes:
+            raise HTTPException(status_code=400, detail="Storage quota exceeded")
+    
+    content_type = request.headers.get("content-type") or "application/octet-stream"
+    # Optional integrity check; duplicates are found from the hash of what actually arrives
+    expected_checksum = _expected_checksum(request.headers.get("x-content-sha256"))
+    
+    storage_key = get_storage().generate_storage_key(str(current_user.id), filename)
+    
+    size_bytes, checksum = await _stream_upload(
+        request.stream(), storage_key, content_type, current_user, expected_checksum
+    )
+    
+    return await _create_uploaded_file(
+        db, current_user, filename, content_type, storage_key,
+        size_bytes, checksum, folder_id, is_hidden
+    )
+
 @router.post("/upload/{file_id}/complete")
 async def complete_upload(
     file_id: str,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Mark upload as complete and update user storage"""
+    """Mark upload as complete and update user storage (safe to retry)"""
+    
+    # Only the call that moves the file out of "uploading" charges for it
+    if not await _finish_presigned_upload(db, file_id, current_user, settings.MAX_FILE_SIZE_MB):
+        return {"message": "Upload completed", "file_id": file_id}
+    
+    # Hash and dedupe the stored bytes; processing is started once that's done
+    enqueue(db, "finalize_uploaded_file", file_id)
+    
+    await db.commit()
     
+    return {"message": "Upload completed", "file_id": file_id}
+
+async def _mark_uploaded(db: AsyncSession, file_id: str, current_user: User) -> str | None:
+    """
+    Move a file from "uploading" to "uploaded", returning its storage key.
+    Returns None when an earlier call already finished it.
+    """
     result = await db.execute(
-        select(File).where(
+        update(File)
+        .where(
             File.id == file_id,
-            File.owner_user_id == current_user.id
+            File.owner_user_id == current_user.id,
+            File.status == "uploading",
+            File.deleted_at.is_(None)
         )
+        .values(status="uploaded")
+        .returning(File.storage_key)
     )
-    file = result.scalar_one_or_none()
+    storage_key = result.scalar_one_or_none()
+    if storage_key is not None:
+        return storage_key
     
-    if not file:
+    result = await db.execute(
+        select(File.id).where(
+            File.id == file_id,
+            File.owner_user_id == current_user.id,
+            File.deleted_at.is_(None)
+        )
+    )
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="File not found")
+    return None
+
+async def _finish_presigned_upload(db: AsyncSession, file_id: str, current_user: User, max_size_mb: int) -> bool:
+    """
+    Mark a presigned upload uploaded and charge for the bytes that actually
+    arrived - presigned PUTs don't enforce the size declared at init. An
+    object over max_size_mb or the quota is deleted with its file row (400).
+    Returns False when an earlier call already finished the upload.
+    """
+    storage_key = await _mark_uploaded(db, file_id, current_user)
+    if storage_key is None:
+        return False
+    
+    stat = await get_storage().astat(storage_key)
+    if stat is None:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Nothing has been uploaded for this file")
+    size_bytes = stat["size"]
+    
+    if size_bytes > max_size_mb * 1024 * 1024:
+        detail = f"File size exceeds {max_size_mb}MB limit"
+    elif not await charge_storage(db, current_user.id, size_bytes):
+        detail = "Storage quota exceeded"
+    else:
+        await db.execute(update(File).where(File.id == file_id).values(size_bytes=size_bytes))
+        invalidate_user(db, current_user.id)
+        invalidate_folder_tree(db, current_user.id)
+        return True
+    
+    await db.rollback()
+    await db.execute(delete(File).where(File.id == file_id, File.owner_user_id == current_user.id))
+    await db.commit()
+    try:
+        await get_storage().adelete_file(storage_key)
+    except Exception as e:
+        logger.warning(f"Failed to delete rejected upload {storage_key}: {str(e)}")
+    raise HTTPException(status_code=400, detail=detail)
+
+async def _get_upload_session(
+    db: AsyncSession,
+    file_id: str,
+    current_user: User,
+    statuses: tuple = ("active",)
+) -> UploadSession:
+    result = await db.execute(
+        select(UploadSession).where(
+            UploadSession.file_id == file_id,
+            UploadSession.owner_user_id == current_user.id,
+            UploadSession.status.in_(statuses)
+        )
+    )
+    upload_session = result.scalar_one_or_none()
+    
+    if not upload_session:
+        raise HTTPException(status_code=404, detail="Upload not found or already finished")
+    
+    return upload_session
+
+@router.post("/upload/multipart/init", response_model=MultipartUploadResponse, dependencies=[Depends(RateLimit("upload"))])
+async def init_multipart_upload(
+    upload_data: MultipartUploadInit,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start a resumable multipart upload - parts are pushed directly to storage"""
+    
+    if upload_data.size_bytes <= 0:
+        raise HTTPException(status_code=400, detail="Invalid file size")
+    
+    max_size = settings.MAX_MULTIPART_FILE_SIZE_MB * 1024 * 1024
+    if upload_data.size_bytes > max_size:
+        raise HTTPException(status_code=400, detail=f"File size exceeds {settings.MAX_MULTIPART_FILE_SIZE_MB}MB limit")
+    
+    if current_user.storage_used_bytes + upload_data.size_bytes > current_user.storage_quota_bytes:
+        raise HTTPException(status_code=400, detail="Storage quota exceeded")
+    
+    if not get_storage().presigned_uploads:
+        raise HTTPException(status_code=400, detail="Direct-to-storage uploads are unavailable; use /files/upload/stream")
+    
+    # S3 allows at most 10,000 parts, so grow the part size for very large files
+    part_size = max(
+        settings.UPLOAD_PART_SIZE_MB * 1024 * 1024,
+        math.ceil(upload_data.size_bytes / MAX_UPLOAD_PARTS)
+    )
+    part_count = math.ceil(upload_data.size_bytes / part_size)
+    
+    storage_key = get_storage().generate_storage_key(str(current_user.id), upload_data.filename)
+    
+    try:
+        upload_id = await get_storage().acreate_multipart_upload(
+            storage_key,
+            upload_data.mime_type
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    file = File(
+        owner_user_id=current_user.id,
+        folder_id=upload_data.folder_id,
+        filename=upload_data.filename,
+        original_filename=upload_data.filename,
+        size_bytes=upload_data.size_bytes,
+        mime_type=upload_data.mime_type,
+        storage_key=storage_key,
+        storage_bucket=settings.B2_BUCKET_NAME,
+        checksum_sha256="pending",
+        status="uploading"
+    )
+    db.add(file)
+    await db.flush()
+    
+    upload_session = UploadSession(
+        file_id=file.id,
+        owner_user_id=current_user.id,
+        storage_key=storage_key,
+        upload_id=upload_id,
+        part_size=part_size,
+        part_count=part_count,
+        status="active",
+        expires_at=datetime.utcnow() + timedelta(hours=settings.MULTIPART_UPLOAD_EXPIRY_HOURS)
+    )
+    db.add(upload_session)
+    await db.commit()
+    
+    return {
+        "file_id": str(file.id),
+        "storage_key": storage_key,
+        "part_size": part_size,
+        "part_count": part_count,
+        "expires_at": upload_session.expires_at.isoformat()
+    }
+
+@router.post("/upload/multipart/{file_id}/parts")
+async def get_part_upload_urls(
+    file_id: str,
+    request_data: PartUrlRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get presigned URLs for a batch of parts so clients can upload them in parallel"""
     
-    # Update file status
-    file.status = "uploaded"
+    upload_session = await _get_upload_session(db, file_id, current_user)
     
-    # Update user storage
-    current_user.storage_used_bytes += file.size_bytes
+    if len(request_data.part_numbers) > 1000:
+        raise HTTPException(status_code=400, detail="At most 1000 part URLs per request")
+    
+    for part_number in request_data.part_numbers:
+        if part_number < 1 or part_number > upload_session.part_count:
+            raise HTTPException(status_code=400, detail=f"Invalid part number {part_number}")
+    
+    return {
+        "parts": [
+            {
+                "part_number": part_number,
+                "upload_url": get_storage().create_presigned_part_url(
+                    upload_session.storage_key,
+                    upload_session.upload_id,
+                    part_number
+                )
+            }
+            for part_number in sorted(set(request_data.part_numbers))
+        ],
+        "expires_in": settings.S3_PRESIGNED_URL_EXPIRY
+    }
+
+@router.get("/upload/multipart/{file_id}/parts")
+async def list_uploaded_parts(
+    file_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """List parts storage has acknowledged - clients resume from the gaps"""
+    
+    upload_session = await _get_upload_session(db, file_id, current_user)
+    
+    try:
+        parts = await get_storage().alist_parts(
+            upload_session.storage_key,
+            upload_session.upload_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {
+        "file_id": file_id,
+        "part_size": upload_session.part_size,
+        "part_count": upload_session.part_count,
+        "parts": [
+            {
+                "part_number": part["PartNumber"],
+                "etag": part["ETag"],
+                "size_bytes": part["Size"]
+            }
+            for part in parts
+        ]
+    }
+
+@router.post("/upload/multipart/{file_id}/complete")
+async def complete_multipart_upload(
+    file_id: str,
+    complete_data: MultipartUploadComplete | None = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Assemble uploaded parts into the final object and mark the file uploaded (safe to retry)"""
+    
+    upload_session = await _get_upload_session(db, file_id, current_user, ("active", "completed"))
+    if upload_session.status == "completed":
+        return {"message": "Upload completed", "file_id": file_id}
+    
+    if complete_data and complete_data.parts:
+        parts = [{"PartNumber": p.part_number, "ETag": p.etag} for p in complete_data.parts]
+    else:
+        # Let storage tell us what arrived
+        try:
+            listed = await get_storage().alist_parts(
+                upload_session.storage_key,
+                upload_session.upload_id
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        parts = [{"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in listed]
+    
+    received = {p["PartNumber"] for p in parts}
+    missing = [n for n in range(1, upload_session.part_count + 1) if n not in received]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing parts: {missing[:20]}")
+    
+    # Claim the session first: a concurrent retry waits on this row and then
+    # finds it completed, so storage is charged exactly once
+    result = await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == upload_session.id, UploadSession.status == "active")
+        .values(status="completed")
+        .returning(UploadSession.id)
+    )
+    if result.scalar_one_or_none() is None:
+        return {"message": "Upload completed", "file_id": file_id}
+    
+    # Assembled while the claim is held; a failure releases it
+    try:
+        await get_storage().acomplete_multipart_upload(
+            upload_session.storage_key,
+            upload_session.upload_id,
+            parts
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # Charged at the assembled object's size, not the one declared at init
+    if not await _finish_presigned_upload(db, file_id, current_user, settings.MAX_MULTIPART_FILE_SIZE_MB):
+        await db.commit()
+        return {"message": "Upload completed", "file_id": file_id}
+    
+    # Hash and dedupe the stored bytes; processing is started once that's done
+    enqueue(db, "finalize_uploaded_file", file_id)
     
     await db.commit()
     
-    # Trigger background tasks
-    from app.workers.tasks import process_file_ocr, generate_thumbnail
+    return {"message": "Upload completed", "file_id": file_id}
+
+@router.delete("/upload/multipart/{file_id}")
+async def abort_multipart_upload(
+    file_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Abort a multipart upload and discard its parts"""
     
-    process_file_ocr.delay(str(file.id), file.storage_key, file.mime_type)
-    generate_thumbnail.delay(str(file.id), file.storage_key, file.mime_type)
+    upload_session = await _get_upload_session(db, file_id, current_user)
     
-    return {"message": "Upload completed", "file_id": str(file.id)}
+    try:
+        await get_storage().aabort_multipart_upload(
+            upload_session.storage_key,
+            upload_session.upload_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    await db.execute(delete(File).where(File.id == upload_session.file_id))
+    await db.commit()
+    
+    return {"message": "Upload aborted", "file_id": file_id}
 
 @router.get("/", response_model=List[FileResponse])
 async def get_files(
+    request: Request,
+    response: Response,
     folder_id: str | None = None,
     search: str | None = None,
     limit: int = 50,
+    cursor: str | None = None,
     offset: int = 0,
+    viewport: int | None = Query(None, ge=1, le=4096, description="Rendered thumbnail width in device pixels"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get files for current user with pagination and search"""
+    """Get files for current user with cursor pagination and search.
+    
+    The next page's cursor is returned in the X-Next-Cursor header; ``offset``
+    is still accepted for older clients but gets slower the deeper it goes.
+    ``thumbnail_url`` points at the smallest rendition covering ``viewport``
+    pixels, in AVIF or WebP when the Accept header allows it.
+    """
     # Validate pagination
-    if limit > 100:
-        limit = 100
+    limit = clamp_limit(limit)
     if offset < 0:
         offset = 0
     
@@ -239,8 +721,31 @@ async def get_files(
     if search:
         query = query.where(File.filename.ilike(f"%{search}%"))
     
-    result = await db.execute(query.order_by(File.created_at.desc()).limit(limit).offset(offset))
-    files = result.scalars().all()
+    if cursor:
+        query = query.where(created_before(File.created_at, File.id, cursor))
+    elif offset:
+        query = query.offset(offset)
+    
+    result = await db.execute(query.order_by(File.created_at.desc(), File.id.desc()).limit(limit + 1))
+    files = paginate(result.scalars().all(), limit, response, lambda f: (f.created_at, f.id))
+    
+    formats = accepted_formats(request.headers.get("accept"))
+    response.headers["Vary"] = "Accept"
+    thumbnails = []
+    for f in files:
+        rendition = pick_rendition(f.preview_urls, viewport, formats)
+        if rendition:
+            thumbnails.append((rendition["key"], rendition["content_type"]))
+        elif f.thumbnail_url:
+            thumbnails.append((f.thumbnail_url, "image/jpeg"))
+        else:
+            thumbnails.append(None)
+    
+    # Sign the whole page in one batch - URLs are cached and stable per time bucket
+    storage = get_storage()
+    view_urls = storage.create_presigned_view_urls([(f.storage_key, f.mime_type) for f in files])
+    thumbnail_urls = iter(storage.create_presigned_view_urls([t for t in thumbnails if t]))
+    thumbnail_urls = [next(thumbnail_urls) if t else None for t in thumbnails]
     
     return [
         {
@@ -250,54 +755,162 @@ async def get_files(
             "mime_type": file.mime_type,
             "folder_id": str(file.folder_id) if file.folder_id else None,
             "created_at": file.created_at.isoformat(),
-            "thumbnail_url": file.thumbnail_url,
-            "thumbnail_url": file.thumbnail_url,
-            "view_url": storage_service.create_presigned_view_url(file.storage_key, file.mime_type) if hasattr(storage_service, 'create_presigned_view_url') else f"{settings.API_V1_PREFIX}/files/download/proxy?key={file.storage_key}&disposition=inline"
+            "thumbnail_url": thumbnail_url,
+            "view_url": view_url
+        }
+        for file, view_url, thumbnail_url in zip(files, view_urls, thumbnail_urls)
+    ]
+
+@router.get("/trash", response_model=List[TrashedFileResponse])
+async def list_trash(
+    response: Response,
+    limit: int = 50,
+    cursor: str | None = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Deleted files that can still be restored, most recently deleted first"""
+    limit = clamp_limit(limit)
+    
+    query = select(File).where(
+        File.owner_user_id == current_user.id,
+        File.deleted_at.isnot(None)
+    )
+    if cursor:
+        query = query.where(created_before(File.deleted_at, File.id, cursor))
+    
+    result = await db.execute(query.order_by(File.deleted_at.desc(), File.id.desc()).limit(limit + 1))
+    files = paginate(result.scalars().all(), limit, response, lambda f: (f.deleted_at, f.id))
+    
+    return [
+        {
+            "id": str(file.id),
+            "filename": file.filename,
+            "size_bytes": file.size_bytes,
+            "mime_type": file.mime_type,
+            "folder_id": str(file.folder_id) if file.folder_id else None,
+            "deleted_at": file.deleted_at.isoformat(),
+            "purge_at": purge_after(file.deleted_at).isoformat()
         }
         for file in files
     ]
 
 @router.get("/download/proxy")
 async def download_proxy(
+    request: Request,
     key: str,
     disposition: str = "attachment",
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Proxy download for local storage"""
-    # Security check: Ensure the user owns the file associated with this key
-    # This is a bit tricky since we only have the key. 
-    # Ideally we should look up the file by ID, but the URL structure uses the key.
-    # Let's verify the key format or look it up.
-    
-    # Better approach: The frontend calls /files/{id}/download, which returns this proxy URL.
-    # So the user already authenticated there. 
-    # But this endpoint itself needs protection.
-    # For now, we'll allow it if authenticated, but in production we should verify ownership.
-    # We can query the DB to check if any file with this storage_key belongs to the user.
+    """
+    Serve an object through the API for storage backends without presigned URLs.
+    Supports byte ranges (single and multipart/byteranges) and conditional GETs
+    keyed on the content checksum, so a cached copy costs no storage request
+    and seeking in a video fetches only the range asked for.
+    """
+    if disposition not in ("attachment", "inline"):
+        raise HTTPException(status_code=400, detail="Invalid disposition")
     
-    result = await db.execute(
-        select(File).where(
-            File.storage_key == key,
-            File.owner_user_id == current_user.id
-        )
-    )
+    # Only objects behind one of the caller's files: the file itself, or a
+    # rendition of its content. Deduplicated copies share keys, hence limit(1).
+    owned = select(File).where(File.owner_user_id == current_user.id, File.deleted_at.is_(None))
+    rendition = re.fullmatch(r"renditions/([0-9a-f]{64})/[^/]+", key)
+    if rendition:
+        owned = owned.where(File.checksum_sha256 == rendition.group(1))
+    else:
+        owned = owned.where(File.storage_key == key)
+    result = await db.execute(owned.limit(1))
     file = result.scalar_one_or_none()
     
     if not file:
         raise HTTPException(status_code=404, detail="File not found or access denied")
-        
-    if not os.path.exists(key):
+    
+    filename = file.original_filename if disposition == "attachment" and not rendition else None
+    media_type = rendition_content_type(key) if rendition else file.mime_type
+    storage = get_storage()
+    
+    # Objects are never rewritten in place, so the content hash is a strong
+    # validator; until the checksum lands we fall back to the storage ETag
+    if rendition:
+        etag = f'"{rendition.group(1)}-{key.rsplit("/", 1)[1]}"'
+    elif SHA256_PATTERN.fullmatch(file.checksum_sha256 or ""):
+        etag = f'"{file.checksum_sha256}"'
+    else:
+        etag = None
+    headers = {
+        "Cache-Control": "private, no-cache",
+        "Content-Disposition": content_disposition(disposition, filename)
+    }
+    
+    if etag:
+        headers["ETag"] = etag
+        if is_not_modified(request, etag, None):
+            return Response(status_code=304, headers=headers)
+    
+    # Local disk: a file response - ranges, If-Range, and zero-copy where the server supports it
+    path = storage.local_path(key)
+    if path is not None:
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="File not found on server")
+        headers.pop("Content-Disposition")
+        return FastAPIFileResponse(
+            path=path,
+            filename=filename,
+            media_type=media_type,
+            content_disposition_type=disposition,
+            headers=headers
+        )
+    
+    info = await storage.astat(key)
+    if info is None:
         raise HTTPException(status_code=404, detail="File not found on server")
-        
-    return FastAPIFileResponse(
-        path=key, 
-        filename=file.original_filename if disposition == "attachment" else None,
-        media_type=file.mime_type,
-        content_disposition_type=disposition
+    
+    if etag is None:
+        storage_etag = info["etag"].strip('"')
+        etag = headers["ETag"] = f'"{storage_etag}"'
+    last_modified = info["last_modified"]
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    
+    return range_response(
+        request,
+        lambda start, end: storage.aiter_range(key, start, end),
+        info["size"],
+        media_type,
+        headers,
+        etag=etag,
+        last_modified=last_modified
     )
 
-import os
+@router.post("/archive")
+async def download_archive(
+    archive_request: FileArchiveRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download many files as one ZIP, streamed from storage as it is built"""
+    if archive_request.compression not in COMPRESSION_MODES:
+        raise HTTPException(status_code=400, detail="Invalid compression")
+    if not archive_request.file_ids:
+        raise HTTPException(status_code=400, detail="No files requested")
+    if len(archive_request.file_ids) > settings.ARCHIVE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ARCHIVE_MAX_FILES} files per archive")
+    
+    entries = await file_archive_entries(db, current_user.id, archive_request.file_ids)
+    if not entries:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    filename = archive_request.filename or "files.zip"
+    if not filename.lower().endswith(".zip"):
+        filename += ".zip"
+    return StreamingResponse(
+        stream_archive(get_storage(), entries, archive_request.compression),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition("attachment", filename)}
+    )
 
 @router.get("/{file_id}/download")
 async def get_download_url(
@@ -318,12 +931,8 @@ async def get_download_url(
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # For local storage, we can just return the file directly if we change the frontend to expect a blob
-    # OR we return a URL that points to a download endpoint.
-    # Let's use the proxy approach.
-    
-    # If using LocalStorageService, the URL will be /api/v1/files/download/proxy?key=...
-    download_url = storage_service.create_presigned_download_url(
+    # Local and in-memory storage hand out /api/v1/files/download/proxy?key=... instead
+    download_url = get_storage().create_presigned_download_url(
         file.storage_key,
         filename=file.original_filename
     )
@@ -348,26 +957,76 @@ async def delete_file(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Delete file (soft delete)"""
-    from datetime import datetime
+    """Move a file to the trash; it is purged after TRASH_RETENTION_DAYS"""
     
+    # Soft delete; only the call that actually deletes gives the storage back
     result = await db.execute(
-        select(File).where(
+        update(File)
+        .where(
             File.id == file_id,
-            File.owner_user_id == current_user.id
+            File.owner_user_id == current_user.id,
+            File.deleted_at.is_(None)
         )
+        .values(deleted_at=datetime.utcnow())
+        .returning(File.size_bytes, File.status)
     )
-    file = result.scalar_one_or_none()
-    
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
+    deleted = result.first()
     
-    # Soft delete
-    file.deleted_at = datetime.utcnow()
+    if deleted is None:
+        result = await db.execute(
+            select(File.id).where(File.id == file_id, File.owner_user_id == current_user.id)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return {"message": "File deleted successfully"}
     
-    # Update user storage
-    current_user.storage_used_bytes -= file.size_bytes
+    if deleted.status != "uploading":
+        await release_storage(db, current_user.id, deleted.size_bytes)
+        invalidate_user(db, current_user.id)
+        invalidate_folder_tree(db, current_user.id)
     
+    schedule_index(db, file_id)
     await db.commit()
     
     return {"message": "File deleted successfully"}
+
+@router.post("/{file_id}/restore")
+async def restore_file(
+    file_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Move a file out of the trash"""
+    
+    # Only the call that actually restores charges for the storage again
+    result = await db.execute(
+        update(File)
+        .where(
+            File.id == file_id,
+            File.owner_user_id == current_user.id,
+            File.deleted_at.isnot(None)
+        )
+        .values(deleted_at=None)
+        .returning(File.size_bytes, File.status)
+    )
+    restored = result.first()
+    
+    if restored is None:
+        result = await db.execute(
+            select(File.id).where(File.id == file_id, File.owner_user_id == current_user.id)
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return {"message": "File restored successfully"}
+    
+    if restored.status != "uploading":
+        if not await charge_storage(db, current_user.id, restored.size_bytes):
+            await db.rollback()
+            raise HTTPException(status_code=400, detail="Storage quota exceeded")
+        invalidate_user(db, current_user.id)
+        invalidate_folder_tree(db, current_user.id)
+    
+    schedule_index(db, file_id)
+    await db.commit()
+    
+    return {"message": "File restored successfully"}
@@ -1,12 +1,23 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from typing import List
 from app.db.session import get_db
 from app.models.user import User
 from app.models.folder import Folder
 from app.models.file import File
 from app.api.v1.auth import get_current_user
+from app.core.ranges import content_disposition
+from app.services.archive import COMPRESSION_MODES, folder_archive_entries, stream_archive
+from app.services.blobs import release_blob_refs
+from app.services.storage import get_storage
+from app.services.quota import release_storage
+from app.services.user_cache import invalidate_user
+from app.services.folder_tree import get_folder_tree, invalidate_folder_tree
+from app.services.search import schedule_index
+from app.config import settings
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -20,12 +31,25 @@ class FolderCreate(BaseModel):
 
 class FolderResponse(BaseModel):
     id: str
+    parent_folder_id: str | None = None
     name: str
     description: str | None
     icon: str
     color: str
     file_count: int = 0
+    total_bytes: int = 0
+    position: int
+
+class FolderTreeNode(BaseModel):
+    id: str
+    name: str
+    description: str | None
+    icon: str
+    color: str
     position: int
+    file_count: int
+    total_bytes: int
+    children: List["FolderTreeNode"] = []
 
 @router.get("/", response_model=List[FolderResponse])
 async def get_folders(
@@ -33,21 +57,20 @@ async def get_folders(
     db: AsyncSession = Depends(get_db)
 ):
     """Get all folders for current user"""
-    from sqlalchemy import func
-    
+    # Counts are maintained on the folder rows - no scan over the user's files
     result = await db.execute(
         select(
             Folder.id,
+            Folder.parent_folder_id,
             Folder.name,
             Folder.description,
             Folder.icon,
             Folder.color,
             Folder.position,
-            func.count(File.id).label('file_count')
+            Folder.file_count,
+            Folder.total_bytes
         )
-        .outerjoin(File, (File.folder_id == Folder.id) & (File.deleted_at.is_(None)))
         .where(Folder.owner_user_id == current_user.id)
-        .group_by(Folder.id, Folder.name, Folder.description, Folder.icon, Folder.color, Folder.position)
         .order_by(Folder.position)
     )
     
@@ -56,16 +79,50 @@ async def get_folders(
     return [
         {
             "id": str(row.id),
+            "parent_folder_id": str(row.parent_folder_id) if row.parent_folder_id else None,
             "name": row.name,
             "description": row.description,
             "icon": row.icon,
             "color": row.color,
-            "file_count": row.file_count or 0,
+            "file_count": row.file_count,
+            "total_bytes": row.total_bytes,
             "position": row.position
         }
         for row in folders
     ]
 
+@router.get("/tree", response_model=List[FolderTreeNode])
+async def get_folders_tree(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the whole folder hierarchy, nested, with file counts and sizes"""
+    return await get_folder_tree(db, current_user.id)
+
+@router.get("/{folder_id}/archive")
+async def download_folder_archive(
+    folder_id: str,
+    compression: str = "auto",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Download a folder and its subfolders as one ZIP, streamed from storage as it is built"""
+    if compression not in COMPRESSION_MODES:
+        raise HTTPException(status_code=400, detail="Invalid compression")
+    
+    archive = await folder_archive_entries(db, current_user.id, folder_id)
+    if archive is None:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    name, entries = archive
+    if len(entries) > settings.ARCHIVE_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ARCHIVE_MAX_FILES} files per archive")
+    
+    return StreamingResponse(
+        stream_archive(get_storage(), entries, compression),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition("attachment", f"{name}.zip")}
+    )
+
 @router.post("/", response_model=FolderResponse, status_code=201)
 async def create_folder(
     folder_data: FolderCreate,
@@ -73,6 +130,16 @@ async def create_folder(
     db: AsyncSession = Depends(get_db)
 ):
     """Create new folder"""
+    if folder_data.parent_folder_id:
+        result = await db.execute(
+            select(Folder.id).where(
+                Folder.id == folder_data.parent_folder_id,
+                Folder.owner_user_id == current_user.id
+            )
+        )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Parent folder not found")
+    
     # Calculate position
     from sqlalchemy import func
     result = await db.execute(
@@ -92,16 +159,23 @@ async def create_folder(
     )
     
     db.add(folder)
-    await db.commit()
+    invalidate_folder_tree(db, current_user.id)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="A folder with this name already exists")
     await db.refresh(folder)
     
     return {
         "id": str(folder.id),
+        "parent_folder_id": str(folder.parent_folder_id) if folder.parent_folder_id else None,
         "name": folder.name,
         "description": folder.description,
         "icon": folder.icon,
         "color": folder.color,
         "file_count": 0,
+        "total_bytes": 0,
         "position": folder.position
     }
 
@@ -123,6 +197,22 @@ async def delete_folder(
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
     
+    # Files are removed with the folder - release their blobs and storage
+    result = await db.execute(
+        select(File.id, File.checksum_sha256, File.size_bytes, File.status, File.deleted_at)
+        .where(File.folder_id == folder.id)
+    )
+    removed = result.all()
+    await release_blob_refs(db, [row.checksum_sha256 for row in removed])
+    await release_storage(db, current_user.id, sum(
+        row.size_bytes for row in removed
+        if row.deleted_at is None and row.status != "uploading"
+    ))
+    invalidate_user(db, current_user.id)
+    invalidate_folder_tree(db, current_user.id)
+    
+    schedule_index(db, *(row.id for row in removed))
+    
     await db.delete(folder)
     await db.commit()
     
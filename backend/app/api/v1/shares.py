@@ -1,15 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, or_
 from typing import List
-from datetime import datetime
 from app.db.session import get_db
 from app.models.user import User
 from app.models.file import File
-from app.models.folder import Folder
 from app.models.share import Share
 from app.api.v1.auth import get_current_user
-from app.core.security import generate_transaction_id
+from app.core.pagination import clamp_limit, created_before, paginate
+from app.core.rate_limit import RateLimit
+from app.services.user_cache import invalidate_user
+from app.services.sharing import deliver_share, deliver_shares_batch, MAX_BATCH_DELIVERIES
+from app.services.search import schedule_index
+from app.services.folder_tree import invalidate_folder_tree
 from pydantic import BaseModel, EmailStr
 
 router = APIRouter()
@@ -34,7 +37,7 @@ class ShareResponse(BaseModel):
     created_at: str
     message: str | None
 
-@router.post("/", response_model=ShareResponse, status_code=201)
+@router.post("/", response_model=ShareResponse, status_code=201, dependencies=[Depends(RateLimit("share"))])
 async def send_file(
     share_data: ShareCreate,
     current_user: User = Depends(get_current_user),
@@ -46,119 +49,46 @@ async def send_file(
     if not share_data.recipient_email and not share_data.recipient_phone:
         raise HTTPException(status_code=400, detail="Recipient email or phone required")
     
-    # Get file
-    result = await db.execute(
-        select(File).where(
-            File.id == share_data.file_id,
-            File.owner_user_id == current_user.id,
-            File.deleted_at.is_(None)
-        )
+    share = await deliver_share(
+        db,
+        current_user,
+        share_data.file_id,
+        share_data.recipient_email,
+        share_data.recipient_phone,
+        share_data.target_folder_name,
+        share_data.message,
+        share_data.share_type
     )
-    file = result.scalar_one_or_none()
-    
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found or deleted")
     
-    # Check if file is ready
-    # Check if file is ready
-    if file.status not in ["uploaded", "hidden"]:
-        raise HTTPException(status_code=400, detail="File is not ready to be shared")
-    
-    # Find recipient
-    recipient = None
-    if share_data.recipient_email:
+    if share is None:
+        # Only on failure: work out which check the file didn't pass
         result = await db.execute(
-            select(User).where(User.email == share_data.recipient_email)
+            select(File.status).where(
+                File.id == share_data.file_id,
+                File.owner_user_id == current_user.id,
+                File.deleted_at.is_(None)
+            )
         )
-        recipient = result.scalar_one_or_none()
-    
-    # Generate transaction ID
-    transaction_id = generate_transaction_id()
-    
-    # Create share/transaction
-    share = Share(
-        file_id=file.id,
-        sender_user_id=current_user.id,
-        sender_name=current_user.name,
-        sender_email=current_user.email,
-        recipient_user_id=recipient.id if recipient else None,
-        recipient_email=share_data.recipient_email,
-        recipient_phone=share_data.recipient_phone,
-        recipient_name=recipient.name if recipient else None,
-        target_folder_name=share_data.target_folder_name,
-        message=share_data.message,
-        share_type=share_data.share_type,
-        transaction_id=transaction_id,
-        status="sent"
-    )
+        if result.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="File not found or deleted")
+        raise HTTPException(status_code=400, detail="File is not ready to be shared")
     
-    db.add(share)
+    if share.charged_user_id:
+        invalidate_user(db, share.charged_user_id)
+        invalidate_folder_tree(db, share.charged_user_id)
     
-    # If recipient exists, mark as delivered
-    # If recipient exists, mark as delivered and create file copy
-    if recipient:
-        share.status = "delivered"
-        share.delivered_at = datetime.utcnow()
-        
-        # 1. Find or Create Target Folder for Recipient
-        result = await db.execute(
-            select(Folder).where(
-                Folder.owner_user_id == recipient.id,
-                Folder.name == share_data.target_folder_name
-            )
-        )
-        target_folder = result.scalar_one_or_none()
-        
-        if not target_folder:
-            # Create folder if it doesn't exist
-            # Need to calculate position
-            from sqlalchemy import func
-            result = await db.execute(
-                select(func.max(Folder.position)).where(Folder.owner_user_id == recipient.id)
-            )
-            max_position = result.scalar()
-            new_position = (max_position + 1) if max_position is not None else 0
-            
-            target_folder = Folder(
-                owner_user_id=recipient.id,
-                name=share_data.target_folder_name,
-                icon="📁", # Default icon
-                color="#667eea", # Default color
-                position=new_position
-            )
-            db.add(target_folder)
-            await db.flush() # Flush to get ID
-            
-        # 2. Create File Record for Recipient
-        # We point to the SAME storage key (deduplication)
-        recipient_file = File(
-            owner_user_id=recipient.id,
-            folder_id=target_folder.id,
-            filename=file.filename,
-            original_filename=file.original_filename,
-            size_bytes=file.size_bytes,
-            mime_type=file.mime_type,
-            storage_key=file.storage_key,
-            storage_bucket=file.storage_bucket,
-            checksum_sha256=file.checksum_sha256,
-            status="uploaded" # Visible to recipient
-        )
-        
-        db.add(recipient_file)
-        
-        # Update recipient storage usage
-        recipient.storage_used_bytes += file.size_bytes
-        
-        # TODO: Send notification to recipient
+    # TODO: Send notification to recipient
+    
+    if share.recipient_file_id:
+        schedule_index(db, share.recipient_file_id)
     
     await db.commit()
-    await db.refresh(share)
     
     return {
         "id": str(share.id),
         "transaction_id": share.transaction_id,
-        "file_id": str(file.id),
-        "filename": file.filename,
+        "file_id": str(share.file_id),
+        "filename": share.filename,
         "sender_name": current_user.name,
         "recipient_name": share.recipient_name,
         "target_folder_name": share.target_folder_name,
@@ -167,22 +97,107 @@ async def send_file(
         "message": share.message
     }
 
+class BatchRecipient(BaseModel):
+    email: EmailStr | None = None
+    phone: str | None = None
+
+class BatchShareCreate(BaseModel):
+    file_ids: List[str]
+    recipients: List[BatchRecipient]
+    target_folder_name: str
+    message: str | None = None
+    share_type: str = "direct"
+
+@router.post("/batch", status_code=201, dependencies=[Depends(RateLimit("share"))])
+async def send_files_batch(
+    batch: BatchShareCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Send several files to several recipients in one transaction"""
+    
+    if not batch.file_ids or not batch.recipients:
+        raise HTTPException(status_code=400, detail="At least one file and one recipient required")
+    if any(not r.email and not r.phone for r in batch.recipients):
+        raise HTTPException(status_code=400, detail="Recipient email or phone required")
+    
+    file_ids = list(dict.fromkeys(batch.file_ids))
+    recipients = list(dict.fromkeys((r.email, r.phone) for r in batch.recipients))
+    if len(file_ids) * len(recipients) > MAX_BATCH_DELIVERIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch can hold at most {MAX_BATCH_DELIVERIES} deliveries"
+        )
+    
+    try:
+        deliveries = await deliver_shares_batch(
+            db,
+            current_user,
+            file_ids,
+            recipients,
+            batch.target_folder_name,
+            batch.message,
+            batch.share_type
+        )
+    except LookupError as e:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Files not found or not ready to be shared: {', '.join(e.args[0])}"
+        )
+    
+    recipient_ids = {d["recipient_user_id"] for d in deliveries if d["recipient_user_id"]}
+    for user_id in recipient_ids:
+        invalidate_user(db, user_id)
+    invalidate_folder_tree(db, *recipient_ids)
+    schedule_index(db, *(d["recipient_file_id"] for d in deliveries if d["recipient_file_id"]))
+    
+    await db.commit()
+    
+    return {
+        "deliveries": [
+            {
+                "id": d["id"],
+                "transaction_id": d["transaction_id"],
+                "file_id": d["file_id"],
+                "filename": d["filename"],
+                "recipient_email": d["recipient_email"],
+                "recipient_phone": d["recipient_phone"],
+                "recipient_name": d["recipient_name"],
+                "status": d["status"]
+            }
+            for d in deliveries
+        ],
+        "delivered": sum(1 for d in deliveries if d["status"] == "delivered"),
+        "pending": sum(1 for d in deliveries if d["status"] == "sent")
+    }
+
 @router.get("/sent", response_model=List[ShareResponse])
 async def get_sent_transactions(
+    response: Response,
+    limit: int = 50,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all sent transactions (like bank statement)"""
+    """Get sent transactions (like bank statement), newest first.
     
-    result = await db.execute(
+    Pass the X-Next-Cursor response header back as ``cursor`` for older pages.
+    """
+    limit = clamp_limit(limit)
+    
+    query = (
         select(Share, File)
         .join(File, Share.file_id == File.id)
         .where(Share.sender_user_id == current_user.id)
-        .order_by(Share.created_at.desc())
     )
+    if cursor:
+        query = query.where(created_before(Share.created_at, Share.id, cursor))
+    
+    result = await db.execute(query.order_by(Share.created_at.desc(), Share.id.desc()).limit(limit + 1))
+    rows = paginate(result.all(), limit, response, lambda row: (row.Share.created_at, row.Share.id))
     
     transactions = []
-    for share, file in result.all():
+    for share, file in rows:
         transactions.append({
             "id": str(share.id),
             "transaction_id": share.transaction_id,
@@ -200,25 +215,33 @@ async def get_sent_transactions(
 
 @router.get("/received", response_model=List[ShareResponse])
 async def get_received_transactions(
+    response: Response,
+    limit: int = 50,
+    cursor: str | None = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all received transactions (inbox)"""
+    """Get received transactions (inbox), newest first.
     
-    result = await db.execute(
+    Pass the X-Next-Cursor response header back as ``cursor`` for older pages.
+    """
+    limit = clamp_limit(limit)
+    
+    query = (
         select(Share, File)
         .join(File, Share.file_id == File.id)
-        .where(
-            or_(
-                Share.recipient_user_id == current_user.id,
-                Share.recipient_email == current_user.email
-            )
-        )
-        .order_by(Share.created_at.desc())
+        # Pending shares are bound to the account when it registers or logs
+        # in, so the indexed recipient_user_id alone finds the whole inbox
+        .where(Share.recipient_user_id == current_user.id)
     )
+    if cursor:
+        query = query.where(created_before(Share.created_at, Share.id, cursor))
+    
+    result = await db.execute(query.order_by(Share.created_at.desc(), Share.id.desc()).limit(limit + 1))
+    rows = paginate(result.all(), limit, response, lambda row: (row.Share.created_at, row.Share.id))
     
     transactions = []
-    for share, file in result.all():
+    for share, file in rows:
         transactions.append({
             "id": str(share.id),
             "transaction_id": share.transaction_id,
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     # App
@@ -16,12 +16,23 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str
-    DATABASE_POOL_SIZE: int = 20
+    DATABASE_POOL_SIZE: int = 10  # per API process (async engine)
     DATABASE_MAX_OVERFLOW: int = 10
+    WORKER_DATABASE_POOL_SIZE: int = 2  # per Celery worker process (sync engine)
+    WORKER_DATABASE_MAX_OVERFLOW: int = 2
+    DATABASE_POOL_TIMEOUT: int = 30
+    DATABASE_POOL_RECYCLE: int = 1800  # seconds; below server/proxy idle timeouts
+    DATABASE_POOL_PRE_PING: bool = True
+    DATABASE_PGBOUNCER: bool = False  # behind PgBouncer in transaction mode
+    DATABASE_ECHO: bool = False
     
     # Redis
     REDIS_URL: str
     REDIS_CACHE_TTL: int = 3600
+    USER_CACHE_TTL: int = 60
+    USER_CACHE_LOCAL_TTL: int = 5
+    USER_CACHE_LOCAL_SIZE: int = 10000
+    FOLDER_TREE_CACHE_TTL: int = 300
     
     # JWT
     JWT_SECRET_KEY: str
@@ -29,12 +40,49 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
     
+    # Storage backend: b2, local or memory
+    STORAGE_BACKEND: str = "b2"
+    LOCAL_STORAGE_PATH: str = "./uploads"
+    
     # Backblaze B2
     B2_KEY_ID: str | None = None
     B2_APP_KEY: str | None = None
     B2_BUCKET_NAME: str | None = None
     B2_ENDPOINT_URL: str | None = None
     S3_PRESIGNED_URL_EXPIRY: int = 3600  # 1 hour 
+    PRESIGNED_URL_BUCKET_SECONDS: int = 900  # URLs are stable within this window
+    PRESIGNED_URL_CACHE_SIZE: int = 50000
+    
+    # Uploads
+    UPLOAD_PART_SIZE_MB: int = 8  # S3/B2 minimum part size is 5MB
+    UPLOAD_READ_CHUNK_SIZE: int = 64 * 1024
+    UPLOAD_MAX_PARTS_IN_FLIGHT: int = 4
+    STORAGE_IO_WORKERS: int = 16
+    MAX_MULTIPART_FILE_SIZE_MB: int = 5120
+    MULTIPART_UPLOAD_EXPIRY_HOURS: int = 24
+    
+    # Trash
+    TRASH_RETENTION_DAYS: int = 30
+    TRASH_PURGE_BATCH_SIZE: int = 500
+    
+    # Zip downloads
+    ARCHIVE_MAX_FILES: int = 10000
+    ARCHIVE_PREFETCH_FILES: int = 3  # objects fetched ahead of the entry being streamed
+    ARCHIVE_PREFETCH_CHUNKS: int = 4  # chunks buffered per object
+    
+    # OCR
+    OCR_PAGE_WORKERS: int = 4  # PDF pages rasterised / OCR'd concurrently per task
+    OCR_DPI: int = 200
+    OCR_MAX_PAGES: int = 500
+    
+    # Thumbnail / preview renditions
+    RENDITION_WIDTHS: List[int] = [160, 320, 640, 1280]
+    RENDITION_FORMATS: List[str] = ["avif", "webp", "jpeg"]  # unsupported encoders are skipped
+    THUMBNAIL_DEFAULT_WIDTH: int = 320
+    
+    # Search
+    SEARCH_BACKEND: str = "postgres"  # postgres or elasticsearch
+    
     # Elasticsearch
     ELASTICSEARCH_URL: str
     ELASTICSEARCH_INDEX: str = "fileflow_files"
@@ -43,6 +91,13 @@ class Settings(BaseSettings):
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
     
+    # Task outbox relay
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_SECONDS: float = 0.5  # idle wait between polls
+    OUTBOX_MAX_QUEUE_DEPTH: int = 10000  # publishing pauses while the Celery queues are deeper
+    OUTBOX_RETRY_MAX_SECONDS: int = 300  # cap on the backoff after a broker failure
+    OUTBOX_RELAY_METRICS_PORT: int = 9809  # 0 disables
+    
     # Email
     SENDGRID_API_KEY: str = ""
     FROM_EMAIL: str = "noreply@fileflow.com"
@@ -54,11 +109,20 @@ class Settings(BaseSettings):
     
     # Security
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
-    RATE_LIMIT_PER_MINUTE: int = 60
+    BCRYPT_ROUNDS: int = 12  # existing hashes are upgraded on the next login
+    PASSWORD_HASH_WORKERS: int = 2  # threads per process; each hash keeps a core busy
+    PASSWORD_HASH_MAX_QUEUE: int = 64  # beyond this, auth requests get 503 until the backlog clears
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: int = 60  # per user and route class (auth, upload, share, search)
+    RATE_LIMITS: Dict[str, int] = {"auth": 10}  # per-class overrides
+    RATE_LIMIT_LOCAL_TOKENS: int = 5  # tokens a process leases from Redis at once
+    RATE_LIMIT_LOCAL_TTL: float = 1.0  # seconds a leased token stays usable
     MAX_FILE_SIZE_MB: int = 100
     
     # Monitoring
     SENTRY_DSN: str = ""
+    SLOW_REQUEST_SECONDS: float = 1.0
+    WORKER_METRICS_PORT: int = 9808  # Celery worker /metrics; 0 disables
     
     # Storage Quotas
     FREE_STORAGE_GB: int = 5
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+import redis
+import redis.asyncio as aioredis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class LocalTTLCache:
+    """Small thread-safe in-process LRU whose entries expire after a TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _local_caches.append(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+_local_caches: list[LocalTTLCache] = []
+
+# Redis clients are created lazily so importing this module never opens a connection
+_redis = None
+_sync_redis = None
+
+def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = aioredis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+    return _redis
+
+def get_sync_redis() -> redis.Redis:
+    global _sync_redis
+    if _sync_redis is None:
+        _sync_redis = redis.from_url(
+            settings.REDIS_URL,
+            decode_responses=True,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5
+        )
+    return _sync_redis
+
+async def cache_get_json(key: str):
+    """Read a JSON value from Redis - a cache miss on any Redis error"""
+    try:
+        raw = await get_redis().get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Redis get failed for {key}: {str(e)}")
+        return None
+    return json.loads(raw) if raw is not None else None
+
+async def cache_set_json(key: str, value, ttl: int = None):
+    """Write a JSON value to Redis, ignoring Redis errors"""
+    try:
+        await get_redis().set(key, json.dumps(value), ex=ttl or settings.REDIS_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Redis set failed for {key}: {str(e)}")
+
+def _evict_local(keys):
+    for cache in _local_caches:
+        for key in keys:
+            cache.delete(key)
+
+async def cache_delete(*keys: str):
+    """Drop keys from Redis and every in-process cache"""
+    _evict_local(keys)
+    try:
+        await get_redis().delete(*keys)
+    except redis.RedisError as e:
+        logger.warning(f"Redis delete failed for {keys}: {str(e)}")
+
+def cache_delete_sync(*keys: str):
+    """Synchronous cache_delete for Celery tasks"""
+    _evict_local(keys)
+    try:
+        get_sync_redis().delete(*keys)
+    except redis.RedisError as e:
+        logger.warning(f"Redis delete failed for {keys}: {str(e)}")
+
+# Post-commit invalidation
+#
+# Handlers register the cache keys their writes affect; the keys are dropped
+# once the transaction commits (never before, so the next read repopulates
+# from the committed row) and forgotten if it rolls back.
+
+_background_tasks = set()
+
+def invalidate_on_commit(db, *keys: str):
+    """Drop these cache keys once the session's current transaction commits"""
+    session = getattr(db, "sync_session", db)
+    session.info.setdefault("cache_invalidations", set()).update(keys)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    keys = session.info.pop("cache_invalidations", None)
+    if not keys:
+        return
+
+    # Local entries go immediately; Redis is cleared without holding up the response
+    _evict_local(keys)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop is None:
+        cache_delete_sync(*keys)
+        return
+
+    task = loop.create_task(cache_delete(*keys))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session):
+    session.info.pop("cache_invalidations", None)
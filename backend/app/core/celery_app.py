@@ -1,10 +1,12 @@
 from celery import Celery
 from app.config import settings
+from app.core.metrics import instrument_celery
 
 celery_app = Celery(
     "worker",
     broker=settings.CELERY_BROKER_URL,
-    backend=settings.CELERY_RESULT_BACKEND
+    backend=settings.CELERY_RESULT_BACKEND,
+    include=["app.workers.tasks"]
 )
 
 celery_app.conf.update(
@@ -16,4 +18,24 @@ celery_app.conf.update(
     task_routes={
         "app.workers.tasks.*": {"queue": "default"},
     },
+    beat_schedule={
+        "abort-stale-multipart-uploads": {
+            "task": "abort_stale_multipart_uploads",
+            "schedule": 3600.0,
+        },
+        "gc-blobs": {
+            "task": "gc_blobs",
+            "schedule": 3600.0,
+        },
+        "purge-trash": {
+            "task": "purge_trash",
+            "schedule": 3600.0,
+        },
+        "reconcile-storage-usage": {
+            "task": "reconcile_storage_usage",
+            "schedule": 86400.0,
+        },
+    },
 )
+
+instrument_celery()
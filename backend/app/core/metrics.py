@@ -0,0 +1,217 @@
+"""
+Prometheus metrics.
+
+The API serves them at ``/metrics``; Celery workers on WORKER_METRICS_PORT.
+Under a multi-process server or prefork Celery workers, point
+PROMETHEUS_MULTIPROC_DIR at an empty directory shared by the processes so
+every process's samples are aggregated into one scrape.
+
+Covered: per-route request latency and in-flight requests (PerformanceMiddleware),
+database queries and time per request, connection pools, storage calls per
+operation, password hashing, Celery task durations and queue depth, and the
+task outbox relay (served on OUTBOX_RELAY_METRICS_PORT).
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess, start_http_server
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TASK_BUCKETS = (0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being served",
+    ["method"], multiprocess_mode="livesum"
+)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Database queries issued per request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Time spent in database queries per request",
+    ["route"], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "Database query latency", buckets=LATENCY_BUCKETS
+)
+STORAGE_OPERATION_SECONDS = Histogram(
+    "storage_operation_duration_seconds", "Storage call latency (time to first chunk for ranged reads)",
+    ["backend", "operation", "outcome"], buckets=LATENCY_BUCKETS
+)
+CELERY_TASK_SECONDS = Histogram(
+    "celery_task_duration_seconds", "Celery task run time",
+    ["task", "state"], buckets=TASK_BUCKETS
+)
+CELERY_QUEUE_DEPTH = Gauge(
+    "celery_queue_depth", "Messages waiting in a Celery queue",
+    ["queue"], multiprocess_mode="mostrecent"
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth", "Password hashes waiting for a hashing thread",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds", "bcrypt time per password hash or check",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests", "Requests rejected by the rate limiter", ["route_class"]
+)
+OUTBOX_PUBLISHED = Counter(
+    "outbox_published", "Outbox messages published to the broker", ["task"]
+)
+OUTBOX_PUBLISH_ERRORS = Counter(
+    "outbox_publish_errors", "Outbox batches the broker refused"
+)
+OUTBOX_LAG_SECONDS = Gauge(
+    "outbox_lag_seconds", "Age of the oldest due outbox message in the relay's last batch",
+    multiprocess_mode="max"
+)
+
+# Per-request database usage
+
+class RequestDB:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+request_db: ContextVar[RequestDB | None] = ContextVar("request_db", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_QUERY_SECONDS.observe(elapsed)
+    usage = request_db.get()
+    if usage is not None:
+        usage.queries += 1
+        usage.seconds += elapsed
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # Failed statements never reach after_cursor_execute
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+# Storage
+
+def observe_storage(backend: str, operation: str, start: float, ok: bool = True):
+    STORAGE_OPERATION_SECONDS.labels(backend, operation, "ok" if ok else "error").observe(time.perf_counter() - start)
+
+# Connection pools, read at scrape time
+
+class PoolCollector:
+    """Pool gauges from app.db.session.pool_status() (the serving process only in multiprocess mode)"""
+
+    def collect(self):
+        from app.db.session import pool_status
+
+        gauges = {
+            "size": GaugeMetricFamily("db_pool_size", "Pooled connections kept open", labels=["pool"]),
+            "checked_out": GaugeMetricFamily("db_pool_checked_out", "Connections in use", labels=["pool"]),
+            "overflow": GaugeMetricFamily("db_pool_overflow", "Connections open beyond the pool size", labels=["pool"]),
+        }
+        counters = {
+            "checkouts": CounterMetricFamily("db_pool_checkouts", "Connection checkouts", labels=["pool"]),
+            "wait_seconds_total": CounterMetricFamily("db_pool_wait_seconds", "Time spent waiting for a connection", labels=["pool"]),
+            "timeouts": CounterMetricFamily("db_pool_timeouts", "Checkouts that timed out", labels=["pool"]),
+        }
+        for pool, status in pool_status().items():
+            for key, family in (*gauges.items(), *counters.items()):
+                family.add_metric([pool], status[key])
+        yield from gauges.values()
+        yield from counters.values()
+
+def _registry() -> CollectorRegistry:
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+_pool_registry = CollectorRegistry()
+_pool_registry.register(PoolCollector())
+
+# Celery queue depth, read at scrape time
+
+_broker = None
+
+def celery_queues() -> set[str]:
+    from app.core.celery_app import celery_app
+
+    queues = {celery_app.conf.task_default_queue}
+    queues.update(route["queue"] for route in (celery_app.conf.task_routes or {}).values() if "queue" in route)
+    return queues
+
+async def _update_queue_depth():
+    global _broker
+    if _broker is None:
+        import redis.asyncio as aioredis
+        _broker = aioredis.from_url(settings.CELERY_BROKER_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    try:
+        async with _broker.pipeline(transaction=False) as pipe:
+            queues = sorted(celery_queues())
+            for queue in queues:
+                pipe.llen(queue)
+            depths = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Queue depth unavailable: {e}")
+        return
+    for queue, depth in zip(queues, depths):
+        CELERY_QUEUE_DEPTH.labels(queue).set(depth)
+
+def serve_metrics(port: int):
+    """Serve /metrics from a background thread, for processes without the API"""
+    start_http_server(port, registry=_registry())
+
+async def render_metrics() -> bytes:
+    """The text exposition for /metrics"""
+    await _update_queue_depth()
+    return generate_latest(_registry()) + generate_latest(_pool_registry)
+
+# Celery workers
+
+def instrument_celery():
+    """Time tasks and serve the worker's metrics; called when the Celery app is created"""
+    from celery.signals import task_prerun, task_postrun, worker_init, worker_process_shutdown
+
+    @task_prerun.connect(weak=False)
+    def _task_started(task_id=None, task=None, **kwargs):
+        task.request.metrics_started = time.perf_counter()
+
+    @task_postrun.connect(weak=False)
+    def _task_finished(task_id=None, task=None, state=None, **kwargs):
+        started = getattr(task.request, "metrics_started", None)
+        if started is not None:
+            CELERY_TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+    @worker_init.connect(weak=False)
+    def _serve_metrics(**kwargs):
+        if settings.WORKER_METRICS_PORT:
+            serve_metrics(settings.WORKER_METRICS_PORT)
+
+    @worker_process_shutdown.connect(weak=False)
+    def _process_gone(pid=None, **kwargs):
+        if MULTIPROCESS:
+            multiprocess.mark_process_dead(pid or os.getpid())
@@ -1,9 +1,13 @@
 import time
 import logging
 import json
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from pythonjsonlogger import jsonlogger
+from app.config import settings
+from app.core.metrics import (
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, RequestDB, request_db
+)
 
 class JSONLogFormatter(jsonlogger.JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
@@ -25,17 +29,66 @@ def setup_logging():
     logger.addHandler(logHandler)
     logger.setLevel(logging.INFO)
 
-class PerformanceMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        
-        # Log slow requests
-        if process_time > 1.0:
-            logging.getLogger("performance").warning(
-                f"Slow Request: {request.method} {request.url.path} took {process_time:.4f}s"
-            )
-            
-        response.headers["X-Process-Time"] = str(process_time)
-        return response
+# id(route) -> full path template. Routes of an included router keep their path
+# without the prefix it was mounted at, so main.py records each prefix here.
+ROUTE_TEMPLATES = {}
+
+def register_route_templates(router, prefix: str):
+    """Label router's routes with prefix + route path"""
+    for route in router.routes:
+        ROUTE_TEMPLATES[id(route)] = prefix + route.path
+
+def route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    return ROUTE_TEMPLATES.get(id(route)) or getattr(route, "path", None) or "unmatched"
+
+class PerformanceMiddleware:
+    """
+    Pure ASGI middleware recording request metrics: latency by route template,
+    in-flight requests and database usage per request. Slow requests are
+    logged, and X-Process-Time carries the time to the response headers.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        start = time.perf_counter()
+        status = 500
+        db = RequestDB()
+        token = request_db.set(db)
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+
+        async def send_with_timing(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("X-Process-Time", f"{time.perf_counter() - start:.6f}")
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_flight.dec()
+            request_db.reset(token)
+
+            # Templated path, so /files/{file_id} is one series rather than one per file
+            route = route_template(scope)
+            HTTP_REQUEST_SECONDS.labels(method, route, str(status)).observe(elapsed)
+            REQUEST_DB_QUERIES.labels(route).observe(db.queries)
+            REQUEST_DB_SECONDS.labels(route).observe(db.seconds)
+
+            if elapsed > settings.SLOW_REQUEST_SECONDS:
+                logging.getLogger("performance").warning(
+                    f"Slow Request: {method} {scope['path']} took {elapsed:.4f}s "
+                    f"({db.queries} queries, {db.seconds:.4f}s in the database)"
+                )
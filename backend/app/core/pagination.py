@@ -0,0 +1,67 @@
+"""
+Opaque keyset (cursor) pagination on (created_at, id).
+
+Listings return one page of items and put the cursor for the next page in
+the ``X-Next-Cursor`` response header, so existing clients that only read
+the body keep working. Seeking past the last row uses a row comparison that
+the composite (owner, created_at, id) indexes satisfy directly, so every
+page costs the same no matter how deep it is.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(*values) -> str:
+    payload = [v.isoformat() if isinstance(v, datetime) else str(v) for v in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list):
+            raise ValueError("cursor must be a list")
+        return values
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def created_before(created_col, id_col, cursor: str):
+    """Filter for rows strictly after the cursor in (created_at DESC, id DESC) order"""
+    values = decode_cursor(cursor)
+    try:
+        created_at = datetime.fromisoformat(values[0])
+        row_id = uuid.UUID(values[1])
+    except (IndexError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple_(created_col, id_col) < tuple_(created_at, row_id)
+
+def ranked_before(rank_expr, id_col, cursor: str):
+    """Filter for rows strictly after the cursor in (rank DESC, id DESC) order"""
+    values = decode_cursor(cursor)
+    try:
+        rank = float(values[0])
+        row_id = uuid.UUID(values[1])
+    except (IndexError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return tuple_(rank_expr, id_col) < tuple_(rank, row_id)
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def paginate(rows: list, limit: int, response: Response, cursor_values) -> list:
+    """
+    Trim a ``limit + 1`` result to one page and advertise the next cursor.
+
+    ``cursor_values`` maps the last row of the page to the values encoded in
+    the cursor.
+    """
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*cursor_values(rows[-1]))
+    return rows
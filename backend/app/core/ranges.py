@@ -0,0 +1,198 @@
+"""
+HTTP range requests, conditional GETs and Content-Disposition for downloads.
+
+Starlette's FileResponse already does this for files on local disk; these
+helpers give objects streamed from remote storage the same behaviour, with
+each requested range fetched by its own ranged GET so seeking in a large
+video only transfers the bytes viewed.
+"""
+import calendar
+import secrets
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, Callable
+from urllib.parse import quote
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+# More ranges than this (or ranges that overlap into a bigger response than
+# the object itself) get the whole object instead - RFC 9110 allows either
+MAX_RANGES = 16
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def http_date(value: datetime) -> str:
+    """IMF-fixdate for a naive UTC datetime"""
+    return formatdate(calendar.timegm(value.utctimetuple()), usegmt=True)
+
+def content_disposition(disposition: str, filename: str | None) -> str:
+    if not filename:
+        return disposition
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"{disposition}; filename*=utf-8''{quoted}"
+    return f'{disposition}; filename="{filename}"'
+
+def _etags(header: str) -> list[str]:
+    return [tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()]
+
+def etag_matches(header: str | None, etag: str) -> bool:
+    """Weak comparison of an If-None-Match list against our ETag"""
+    if not header:
+        return False
+    tags = _etags(header)
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+def is_not_modified(request: Request, etag: str | None, last_modified: datetime | None) -> bool:
+    """True when the client's cached copy is current (If-None-Match wins over If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag is not None and etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0, tzinfo=None) <= since
+    return False
+
+def parse_range(header: str, size: int) -> list[tuple[int, int]] | None:
+    """
+    Inclusive (start, end) pairs for a ``Range: bytes=...`` header, merged and
+    sorted. Returns None when the header should be ignored and the whole
+    object served; raises RangeNotSatisfiable when no range overlaps it.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        start, sep, end = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not start:
+                # Suffix range: the last N bytes
+                length = int(end)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            first = int(start)
+            last = int(end) if end else None
+        except ValueError:
+            return None
+        if last is None:
+            last = size - 1
+        elif first > last:
+            return None
+        if first < size:
+            ranges.append((first, min(last, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for first, last in ranges[1:]:
+        prev_first, prev_last = merged[-1]
+        if first <= prev_last + 1:
+            merged[-1] = (prev_first, max(prev_last, last))
+        else:
+            merged.append((first, last))
+
+    if sum(last - first + 1 for first, last in merged) >= size:
+        return None
+    return merged
+
+def if_range_allows(request: Request, etag: str | None, last_modified: datetime | None) -> bool:
+    """A Range is only honoured when If-Range (if any) still names this representation"""
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # Weak validators never match for ranges
+        return etag is not None and not etag.startswith("W/") and if_range == etag
+    return last_modified is not None and if_range == http_date(last_modified)
+
+def range_response(
+    request: Request,
+    read: Callable[[int, int], AsyncIterator[bytes]],
+    size: int,
+    media_type: str,
+    headers: dict,
+    etag: str | None = None,
+    last_modified: datetime | None = None
+) -> Response:
+    """
+    200, 206 (single or multipart/byteranges) or 416 for an object of
+    ``size`` bytes. ``read(start, end)`` streams an inclusive byte range.
+    """
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    header = request.headers.get("range")
+
+    ranges = None
+    if header and if_range_allows(request, etag, last_modified):
+        try:
+            ranges = parse_range(header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if not ranges:
+        return StreamingResponse(
+            read(0, size - 1) if size else _empty(),
+            media_type=media_type,
+            headers={**headers, "Content-Length": str(size)}
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return StreamingResponse(
+            read(start, end),
+            status_code=206,
+            media_type=media_type,
+            headers={
+                **headers,
+                "Content-Length": str(end - start + 1),
+                "Content-Range": f"bytes {start}-{end}/{size}"
+            }
+        )
+
+    boundary = secrets.token_hex(13)
+    part_headers = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        for start, end in ranges
+    ]
+    closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    length = sum(len(h) + end - start + 1 for h, (start, end) in zip(part_headers, ranges))
+    length += 2 * (len(ranges) - 1) + len(closing)
+
+    async def parts():
+        for i, ((start, end), part_header) in enumerate(zip(ranges, part_headers)):
+            if i:
+                yield b"\r\n"
+            yield part_header
+            async for chunk in read(start, end):
+                yield chunk
+        yield closing
+
+    return StreamingResponse(
+        parts(),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers={**headers, "Content-Length": str(length)}
+    )
+
+async def _empty():
+    return
+    yield
@@ -0,0 +1,143 @@
+"""
+Distributed rate limiting: one token bucket per user (or client IP when
+unauthenticated) and route class, kept in Redis so every API process and node
+shares it.
+
+A bucket holds a minute's worth of requests and refills continuously. Each
+check runs one Lua script - a single round trip, using Redis' clock - that
+refills the bucket and takes tokens from it. To keep Redis off most requests,
+a process leases a few tokens at a time (RATE_LIMIT_LOCAL_TOKENS, fewer for
+small limits) and spends them locally for up to RATE_LIMIT_LOCAL_TTL seconds;
+a rejected key is also remembered locally until its next token is due. Leased
+tokens are already taken from the shared bucket, so nodes can't jointly exceed
+the limit - unspent ones just expire.
+
+If Redis is unreachable requests are let through.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+import redis
+from fastapi import HTTPException, Request, status
+from app.config import settings
+from app.core.cache import get_redis
+from app.core.metrics import RATE_LIMITED
+from app.core.security import decode_token_cached
+
+logger = logging.getLogger(__name__)
+
+ROUTE_CLASSES = ("auth", "upload", "share", "search")
+
+# KEYS[1] bucket; ARGV capacity, refill rate (tokens/second), tokens wanted.
+# Returns {tokens granted, seconds until the next token when none were}.
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local granted = math.min(wanted, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+
+local wait = 0
+if granted == 0 then
+    wait = (1 - tokens) / rate
+end
+return {granted, tostring(wait)}
+"""
+
+def limit_for(route_class: str) -> int:
+    """Requests per minute allowed per user in route_class"""
+    return settings.RATE_LIMITS.get(route_class, settings.RATE_LIMIT_PER_MINUTE)
+
+class TokenBucketLimiter:
+    """Shared token buckets with a per-process lease of tokens in front"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        # key -> [leased tokens left, lease expiry, blocked until]
+        self._local = OrderedDict()
+        self._script = None
+
+    def _lease_size(self, limit: int) -> int:
+        return max(1, min(settings.RATE_LIMIT_LOCAL_TOKENS, limit // 20))
+
+    async def _take(self, key: str, limit: int, wanted: int) -> tuple[int, float]:
+        if self._script is None:
+            self._script = get_redis().register_script(TOKEN_BUCKET_LUA)
+        granted, wait = await self._script(keys=[key], args=[limit, limit / 60, wanted])
+        return int(granted), float(wait)
+
+    async def hit(self, key: str, limit: int) -> float:
+        """Spend one token; returns 0 when allowed, else seconds until a retry can succeed"""
+        now = time.monotonic()
+        entry = self._local.get(key)
+        if entry is not None:
+            if entry[0] > 0 and entry[1] > now:
+                entry[0] -= 1
+                return 0
+            if entry[2] > now:
+                return entry[2] - now
+
+        try:
+            granted, wait = await self._take(key, limit, self._lease_size(limit))
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+            return 0
+
+        now = time.monotonic()
+        if granted:
+            self._remember(key, [granted - 1, now + settings.RATE_LIMIT_LOCAL_TTL, 0])
+            return 0
+        self._remember(key, [0, 0, now + wait])
+        return wait
+
+    def _remember(self, key: str, entry: list):
+        self._local[key] = entry
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    def clear(self):
+        self._local.clear()
+
+limiter = TokenBucketLimiter()
+
+def client_identity(request: Request) -> str:
+    """The user from the bearer token (no database lookup), else the client address"""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = decode_token_cached(token)
+        if payload and payload.get("sub"):
+            return f"user:{payload['sub']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+class RateLimit:
+    """Dependency limiting a route to its class's requests per minute, per user"""
+
+    def __init__(self, route_class: str):
+        if route_class not in ROUTE_CLASSES:
+            raise ValueError(f"Unknown route class {route_class}")
+        self.route_class = route_class
+
+    async def __call__(self, request: Request):
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        limit = limit_for(self.route_class)
+        retry_after = await limiter.hit(f"ratelimit:{self.route_class}:{client_identity(request)}", limit)
+        if retry_after:
+            RATE_LIMITED.labels(self.route_class).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded: {limit} {self.route_class} requests per minute",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
@@ -1,8 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
 from typing import Optional
 from jose import JWTError, jwt
+import asyncio
+import time
 import bcrypt
 from app.config import settings
+from app.core.cache import LocalTTLCache
+from app.core.metrics import PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_SECONDS
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify password using bcrypt"""
@@ -12,16 +18,66 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     )
 
 def get_password_hash(password: str) -> str:
-    """Hash password using bcrypt"""
+    """Hash password using bcrypt at BCRYPT_ROUNDS"""
     # Ensure password is within bcrypt's 72 byte limit
     password_bytes = password.encode('utf-8')
     if len(password_bytes) > 72:
         password_bytes = password_bytes[:72]
     
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made with a different cost than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+# bcrypt releases the GIL, so a few threads hash in parallel while the event
+# loop keeps serving; the pool is small so a login storm can't starve the CPU
+password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+# Jobs submitted and not finished; only touched on the event loop
+_password_jobs = 0
+
+class PasswordHasherBusy(Exception):
+    """More password hashes are queued than PASSWORD_HASH_MAX_QUEUE"""
+
+def _password_queue_depth() -> int:
+    return max(0, _password_jobs - settings.PASSWORD_HASH_WORKERS)
+
+def _timed(operation: str, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - start)
+
+async def _run_password_job(operation: str, func, *args):
+    global _password_jobs
+    if _password_queue_depth() >= settings.PASSWORD_HASH_MAX_QUEUE:
+        raise PasswordHasherBusy()
+    _password_jobs += 1
+    PASSWORD_HASH_QUEUE_DEPTH.set(_password_queue_depth())
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(password_executor, partial(_timed, operation, func, *args))
+    finally:
+        _password_jobs -= 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(_password_queue_depth())
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password hashing pool"""
+    return await _run_password_job("verify", verify_password, plain_password, hashed_password)
+
+async def aget_password_hash(password: str) -> str:
+    """get_password_hash on the password hashing pool"""
+    return await _run_password_job("hash", get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -47,6 +103,20 @@ def decode_token(token: str) -> dict:
     except JWTError:
         return None
 
+_decoded_tokens = LocalTTLCache(maxsize=settings.USER_CACHE_LOCAL_SIZE, ttl=60)
+
+def decode_token_cached(token: str) -> dict:
+    """decode_token with a short in-process cache, bounded by the token's own expiry"""
+    payload = _decoded_tokens.get(token)
+    if payload is None:
+        payload = decode_token(token)
+        if payload is None:
+            return None
+        ttl = min(_decoded_tokens.ttl, payload.get("exp", 0) - time.time())
+        if ttl > 0:
+            _decoded_tokens.set(token, payload, ttl=ttl)
+    return payload
+
 def generate_transaction_id() -> str:
     """Generate unique transaction ID like UPI"""
     import secrets
@@ -1,16 +1,143 @@
+"""
+Database engines and sessions.
+
+Engines are created on first use, so a process only opens the pool it needs:
+the API uses the async engine (sized by DATABASE_POOL_SIZE), Celery workers
+the sync engine (sized by WORKER_DATABASE_POOL_SIZE - a prefork child runs one
+task at a time, so a couple of connections is plenty). Peak Postgres
+connections are therefore roughly
+
+    api_processes * (DATABASE_POOL_SIZE + DATABASE_MAX_OVERFLOW)
+    + worker_processes * (WORKER_DATABASE_POOL_SIZE + WORKER_DATABASE_MAX_OVERFLOW)
+
+``pool_status()`` reports checked-out connections, overflow and checkout wait
+time per pool for sizing that deliberately. With DATABASE_PGBOUNCER set the
+engines work behind PgBouncer in transaction mode: no prepared statement
+cache, and uniquely named statements.
+"""
+import threading
+import time
+import uuid
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.config import settings
 
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    echo=settings.DEBUG,
-)
+# Create sync URL from async URL
+SYNC_DATABASE_URL = settings.DATABASE_URL.replace("+asyncpg", "")
+
+class PoolStats:
+    """Checkout wait times and timeouts of one pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+            if timed_out:
+                self.timeouts += 1
+
+# Keyed by pool name; survives the pool being recreated on dispose()
+_pool_stats: dict[str, PoolStats] = {}
+
+class _TimedPool:
+    """Pool mixin timing how long each checkout waits for a connection"""
+
+    def _do_get(self):
+        stats = _pool_stats.setdefault(self._orig_logging_name, PoolStats())
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeout:
+            stats.observe(time.perf_counter() - start, timed_out=True)
+            raise
+        stats.observe(time.perf_counter() - start)
+        return conn
+
+class TimedAsyncPool(_TimedPool, AsyncAdaptedQueuePool):
+    pass
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
 
-AsyncSessionLocal = sessionmaker(
-    engine,
+def _pool_args(name: str, pool_size: int, max_overflow: int) -> dict:
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+        # Reuse the most recent connection so surplus ones idle out
+        "pool_use_lifo": True,
+        "pool_logging_name": name,
+        "echo": settings.DATABASE_ECHO,
+    }
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _engine(name: str, build):
+    engine = _engines.get(name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(name)
+            if engine is None:
+                engine = _engines[name] = build()
+    return engine
+
+def get_engine():
+    """The async engine used by the API, created on first use"""
+    def build():
+        url = make_url(settings.DATABASE_URL)
+        connect_args = {}
+        if settings.DATABASE_PGBOUNCER:
+            url = url.update_query_dict({"prepared_statement_cache_size": "0"})
+            connect_args = {
+                "statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return create_async_engine(
+            url,
+            poolclass=TimedAsyncPool,
+            connect_args=connect_args,
+            **_pool_args("api", settings.DATABASE_POOL_SIZE, settings.DATABASE_MAX_OVERFLOW)
+        )
+    return _engine("api", build)
+
+def get_sync_engine():
+    """The sync engine used by Celery tasks, created on first use"""
+    # psycopg2 never prepares statements server-side, so it needs nothing for PgBouncer
+    return _engine("worker", lambda: create_engine(
+        SYNC_DATABASE_URL,
+        poolclass=TimedQueuePool,
+        **_pool_args("worker", settings.WORKER_DATABASE_POOL_SIZE, settings.WORKER_DATABASE_MAX_OVERFLOW)
+    ))
+
+class _LazySessionmaker:
+    """A sessionmaker whose engine is only created when the first session is"""
+
+    def __init__(self, get_bind, **kwargs):
+        self._get_bind = get_bind
+        self._kwargs = kwargs
+        self._factory = None
+
+    def __call__(self, **kwargs):
+        if self._factory is None:
+            self._factory = sessionmaker(self._get_bind(), **self._kwargs)
+        return self._factory(**kwargs)
+
+AsyncSessionLocal = _LazySessionmaker(
+    get_engine,
     class_=AsyncSession,
     expire_on_commit=False,
     autocommit=False,
@@ -18,25 +145,38 @@ AsyncSessionLocal = sessionmaker(
 )
 
 # Synchronous session for Celery tasks
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session
-
-# Create sync URL from async URL
-SYNC_DATABASE_URL = settings.DATABASE_URL.replace("+asyncpg", "")
-
-sync_engine = create_engine(
-    SYNC_DATABASE_URL,
-    pool_size=settings.DATABASE_POOL_SIZE,
-    max_overflow=settings.DATABASE_MAX_OVERFLOW,
-    echo=settings.DEBUG,
-)
-
-SessionLocal = sessionmaker(
+SessionLocal = _LazySessionmaker(
+    get_sync_engine,
     autocommit=False,
     autoflush=False,
-    bind=sync_engine
 )
 
+def pool_status() -> dict:
+    """Connection counts and checkout waits of every pool this process has opened"""
+    status = {}
+    for name, engine in list(_engines.items()):
+        pool = engine.pool
+        stats = _pool_stats.get(name) or PoolStats()
+        status[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": stats.checkouts,
+            "wait_seconds_total": round(stats.wait_seconds, 6),
+            "wait_seconds_max": round(stats.max_wait_seconds, 6),
+            "timeouts": stats.timeouts,
+        }
+    return status
+
+async def dispose_engines():
+    """Close every pooled connection"""
+    for name, engine in list(_engines.items()):
+        if name == "api":
+            await engine.dispose()
+        else:
+            engine.dispose()
+
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
@@ -1,16 +1,18 @@
-from fastapi import FastAPI, Request, status
+from fastapi import Depends, FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 from fastapi.exceptions import RequestValidationError
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 import sentry_sdk
 import logging
 from app.config import settings
 from app.api.v1 import auth, users, folders, files, shares, search
-from app.core.monitoring import setup_logging, PerformanceMiddleware
+from app.core.monitoring import setup_logging, PerformanceMiddleware, register_route_templates
+from app.core.metrics import render_metrics
+from app.core.rate_limit import RateLimit
+from app.core.security import PasswordHasherBusy
+from app.db.session import get_engine, dispose_engines, pool_status
 
 # Setup logging
 setup_logging()
@@ -24,9 +26,6 @@ if settings.SENTRY_DSN:
         traces_sample_rate=1.0 if settings.ENVIRONMENT == "development" else 0.1,
     )
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
@@ -39,25 +38,21 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
-    from sqlalchemy.ext.asyncio import create_async_engine
     from app.db.base import Base
-    from app.models import user, folder, file, share
+    from app.models import user, folder, file, share, upload, blob, outbox
     
     logger.info("Initializing database...")
-    engine = create_async_engine(settings.DATABASE_URL)
-    
     try:
-        async with engine.begin() as conn:
+        # The app's own engine - no throwaway pool just for create_all
+        async with get_engine().begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
-    finally:
-        await engine.dispose()
 
-# Add rate limiter
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+@app.on_event("shutdown")
+async def shutdown_event():
+    await dispose_engines()
 
 # Global exception handlers
 @app.exception_handler(RequestValidationError)
@@ -67,6 +62,14 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors(), "body": exc.body}
     )
 
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many sign-in attempts in progress, try again shortly"},
+        headers={"Retry-After": "1"}
+    )
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Global exception: {str(exc)}", exc_info=True)
@@ -82,6 +85,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Security Middleware
@@ -100,6 +104,15 @@ async def health_check():
         "environment": settings.ENVIRONMENT
     }
 
+@app.get("/health/db")
+async def db_pool_health():
+    """Connection pool usage of this process"""
+    return {"pools": pool_status()}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(await render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -110,12 +123,17 @@ async def root():
     }
 
 # Include routers
-app.include_router(auth.router, prefix=f"{settings.API_V1_PREFIX}/auth", tags=["Authentication"])
-app.include_router(users.router, prefix=f"{settings.API_V1_PREFIX}/users", tags=["Users"])
-app.include_router(folders.router, prefix=f"{settings.API_V1_PREFIX}/folders", tags=["Folders"])
-app.include_router(files.router, prefix=f"{settings.API_V1_PREFIX}/files", tags=["Files"])
-app.include_router(shares.router, prefix=f"{settings.API_V1_PREFIX}/shares", tags=["Shares/Transactions"])
-app.include_router(search.router, prefix=f"{settings.API_V1_PREFIX}/search", tags=["Search"])
+for router, name, tags, dependencies in (
+    (auth.router, "auth", ["Authentication"], [Depends(RateLimit("auth"))]),
+    (users.router, "users", ["Users"], []),
+    (folders.router, "folders", ["Folders"], []),
+    (files.router, "files", ["Files"], []),
+    (shares.router, "shares", ["Shares/Transactions"], []),
+    (search.router, "search", ["Search"], [Depends(RateLimit("search"))]),
+):
+    prefix = f"{settings.API_V1_PREFIX}/{name}"
+    app.include_router(router, prefix=prefix, tags=tags, dependencies=dependencies)
+    register_route_templates(router, prefix)
 
 if __name__ == "__main__":
     import uvicorn
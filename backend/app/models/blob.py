@@ -0,0 +1,20 @@
+from sqlalchemy import Column, String, Integer, BigInteger, Text, Index, text
+from app.db.base import Base, TimestampMixin
+
+class Blob(Base, TimestampMixin):
+    """Content-addressed storage object shared by every file with the same bytes"""
+    __tablename__ = "blobs"
+    __table_args__ = (
+        Index("ix_blobs_unreferenced", "updated_at", postgresql_where=text("ref_count <= 0")),
+    )
+    
+    sha256 = Column(String(64), primary_key=True)
+    size_bytes = Column(BigInteger, nullable=False)
+    mime_type = Column(String(100))
+    
+    # Storage
+    storage_key = Column(Text, nullable=False)
+    storage_bucket = Column(String(255), nullable=False)
+    
+    # Number of File rows pointing at this blob
+    ref_count = Column(Integer, default=0, nullable=False)
@@ -1,11 +1,46 @@
-from sqlalchemy import Column, String, Boolean, Integer, BigInteger, ForeignKey, Text, DateTime, ARRAY
-from sqlalchemy.dialects.postgresql import UUID, JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, Boolean, Integer, BigInteger, ForeignKey, Text, DateTime, ARRAY, Index, Computed, DDL, event, text
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 import uuid
 from app.db.base import Base, TimestampMixin
 
+# Text search configuration used for both the stored vector and queries
+SEARCH_CONFIG = "english"
+
+# Filenames are split on punctuation so "invoice_2024.pdf" matches "invoice";
+# OCR text is capped to stay well inside the tsvector size limit
+SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, "
+    "regexp_replace(coalesce(filename, ''), '[[:punct:]]+', ' ', 'g')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, coalesce(description, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}'::regconfig, left(coalesce(ocr_text, ''), 200000)), 'C')"
+)
+
 class File(Base, TimestampMixin):
     __tablename__ = "files"
+    __table_args__ = (
+        # Keyset pagination of a user's live files (created_at DESC, id DESC)
+        Index("ix_files_owner_created", "owner_user_id", "created_at", "id", postgresql_where=text("deleted_at IS NULL")),
+        # A user's trash (deleted_at DESC, id DESC) and the purge sweep over (deleted_at, id)
+        Index("ix_files_owner_deleted", "owner_user_id", "deleted_at", "id", postgresql_where=text("deleted_at IS NOT NULL")),
+        Index("ix_files_deleted", "deleted_at", "id", postgresql_where=text("deleted_at IS NOT NULL")),
+        # Folder listings / counts and the folder_id ON DELETE SET NULL
+        Index("ix_files_folder_created", "folder_id", "created_at", "id"),
+        # download_proxy looks files up by storage key
+        Index("ix_files_storage_key", "storage_key"),
+        # Search: per-owner GIN indexes (btree_gin) over the text vector and filename trigrams
+        Index(
+            "ix_files_search", "owner_user_id", "search_vector",
+            postgresql_using="gin",
+            postgresql_where=text("deleted_at IS NULL")
+        ),
+        Index(
+            "ix_files_filename_trgm", "owner_user_id", "filename",
+            postgresql_using="gin",
+            postgresql_ops={"filename": "gin_trgm_ops"},
+            postgresql_where=text("deleted_at IS NULL")
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     owner_user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -38,6 +73,7 @@ class File(Base, TimestampMixin):
     # OCR & Metadata
     ocr_text = Column(Text)
     ocr_completed = Column(Boolean, default=False)
+    search_vector = deferred(Column(TSVECTOR, Computed(SEARCH_VECTOR_SQL, persisted=True)))
     extracted_metadata = Column(JSONB, default={})
     thumbnail_url = Column(Text)
     preview_urls = Column(JSONB, default={})
@@ -56,3 +92,89 @@ class File(Base, TimestampMixin):
     folder = relationship("Folder", back_populates="files")
     shares = relationship("Share", back_populates="file", cascade="all, delete-orphan")
     versions = relationship("File", backref="parent_version", remote_side=[id])
+
+# The search indexes need these extensions when tables are created with create_all
+for extension in ("pg_trgm", "btree_gin"):
+    event.listen(
+        File.__table__,
+        "before_create",
+        DDL(f"CREATE EXTENSION IF NOT EXISTS {extension}").execute_if(dialect="postgresql")
+    )
+
+# Folder file_count / total_bytes cover the live, fully uploaded files in a
+# folder and are maintained by triggers on files, so every write path -
+# uploads, share delivery CTEs, bulk inserts, moves, soft and hard deletes -
+# keeps them exact. Inserts and deletes are counted once per statement from
+# the transition table; updates only fire when a file changes folder, size,
+# deleted state or finishes uploading.
+FOLDER_COUNT_DDL = (
+    """
+    CREATE OR REPLACE FUNCTION folders_count_files_stmt() RETURNS trigger AS $$
+    DECLARE
+        direction integer := CASE TG_OP WHEN 'INSERT' THEN 1 ELSE -1 END;
+    BEGIN
+        -- Lock in id order so concurrent multi-folder statements can't deadlock
+        PERFORM 1 FROM folders
+        WHERE id IN (
+            SELECT folder_id FROM changed_files
+            WHERE deleted_at IS NULL AND status IS DISTINCT FROM 'uploading'
+        )
+        ORDER BY id
+        FOR UPDATE;
+
+        UPDATE folders f
+        SET file_count = f.file_count + direction * d.n,
+            total_bytes = f.total_bytes + direction * d.bytes
+        FROM (
+            SELECT folder_id, count(*) AS n, sum(size_bytes) AS bytes
+            FROM changed_files
+            WHERE folder_id IS NOT NULL AND deleted_at IS NULL AND status IS DISTINCT FROM 'uploading'
+            GROUP BY folder_id
+        ) d
+        WHERE f.id = d.folder_id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION folders_count_files_row() RETURNS trigger AS $$
+    BEGIN
+        IF OLD.folder_id IS NOT NULL AND OLD.deleted_at IS NULL AND OLD.status IS DISTINCT FROM 'uploading' THEN
+            UPDATE folders
+            SET file_count = file_count - 1, total_bytes = total_bytes - OLD.size_bytes
+            WHERE id = OLD.folder_id;
+        END IF;
+        IF NEW.folder_id IS NOT NULL AND NEW.deleted_at IS NULL AND NEW.status IS DISTINCT FROM 'uploading' THEN
+            UPDATE folders
+            SET file_count = file_count + 1, total_bytes = total_bytes + NEW.size_bytes
+            WHERE id = NEW.folder_id;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER files_folder_counts_insert AFTER INSERT ON files
+    REFERENCING NEW TABLE AS changed_files
+    FOR EACH STATEMENT EXECUTE FUNCTION folders_count_files_stmt()
+    """,
+    """
+    CREATE TRIGGER files_folder_counts_delete AFTER DELETE ON files
+    REFERENCING OLD TABLE AS changed_files
+    FOR EACH STATEMENT EXECUTE FUNCTION folders_count_files_stmt()
+    """,
+    """
+    CREATE TRIGGER files_folder_counts_update AFTER UPDATE OF folder_id, deleted_at, size_bytes, status ON files
+    FOR EACH ROW
+    WHEN (
+        OLD.folder_id IS DISTINCT FROM NEW.folder_id
+        OR OLD.deleted_at IS DISTINCT FROM NEW.deleted_at
+        OR OLD.size_bytes IS DISTINCT FROM NEW.size_bytes
+        OR (OLD.status = 'uploading') IS DISTINCT FROM (NEW.status = 'uploading')
+    )
+    EXECUTE FUNCTION folders_count_files_row()
+    """,
+)
+
+for statement in FOLDER_COUNT_DDL:
+    event.listen(File.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
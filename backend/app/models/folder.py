@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, Text
+from sqlalchemy import Column, String, Boolean, Integer, BigInteger, ForeignKey, Text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 import uuid
@@ -6,6 +6,12 @@ from app.db.base import Base, TimestampMixin
 
 class Folder(Base, TimestampMixin):
     __tablename__ = "folders"
+    __table_args__ = (
+        # One folder per name per owner - share delivery upserts on this key
+        Index("uq_folders_owner_name", "owner_user_id", "name", unique=True),
+        # Subfolder lookups and the parent_folder_id ON DELETE CASCADE
+        Index("ix_folders_parent", "parent_folder_id"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     owner_user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -23,6 +29,10 @@ class Folder(Base, TimestampMixin):
     auto_categorize = Column(Boolean, default=True)
     position = Column(Integer, default=0)
     
+    # Live, fully uploaded files directly in this folder - kept current by triggers on files
+    file_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_bytes = Column(BigInteger, nullable=False, default=0, server_default="0")
+    
     # Relationships
     owner = relationship("User", back_populates="folders")
     files = relationship("File", back_populates="folder", cascade="all, delete-orphan")
@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Text, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime
+from app.db.base import Base
+
+class OutboxMessage(Base):
+    """A Celery task committed with the transaction that asked for it, waiting to be published"""
+    __tablename__ = "outbox"
+    __table_args__ = (
+        Index("ix_outbox_available", "available_at", "id"),
+    )
+    
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    task_name = Column(String(255), nullable=False)
+    args = Column(JSONB, nullable=False, default=list)
+    
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    # Pushed back after a failed publish
+    available_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text)
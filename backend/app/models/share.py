@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, DateTime
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, DateTime, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 import uuid
@@ -7,6 +7,16 @@ from app.db.base import Base, TimestampMixin
 class Share(Base, TimestampMixin):
     """Transaction model - like UPI transactions for files"""
     __tablename__ = "shares"
+    __table_args__ = (
+        # Keyset pagination of sent / received transactions
+        Index("ix_shares_sender_created", "sender_user_id", "created_at", "id"),
+        Index("ix_shares_recipient_created", "recipient_user_id", "created_at", "id"),
+        # Shares still waiting for an account with this email or phone
+        Index("ix_shares_pending_email", "recipient_email", postgresql_where=text("recipient_user_id IS NULL")),
+        Index("ix_shares_pending_phone", "recipient_phone", postgresql_where=text("recipient_user_id IS NULL")),
+        # files.id ON DELETE CASCADE
+        Index("ix_shares_file_id", "file_id"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     
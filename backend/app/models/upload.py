@@ -0,0 +1,22 @@
+from sqlalchemy import Column, String, Integer, BigInteger, ForeignKey, Text, DateTime
+from sqlalchemy.dialects.postgresql import UUID
+import uuid
+from app.db.base import Base, TimestampMixin
+
+class UploadSession(Base, TimestampMixin):
+    """Resumable multipart upload in progress"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    file_id = Column(UUID(as_uuid=True), ForeignKey("files.id", ondelete="CASCADE"), nullable=False, unique=True)
+    owner_user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    
+    # Storage multipart upload
+    storage_key = Column(Text, nullable=False)
+    upload_id = Column(Text, nullable=False)
+    part_size = Column(BigInteger, nullable=False)
+    part_count = Column(Integer, nullable=False)
+    
+    # Lifecycle
+    status = Column(String(50), default="active")  # active, completed, aborted
+    expires_at = Column(DateTime, nullable=False, index=True)
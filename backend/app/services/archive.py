@@ -0,0 +1,221 @@
+"""
+ZIP archives of many files, streamed straight from storage.
+
+The archive is written entry by entry as the response is sent - nothing is
+staged on disk and memory stays bounded by the prefetch window: while one
+entry streams, the next ``ARCHIVE_PREFETCH_FILES`` objects are already being
+fetched, each holding at most ``ARCHIVE_PREFETCH_CHUNKS`` chunks. Entries are
+always ZIP64 so multi-gigabyte files and archives work. Formats that are
+already compressed (photos, video, audio, archives, PDFs) are stored as-is
+rather than deflated, and ``compression="store"`` stores everything.
+"""
+import asyncio
+import logging
+import zipfile
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator
+from sqlalchemy import select, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.file import File
+from app.models.folder import Folder
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_MODES = ("auto", "store")
+
+# Deflating these costs CPU and saves next to nothing
+STORED_PREFIXES = ("image/", "video/", "audio/", "application/vnd.openxmlformats-officedocument.")
+STORED_TYPES = {
+    "application/pdf",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-7z-compressed",
+    "application/vnd.rar",
+    "application/x-rar-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zstd",
+    "application/epub+zip",
+}
+# ...except for the uncompressed media formats
+DEFLATED_TYPES = {"image/svg+xml", "image/bmp", "image/x-ms-bmp", "image/tiff", "audio/wav", "audio/x-wav"}
+
+def should_store(mime_type: str) -> bool:
+    mime_type = (mime_type or "").lower()
+    if mime_type in DEFLATED_TYPES:
+        return False
+    return mime_type in STORED_TYPES or mime_type.startswith(STORED_PREFIXES)
+
+def _safe_name(name: str) -> str:
+    name = name.replace("/", "_").replace("\\", "_").strip()
+    return "_" if name in ("", ".", "..") else name
+
+class _Sink:
+    """Unseekable write target for ZipFile; drain() hands back what was written since the last call"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _zip_info(entry: dict, store: bool) -> zipfile.ZipInfo:
+    modified = max(entry["modified"] or datetime.utcnow(), datetime(1980, 1, 1))
+    info = zipfile.ZipInfo(entry["name"], date_time=modified.timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED if store else zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    return info
+
+async def _prefetch(storage, key: str, queue: asyncio.Queue):
+    try:
+        async with aclosing(storage.aiter_range(key)) as chunks:
+            async for chunk in chunks:
+                await queue.put(chunk)
+    except Exception as e:
+        await queue.put(e)
+    else:
+        await queue.put(None)
+
+async def stream_archive(storage, entries: list[dict], compression: str = "auto") -> AsyncIterator[bytes]:
+    """
+    Yield a ZIP64 archive of ``entries`` - dicts of name, storage_key, size,
+    mime_type and modified - reading each object from ``storage``.
+    """
+    prefetch_files = max(settings.ARCHIVE_PREFETCH_FILES, 0)
+    queues = [asyncio.Queue(maxsize=settings.ARCHIVE_PREFETCH_CHUNKS) for _ in entries]
+    fetches = []
+
+    def fetch_ahead(index: int):
+        # Keep the current entry and the next few downloading
+        while len(fetches) < min(index + 1 + prefetch_files, len(entries)):
+            i = len(fetches)
+            fetches.append(asyncio.create_task(_prefetch(storage, entries[i]["storage_key"], queues[i])))
+
+    sink = _Sink()
+    try:
+        with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+            for index, entry in enumerate(entries):
+                fetch_ahead(index)
+                store = compression == "store" or should_store(entry["mime_type"])
+
+                with archive.open(_zip_info(entry, store), "w", force_zip64=True) as out:
+                    while True:
+                        chunk = await queues[index].get()
+                        if chunk is None:
+                            break
+                        if isinstance(chunk, Exception):
+                            logger.error(f"Archive entry {entry['storage_key']} failed: {chunk}")
+                            raise chunk
+                        if store:
+                            out.write(chunk)
+                        else:
+                            # Deflate off the event loop
+                            await asyncio.to_thread(out.write, chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+                queues[index] = None
+
+                data = sink.drain()
+                if data:
+                    yield data
+
+        data = sink.drain()
+        if data:
+            yield data
+    finally:
+        for fetch in fetches:
+            fetch.cancel()
+
+# Entry lists
+
+_entry_columns = (
+    File.original_filename,
+    File.storage_key,
+    File.size_bytes,
+    File.mime_type,
+    File.created_at,
+    File.folder_id,
+)
+
+def _live_files(user_id):
+    return select(*_entry_columns).where(
+        File.owner_user_id == user_id,
+        File.deleted_at.is_(None),
+        File.status != "uploading"
+    )
+
+def _entries(rows, paths: dict = None) -> list[dict]:
+    """Archive entries for file rows, with "name (2).ext" for clashing names"""
+    entries = []
+    seen = set()
+    for row in rows:
+        prefix = paths.get(row.folder_id, "") if paths else ""
+        stem, dot, ext = _safe_name(row.original_filename).rpartition(".")
+        if not stem:
+            stem, dot, ext = ext, "", ""
+        name = f"{prefix}{stem}{dot}{ext}"
+        n = 2
+        while name.lower() in seen:
+            name = f"{prefix}{stem} ({n}){dot}{ext}"
+            n += 1
+        seen.add(name.lower())
+        entries.append({
+            "name": name,
+            "storage_key": row.storage_key,
+            "size": row.size_bytes,
+            "mime_type": row.mime_type,
+            "modified": row.created_at,
+        })
+    return entries
+
+async def file_archive_entries(db: AsyncSession, user_id, file_ids: list) -> list[dict]:
+    """Entries for the caller's live files among file_ids, flat, in request order"""
+    result = await db.execute(_live_files(user_id).add_columns(File.id).where(File.id.in_(file_ids)))
+    rows = {str(row.id): row for row in result.all()}
+    return _entries([rows[file_id] for file_id in dict.fromkeys(map(str, file_ids)) if file_id in rows])
+
+async def folder_archive_entries(db: AsyncSession, user_id, folder_id) -> tuple[str, list[dict]] | None:
+    """
+    The folder's name and entries for everything in it and its subfolders,
+    laid out by subfolder. None when the folder isn't the user's.
+    """
+    subtree = select(
+        Folder.id, Folder.parent_folder_id, Folder.name, literal(0).label("depth")
+    ).where(
+        Folder.id == folder_id,
+        Folder.owner_user_id == user_id
+    ).cte("subtree", recursive=True)
+    subtree = subtree.union_all(
+        select(
+            Folder.id, Folder.parent_folder_id, Folder.name, (subtree.c.depth + 1).label("depth")
+        ).join(subtree, Folder.parent_folder_id == subtree.c.id)
+    )
+    result = await db.execute(select(subtree).order_by(subtree.c.depth))
+    folders = result.all()
+    if not folders:
+        return None
+
+    # Parents come first, so each path extends its parent's
+    paths = {folders[0].id: ""}
+    for row in folders[1:]:
+        paths[row.id] = f"{paths[row.parent_folder_id]}{_safe_name(row.name)}/"
+
+    result = await db.execute(
+        _live_files(user_id)
+        .where(File.folder_id.in_(list(paths)))
+        .order_by(File.folder_id, File.original_filename)
+    )
+    return folders[0].name, _entries(result.all(), paths)
@@ -0,0 +1,122 @@
+"""
+Content-addressed blob bookkeeping.
+
+Every stored object is identified by the SHA-256 of its bytes. File rows
+point at a blob through ``checksum_sha256`` and each blob counts the File
+rows referencing it, so identical uploads share one object in storage and
+the object is only garbage-collected once nothing points at it.
+"""
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import update, bindparam, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.blob import Blob
+from app.config import settings
+
+def _acquire_stmt(sha256: str, size_bytes: int, storage_key: str, mime_type: str = None, refs: int = 1):
+    now = datetime.utcnow()
+    stmt = pg_insert(Blob).values(
+        sha256=sha256,
+        size_bytes=size_bytes,
+        mime_type=mime_type,
+        storage_key=storage_key,
+        storage_bucket=settings.B2_BUCKET_NAME,
+        ref_count=refs,
+        created_at=now,
+        updated_at=now
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Blob.sha256],
+        set_={
+            "ref_count": Blob.ref_count + stmt.excluded.ref_count,
+            "updated_at": now
+        }
+    ).returning(
+        Blob.storage_key,
+        # xmax is only zero on rows this statement inserted
+        literal_column("(xmax = 0)").label("created")
+    )
+
+def _claim_stmt(sha256: str, size_bytes: int, refs: int = 1):
+    return (
+        update(Blob)
+        .where(Blob.sha256 == sha256, Blob.size_bytes == size_bytes)
+        .values(ref_count=Blob.ref_count + refs)
+        .returning(Blob.storage_key)
+    )
+
+def _ref_params(checksums) -> list:
+    counts = Counter(c for c in checksums if c and c != "pending")
+    return [{"b_sha256": sha, "b_count": n} for sha, n in counts.items()]
+
+_release_stmt = (
+    update(Blob.__table__)
+    .where(Blob.__table__.c.sha256 == bindparam("b_sha256"))
+    .values(ref_count=Blob.__table__.c.ref_count - bindparam("b_count"))
+)
+
+_add_stmt = (
+    update(Blob.__table__)
+    .where(Blob.__table__.c.sha256 == bindparam("b_sha256"))
+    .values(ref_count=Blob.__table__.c.ref_count + bindparam("b_count"))
+)
+
+async def acquire_blob(
+    db: AsyncSession,
+    sha256: str,
+    size_bytes: int,
+    storage_key: str,
+    mime_type: str = None
+) -> tuple[str, bool]:
+    """
+    Register one more reference to the blob with this checksum.
+
+    Returns (canonical storage key, created). When ``created`` is False the
+    bytes already existed under another key and the caller's freshly uploaded
+    object is a duplicate it should delete.
+    """
+    result = await db.execute(_acquire_stmt(sha256, size_bytes, storage_key, mime_type))
+    row = result.one()
+    return row.storage_key, row.created
+
+async def claim_blob(db: AsyncSession, sha256: str, size_bytes: int, refs: int = 1) -> str | None:
+    """
+    Take references on an existing blob without moving any bytes.
+
+    Returns its storage key, or None when no blob with this checksum and size
+    exists (or it was garbage-collected in the meantime).
+    """
+    result = await db.execute(_claim_stmt(sha256, size_bytes, refs))
+    return result.scalar_one_or_none()
+
+async def add_blob_refs(db: AsyncSession, sha256: str, refs: int = 1):
+    """Count additional File rows pointing at an existing blob"""
+    await db.execute(
+        update(Blob)
+        .where(Blob.sha256 == sha256)
+        .values(ref_count=Blob.ref_count + refs)
+    )
+
+async def add_blob_refs_many(db: AsyncSession, checksums):
+    """Add one reference per checksum, e.g. for File rows bulk-copied onto existing blobs"""
+    params = _ref_params(checksums)
+    if params:
+        await db.execute(_add_stmt, params)
+
+async def release_blob_refs(db: AsyncSession, checksums):
+    """Drop one reference per checksum, e.g. for File rows being hard-deleted"""
+    params = _ref_params(checksums)
+    if params:
+        await db.execute(_release_stmt, params)
+
+def acquire_blob_sync(db, sha256: str, size_bytes: int, storage_key: str, mime_type: str = None) -> tuple[str, bool]:
+    """Synchronous acquire_blob for Celery tasks"""
+    row = db.execute(_acquire_stmt(sha256, size_bytes, storage_key, mime_type)).one()
+    return row.storage_key, row.created
+
+def release_blob_refs_sync(db, checksums):
+    """Synchronous release_blob_refs for Celery tasks"""
+    params = _ref_params(checksums)
+    if params:
+        db.execute(_release_stmt, params)
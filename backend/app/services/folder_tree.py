@@ -0,0 +1,83 @@
+"""
+A user's whole folder hierarchy in one query, cached in Redis.
+
+The tree is read with a single recursive CTE over ``parent_folder_id`` and
+carries the trigger-maintained ``file_count`` / ``total_bytes`` counters, so
+building it never touches ``files``. The cached copy is dropped after any
+commit that changes the user's folders or the files in them - call
+``invalidate_folder_tree`` from those write paths.
+"""
+from sqlalchemy import select, literal
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.core.cache import cache_get_json, cache_set_json, invalidate_on_commit
+from app.models.folder import Folder
+
+def _tree_key(user_id) -> str:
+    return f"folders:tree:{user_id}"
+
+def invalidate_folder_tree(db, *user_ids):
+    """Drop the cached tree of each user once the current transaction commits"""
+    invalidate_on_commit(db, *(_tree_key(user_id) for user_id in user_ids if user_id))
+
+def _tree_query(user_id):
+    columns = (
+        Folder.id,
+        Folder.parent_folder_id,
+        Folder.name,
+        Folder.description,
+        Folder.icon,
+        Folder.color,
+        Folder.position,
+        Folder.file_count,
+        Folder.total_bytes,
+    )
+    roots = select(
+        *columns,
+        literal(0).label("depth")
+    ).where(
+        Folder.owner_user_id == user_id,
+        Folder.parent_folder_id.is_(None)
+    ).cte("tree", recursive=True)
+
+    children = select(
+        *columns,
+        (roots.c.depth + 1).label("depth")
+    ).join(roots, Folder.parent_folder_id == roots.c.id)
+
+    tree = roots.union_all(children)
+    return select(tree).order_by(tree.c.depth, tree.c.position, tree.c.name)
+
+def _node(row) -> dict:
+    return {
+        "id": str(row.id),
+        "name": row.name,
+        "description": row.description,
+        "icon": row.icon,
+        "color": row.color,
+        "position": row.position,
+        "file_count": row.file_count,
+        "total_bytes": row.total_bytes,
+        "children": [],
+    }
+
+async def get_folder_tree(db: AsyncSession, user_id) -> list[dict]:
+    """Nested root folders of the user, each with its children, in position order"""
+    key = _tree_key(user_id)
+    tree = await cache_get_json(key)
+    if tree is not None:
+        return tree
+
+    result = await db.execute(_tree_query(user_id))
+    nodes = {}
+    tree = []
+    # Breadth-first order: every parent is seen before its children
+    for row in result.all():
+        node = nodes[row.id] = _node(row)
+        if row.parent_folder_id is None:
+            tree.append(node)
+        else:
+            nodes[row.parent_folder_id]["children"].append(node)
+
+    await cache_set_json(key, tree, ttl=settings.FOLDER_TREE_CACHE_TTL)
+    return tree
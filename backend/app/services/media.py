@@ -0,0 +1,175 @@
+"""
+Single-pass media processing.
+
+A file is read from local disk and decoded once; the rendition, OCR and
+metadata stages then all work from the same decoded image or PDF pages.
+OCR runs on a small thread pool while the other stages proceed, and every
+stage reports how long it took.
+"""
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import pytesseract
+from PIL import Image, features
+from pdf2image import convert_from_path, pdfinfo_from_path
+from app.config import settings
+from app.services.renditions import CONTENT_TYPES
+
+STAGES = ("renditions", "ocr", "metadata")
+
+ENCODE_OPTIONS = {
+    "avif": {"quality": 55},
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "optimize": True, "progressive": True},
+}
+
+def is_processable(mime_type: str) -> bool:
+    return mime_type.startswith("image/") or mime_type == "application/pdf"
+
+class MediaResult:
+    """What the pipeline produced, plus per-stage wall-clock timings in ms"""
+
+    def __init__(self):
+        self.renditions = []  # dicts with width, height, format, content_type, data
+        self.ocr_text = None
+        self.metadata = {}
+        self.timings = {}
+
+    @contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+def rendition_formats() -> list:
+    """Configured rendition formats this Pillow build can encode"""
+    return [fmt for fmt in settings.RENDITION_FORMATS if fmt == "jpeg" or features.check(fmt)]
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """RGB copy of image, compositing any transparency onto white"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+def _render_renditions(image: Image.Image) -> list:
+    """Every configured width and format, downscaling from the largest down"""
+    widths = sorted({min(w, image.width) for w in settings.RENDITION_WIDTHS}, reverse=True)
+    formats = rendition_formats()
+
+    # Works on new images, so OCR can keep reading the original
+    current = _flatten(image)
+    renditions = []
+    for width in widths:
+        height = max(1, round(current.height * width / current.width))
+        if width != current.width:
+            current = current.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            out = io.BytesIO()
+            current.save(out, format=fmt.upper(), **ENCODE_OPTIONS[fmt])
+            renditions.append({
+                "width": width,
+                "height": height,
+                "format": fmt,
+                "content_type": CONTENT_TYPES[fmt],
+                "data": out.getvalue(),
+            })
+    return renditions
+
+def _image_metadata(image: Image.Image) -> dict:
+    metadata = {
+        "width": image.width,
+        "height": image.height,
+        "format": image.format,
+        "mode": image.mode,
+    }
+    dpi = image.info.get("dpi")
+    if dpi:
+        metadata["dpi"] = [float(v) for v in dpi]
+    return metadata
+
+def _pdf_metadata(info: dict) -> dict:
+    metadata = {"pages": info.get("Pages")}
+    for key in ("Title", "Author", "Creator", "Producer", "Page size"):
+        if info.get(key):
+            metadata[key.lower().replace(" ", "_")] = info[key]
+    return metadata
+
+def _ocr_pdf_page(pdf_path: str, page_number: int) -> str:
+    """Rasterise and OCR one PDF page; only this page is held in memory"""
+    images = convert_from_path(
+        pdf_path,
+        dpi=settings.OCR_DPI,
+        first_page=page_number,
+        last_page=page_number,
+        grayscale=True
+    )
+    try:
+        return "".join(pytesseract.image_to_string(image) for image in images)
+    finally:
+        for image in images:
+            image.close()
+
+def process_image(path: str, stages=STAGES) -> MediaResult:
+    result = MediaResult()
+    with result.timed("decode"):
+        image = Image.open(path)
+        image.load()
+
+    with image, ThreadPoolExecutor(max_workers=1) as pool:
+        ocr = None
+        if "ocr" in stages:
+            started = time.perf_counter()
+            ocr = pool.submit(pytesseract.image_to_string, image)
+        if "metadata" in stages:
+            with result.timed("metadata"):
+                result.metadata = _image_metadata(image)
+        if "renditions" in stages:
+            with result.timed("renditions"):
+                result.renditions = _render_renditions(image)
+        if ocr:
+            result.ocr_text = ocr.result()
+            result.timings["ocr"] = round((time.perf_counter() - started) * 1000, 1)
+
+    return result
+
+def process_pdf(path: str, stages=STAGES) -> MediaResult:
+    result = MediaResult()
+    with result.timed("decode"):
+        info = pdfinfo_from_path(path)
+        # The first page feeds the renditions and OCR; later pages are only
+        # rasterised by OCR workers, one page per worker at a time
+        first_page = convert_from_path(path, dpi=settings.OCR_DPI, first_page=1, last_page=1)[0]
+    page_count = min(info["Pages"], settings.OCR_MAX_PAGES)
+
+    # pdftoppm and tesseract run as child processes, so threads are enough to
+    # keep several cores busy - and unlike a process pool they work inside
+    # Celery's daemonic prefork workers.
+    with first_page, ThreadPoolExecutor(max_workers=settings.OCR_PAGE_WORKERS) as pool:
+        pages = []
+        if "ocr" in stages:
+            started = time.perf_counter()
+            pages.append(pool.submit(pytesseract.image_to_string, first_page))
+            pages.extend(pool.submit(_ocr_pdf_page, path, n) for n in range(2, page_count + 1))
+        if "metadata" in stages:
+            with result.timed("metadata"):
+                result.metadata = _pdf_metadata(info)
+        if "renditions" in stages:
+            with result.timed("renditions"):
+                result.renditions = _render_renditions(first_page)
+        if pages:
+            result.ocr_text = "\n".join(page.result() for page in pages)
+            result.timings["ocr"] = round((time.perf_counter() - started) * 1000, 1)
+
+    return result
+
+def process_media(path: str, mime_type: str, stages=STAGES) -> MediaResult:
+    """Decode the file at path once and run the requested stages over it"""
+    if mime_type == "application/pdf":
+        return process_pdf(path, stages)
+    return process_image(path, stages)
@@ -0,0 +1,80 @@
+"""
+Transactional outbox for Celery tasks.
+
+Nothing on a request path talks to the broker: ``enqueue`` adds a row to the
+``outbox`` table inside the caller's transaction, so a task is sent exactly
+when the change that asked for it commits, and a broker outage can't lose it
+or hold up the response. The relay (``python -m app.workers.outbox_relay``)
+claims committed rows in id order with FOR UPDATE SKIP LOCKED, publishes them
+over one broker connection and deletes them in the same transaction - several
+relays can run side by side. Delivery is at least once: a relay that dies
+between publishing and committing sends that batch again, which the tasks
+tolerate (they check whether their work is already done).
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+from app.config import settings
+from app.core.metrics import OUTBOX_LAG_SECONDS, OUTBOX_PUBLISHED, OUTBOX_PUBLISH_ERRORS
+from app.models.outbox import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+class OutboxPublishError(Exception):
+    """The broker refused a batch; its unpublished messages were pushed back"""
+
+def enqueue(db, task_name: str, *args):
+    """Send Celery task task_name(*args) once db's current transaction commits"""
+    db.add(OutboxMessage(task_name=task_name, args=list(args)))
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(2 ** attempts, settings.OUTBOX_RETRY_MAX_SECONDS))
+
+def relay_batch_sync(db, publish, batch_size: int = 100) -> int:
+    """
+    Publish up to batch_size due messages through publish(task_name, args)
+    and delete them. Returns how many went; raises OutboxPublishError (after
+    committing what was sent) when the broker fails part way.
+    """
+    now = datetime.utcnow()
+    messages = db.execute(
+        select(OutboxMessage)
+        .where(OutboxMessage.available_at <= now)
+        .order_by(OutboxMessage.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not messages:
+        db.commit()
+        OUTBOX_LAG_SECONDS.set(0)
+        return 0
+    OUTBOX_LAG_SECONDS.set(max((now - message.created_at).total_seconds() for message in messages))
+    
+    sent = 0
+    error = None
+    try:
+        for message in messages:
+            publish(message.task_name, message.args)
+            sent += 1
+    except Exception as e:
+        error = e
+        OUTBOX_PUBLISH_ERRORS.inc()
+        for message in messages[sent:]:
+            message.attempts += 1
+            message.available_at = now + retry_delay(message.attempts)
+            message.last_error = str(e)[:1000]
+    
+    published = [(message.id, message.task_name) for message in messages[:sent]]
+    if published:
+        db.execute(
+            delete(OutboxMessage)
+            .where(OutboxMessage.id.in_([message_id for message_id, _ in published]))
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    for _, task_name in published:
+        OUTBOX_PUBLISHED.labels(task_name).inc()
+    
+    if error is not None:
+        raise OutboxPublishError(f"Published {sent} of {len(messages)} outbox messages: {error}") from error
+    return sent
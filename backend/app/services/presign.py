@@ -0,0 +1,88 @@
+"""
+Lightweight SigV4 query-string presigning for GET requests.
+
+botocore's generate_presigned_url rebuilds a full request, runs its event
+hooks and re-derives the signing key for every call, which dominates the cost
+of listing pages that need one URL per row. This signer derives the signing
+key once per day/region and only does the two HMACs per URL that SigV4
+actually requires. The output is identical to botocore's for path-style
+S3-compatible endpoints.
+"""
+import hashlib
+import hmac
+from datetime import datetime
+from urllib.parse import quote, urlsplit
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+def _quote(value: str) -> str:
+    return quote(value, safe="-_.~")
+
+class SigV4Presigner:
+    def __init__(self, endpoint_url: str, bucket: str, access_key: str, secret_key: str, region: str):
+        parts = urlsplit(endpoint_url)
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.bucket = bucket
+        self.access_key = access_key or ""
+        self.secret_key = secret_key or ""
+        self.region = region
+        self._signing_keys = {}
+
+    def signing_key(self, datestamp: str) -> bytes:
+        """Derive (and memoise) the SigV4 signing key for one day"""
+        key = self._signing_keys.get(datestamp)
+        if key is None:
+            key = _hmac(("AWS4" + self.secret_key).encode("utf-8"), datestamp)
+            key = _hmac(key, self.region)
+            key = _hmac(key, "s3")
+            key = _hmac(key, "aws4_request")
+            # Only today's and yesterday's keys are ever needed
+            if len(self._signing_keys) > 4:
+                self._signing_keys.clear()
+            self._signing_keys[datestamp] = key
+        return key
+
+    def presign_get(self, storage_key: str, params: dict, signed_at: datetime, expires_in: int) -> str:
+        """Presign a GET for storage_key, valid for expires_in seconds from signed_at (UTC)"""
+        amz_date = signed_at.strftime("%Y%m%dT%H%M%SZ")
+        datestamp = amz_date[:8]
+        scope = f"{datestamp}/{self.region}/s3/aws4_request"
+
+        query = dict(params)
+        query.update({
+            "X-Amz-Algorithm": ALGORITHM,
+            "X-Amz-Credential": f"{self.access_key}/{scope}",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires_in),
+            "X-Amz-SignedHeaders": "host",
+        })
+        canonical_query = "&".join(
+            f"{_quote(k)}={_quote(v)}" for k, v in sorted(query.items())
+        )
+        path = "/" + quote(self.bucket, safe="") + "/" + quote(storage_key, safe="/~")
+
+        canonical_request = "\n".join([
+            "GET",
+            path,
+            canonical_query,
+            f"host:{self.host}\n",
+            "host",
+            "UNSIGNED-PAYLOAD",
+        ])
+        string_to_sign = "\n".join([
+            ALGORITHM,
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        signature = hmac.new(
+            self.signing_key(datestamp),
+            string_to_sign.encode("utf-8"),
+            hashlib.sha256
+        ).hexdigest()
+
+        return f"{self.scheme}://{self.host}{path}?{canonical_query}&X-Amz-Signature={signature}"
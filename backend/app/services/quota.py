@@ -0,0 +1,110 @@
+"""
+Storage quota accounting.
+
+``users.storage_used_bytes`` is the ledger: the total size of the user's
+live files that finished uploading (``status != 'uploading'`` and not
+deleted). It is only ever moved in place by SQL, never written back from a
+loaded object, so concurrent uploads can't lose each other's updates:
+
+* ``charge_storage`` adds bytes only if the result still fits the quota -
+  ``UPDATE ... WHERE used + n <= quota RETURNING`` - so parallel uploads from
+  one account can never overshoot it together.
+* ``release_storage`` gives bytes back when files go away.
+* ``adjust_storage_sync`` moves usage without the quota check, for
+  corrections that must always land.
+* ``reconcile_storage_sync`` recomputes the ledger from ``files`` for the
+  periodic ``reconcile_storage_usage`` task, repairing any drift.
+
+Charges belong in the same transaction as the file row they pay for.
+"""
+from datetime import datetime
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.user import User
+from app.models.file import File
+
+users = User.__table__
+
+def _charge_stmt(user_id, size_bytes: int):
+    return (
+        update(users)
+        .where(
+            users.c.id == user_id,
+            users.c.storage_used_bytes + size_bytes <= users.c.storage_quota_bytes
+        )
+        .values(
+            storage_used_bytes=users.c.storage_used_bytes + size_bytes,
+            updated_at=datetime.utcnow()
+        )
+        .returning(users.c.storage_used_bytes)
+    )
+
+def _adjust_stmt(user_id, delta: int):
+    return (
+        update(users)
+        .where(users.c.id == user_id)
+        .values(
+            storage_used_bytes=func.greatest(users.c.storage_used_bytes + delta, 0),
+            updated_at=datetime.utcnow()
+        )
+    )
+
+async def charge_storage(db: AsyncSession, user_id, size_bytes: int) -> bool:
+    """Add size_bytes to the user's usage if it fits their quota; False if it doesn't"""
+    result = await db.execute(_charge_stmt(user_id, size_bytes))
+    return result.first() is not None
+
+async def release_storage(db: AsyncSession, user_id, size_bytes: int):
+    """Give size_bytes back to the user, never going below zero"""
+    if size_bytes:
+        await db.execute(_adjust_stmt(user_id, -size_bytes))
+
+def charge_storage_sync(db, user_id, size_bytes: int) -> bool:
+    """Synchronous charge_storage for Celery tasks"""
+    return db.execute(_charge_stmt(user_id, size_bytes)).first() is not None
+
+def adjust_storage_sync(db, user_id, delta: int):
+    """Unconditionally move the user's usage by delta (sync, for Celery tasks)"""
+    if delta:
+        db.execute(_adjust_stmt(user_id, delta))
+
+def _actual_usage():
+    """Bytes of the user's files that count against quota, correlated on users.id"""
+    return (
+        select(func.coalesce(func.sum(File.size_bytes), 0))
+        .where(
+            File.owner_user_id == users.c.id,
+            File.deleted_at.is_(None),
+            File.status != "uploading"
+        )
+        .scalar_subquery()
+    )
+
+def reconcile_storage_sync(db, batch_size: int = 500) -> int:
+    """
+    Recompute storage_used_bytes from files for every user, one batch of
+    users per transaction. Returns how many users had drifted.
+    """
+    fixed = 0
+    last_id = None
+    while True:
+        # Lock the batch first: in-flight charges commit (or wait) before the
+        # sums below are read, so none of them is counted twice or lost
+        query = select(users.c.id).order_by(users.c.id).limit(batch_size).with_for_update()
+        if last_id is not None:
+            query = query.where(users.c.id > last_id)
+        user_ids = db.execute(query).scalars().all()
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+
+        actual = _actual_usage()
+        result = db.execute(
+            update(users)
+            .where(users.c.id.in_(user_ids), users.c.storage_used_bytes.is_distinct_from(actual))
+            .values(storage_used_bytes=actual)
+            .returning(users.c.id)
+        )
+        fixed += len(result.all())
+        db.commit()
+    return fixed
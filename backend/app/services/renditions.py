@@ -0,0 +1,61 @@
+"""
+Thumbnail / preview renditions.
+
+Each processed image or PDF gets a ladder of widths in every configured
+format, stored content-addressed under ``renditions/{sha256}/`` so copies of
+the same blob share them. ``File.preview_urls`` records the ladder:
+
+    {"renditions": [{"width": 320, "height": 213, "format": "webp",
+                     "content_type": "image/webp", "key": "...", "size_bytes": 9120}, ...]}
+
+Listings pick the smallest rendition at least as wide as the client's
+viewport, in the most compact format the client accepts.
+"""
+from app.config import settings
+
+CONTENT_TYPES = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+# Smallest first - preferred when the client accepts it
+FORMAT_PREFERENCE = ("avif", "webp", "jpeg")
+
+def rendition_key(checksum: str, width: int, fmt: str) -> str:
+    ext = "jpg" if fmt == "jpeg" else fmt
+    return f"renditions/{checksum}/{width}.{ext}"
+
+def rendition_content_type(key: str) -> str | None:
+    ext = key.rsplit(".", 1)[-1]
+    return CONTENT_TYPES.get("jpeg" if ext == "jpg" else ext)
+
+def accepted_formats(accept_header: str | None) -> set:
+    """Image formats the client accepts; JPEG is always assumed"""
+    accept = (accept_header or "").lower()
+    formats = {"jpeg"}
+    for fmt in ("avif", "webp"):
+        if CONTENT_TYPES[fmt] in accept:
+            formats.add(fmt)
+    return formats
+
+def pick_rendition(preview_urls: dict | None, width: int | None, formats: set) -> dict | None:
+    """The smallest rendition covering ``width`` pixels in the best accepted format"""
+    renditions = (preview_urls or {}).get("renditions") or []
+    if not renditions:
+        return None
+
+    width = width or settings.THUMBNAIL_DEFAULT_WIDTH
+    for fmt in FORMAT_PREFERENCE:
+        candidates = sorted(
+            (r for r in renditions if r["format"] == fmt),
+            key=lambda r: r["width"]
+        )
+        if fmt not in formats or not candidates:
+            continue
+        for rendition in candidates:
+            if rendition["width"] >= width:
+                return rendition
+        # Nothing wide enough - the largest one is the original's own size
+        return candidates[-1]
+    return None
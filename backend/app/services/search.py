@@ -0,0 +1,285 @@
+"""
+Pluggable full-text search over a user's files.
+
+Two backends share one interface and are picked by ``Settings.SEARCH_BACKEND``:
+
+* ``postgres`` (default) - the generated ``files.search_vector`` tsvector with
+  a per-owner GIN index, plus pg_trgm on filenames for partial matches. No
+  extra infrastructure and always in sync with the row.
+* ``elasticsearch`` - documents in ``Settings.ELASTICSEARCH_INDEX``, kept in
+  sync by the ``index_file_search`` Celery task.
+
+Both return results ranked by relevance with highlighted snippets and page
+with an opaque (score, id) cursor.
+"""
+from fastapi import HTTPException
+from sqlalchemy import select, or_, func, literal_column
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.core.pagination import decode_cursor, encode_cursor, ranked_before
+from app.models.file import File, SEARCH_CONFIG
+from app.services.outbox import enqueue
+
+HIGHLIGHT_PRE = "<mark>"
+HIGHLIGHT_POST = "</mark>"
+PREVIEW_CHARS = 200
+SNIPPET_SOURCE_CHARS = 100000
+
+class SearchBackend:
+    """Interface implemented by every search backend"""
+    name = None
+    # True when documents live outside Postgres and must be pushed on change
+    external_index = False
+
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id,
+        q: str,
+        folder_id: str | None,
+        limit: int,
+        cursor: str | None
+    ) -> tuple[list[dict], str | None]:
+        """Return (results, next_cursor) for one page, best match first"""
+        raise NotImplementedError
+
+    def index_file(self, file: File):
+        """Add or refresh a file's document (sync, for Celery tasks)"""
+        pass
+
+    def remove_file(self, file_id: str):
+        """Drop a file's document (sync, for Celery tasks)"""
+        pass
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+class PostgresSearchBackend(SearchBackend):
+    name = "postgres"
+
+    FILENAME_HEADLINE = f"HighlightAll=true, StartSel={HIGHLIGHT_PRE}, StopSel={HIGHLIGHT_POST}"
+    SNIPPET_HEADLINE = (
+        f"MaxFragments=2, MaxWords=25, MinWords=8, FragmentDelimiter=\" ... \", "
+        f"StartSel={HIGHLIGHT_PRE}, StopSel={HIGHLIGHT_POST}"
+    )
+
+    async def search(self, db, user_id, q, folder_id, limit, cursor):
+        config = literal_column(f"'{SEARCH_CONFIG}'::regconfig")
+        tsquery = func.websearch_to_tsquery(config, q)
+        # Cover density rank normalised to [0, 1), plus filename trigram similarity
+        rank = func.ts_rank_cd(File.search_vector, tsquery, 32) + func.similarity(File.filename, q)
+
+        matches = select(File.id, rank.label("rank")).where(
+            File.owner_user_id == user_id,
+            File.deleted_at.is_(None),
+            or_(
+                File.search_vector.op("@@")(tsquery),
+                File.filename.ilike(f"%{_escape_like(q)}%", escape="\\")
+            )
+        )
+        if folder_id:
+            matches = matches.where(File.folder_id == folder_id)
+        if cursor:
+            matches = matches.where(ranked_before(rank, File.id, cursor))
+
+        # Rank and limit first so highlighting only runs over the returned page
+        page = matches.order_by(rank.desc(), File.id.desc()).limit(limit + 1).subquery()
+        result = await db.execute(
+            select(
+                File.id,
+                File.filename,
+                File.size_bytes,
+                File.mime_type,
+                File.folder_id,
+                File.created_at,
+                func.left(File.ocr_text, PREVIEW_CHARS).label("ocr_preview"),
+                page.c.rank,
+                func.ts_headline(config, File.filename, tsquery, self.FILENAME_HEADLINE).label("filename_highlight"),
+                func.ts_headline(
+                    config,
+                    func.left(File.ocr_text, SNIPPET_SOURCE_CHARS),
+                    tsquery,
+                    self.SNIPPET_HEADLINE
+                ).label("snippet")
+            )
+            .join(page, page.c.id == File.id)
+            .order_by(page.c.rank.desc(), File.id.desc())
+        )
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+
+        return [
+            {
+                "id": str(row.id),
+                "filename": row.filename,
+                "size_bytes": row.size_bytes,
+                "mime_type": row.mime_type,
+                "folder_id": str(row.folder_id) if row.folder_id else None,
+                "created_at": row.created_at.isoformat(),
+                "ocr_text": row.ocr_preview,
+                "score": float(row.rank),
+                "filename_highlight": row.filename_highlight,
+                "snippets": [row.snippet] if row.snippet and HIGHLIGHT_PRE in row.snippet else []
+            }
+            for row in rows
+        ], next_cursor
+
+class ElasticsearchSearchBackend(SearchBackend):
+    name = "elasticsearch"
+    external_index = True
+
+    MAPPINGS = {
+        "properties": {
+            "id": {"type": "keyword"},
+            "owner_user_id": {"type": "keyword"},
+            "folder_id": {"type": "keyword"},
+            "filename": {"type": "text", "fields": {"ngram": {"type": "search_as_you_type"}}},
+            "description": {"type": "text"},
+            "ocr_text": {"type": "text"},
+            "ocr_preview": {"type": "keyword", "index": False},
+            "mime_type": {"type": "keyword"},
+            "size_bytes": {"type": "long"},
+            "created_at": {"type": "date"},
+        }
+    }
+
+    def __init__(self, url: str, index: str):
+        self.url = url
+        self.index = index
+        self._client = None
+        self._sync_client = None
+        self._index_ready = False
+
+    @property
+    def client(self):
+        # Created lazily so importing this module never opens a connection
+        if self._client is None:
+            from elasticsearch import AsyncElasticsearch
+            self._client = AsyncElasticsearch(self.url)
+        return self._client
+
+    @property
+    def sync_client(self):
+        if self._sync_client is None:
+            from elasticsearch import Elasticsearch
+            self._sync_client = Elasticsearch(self.url)
+        return self._sync_client
+
+    async def search(self, db, user_id, q, folder_id, limit, cursor):
+        filters = [{"term": {"owner_user_id": str(user_id)}}]
+        if folder_id:
+            filters.append({"term": {"folder_id": str(folder_id)}})
+
+        search_after = None
+        if cursor:
+            values = decode_cursor(cursor)
+            try:
+                search_after = [float(values[0]), str(values[1])]
+            except (IndexError, TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        response = await self.client.search(
+            index=self.index,
+            size=limit + 1,
+            query={
+                "bool": {
+                    "must": [{
+                        "multi_match": {
+                            "query": q,
+                            "fields": ["filename^3", "filename.ngram^2", "description^2", "ocr_text"],
+                            "type": "most_fields"
+                        }
+                    }],
+                    "filter": filters
+                }
+            },
+            sort=[{"_score": "desc"}, {"id": "desc"}],
+            search_after=search_after,
+            highlight={
+                "pre_tags": [HIGHLIGHT_PRE],
+                "post_tags": [HIGHLIGHT_POST],
+                "fields": {
+                    "filename": {"number_of_fragments": 0},
+                    "ocr_text": {"fragment_size": 150, "number_of_fragments": 2}
+                }
+            },
+            source_excludes=["ocr_text", "description"]
+        )
+        hits = response["hits"]["hits"]
+
+        next_cursor = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            next_cursor = encode_cursor(*hits[-1]["sort"])
+
+        results = []
+        for hit in hits:
+            doc = hit["_source"]
+            highlight = hit.get("highlight", {})
+            results.append({
+                "id": doc["id"],
+                "filename": doc["filename"],
+                "size_bytes": doc["size_bytes"],
+                "mime_type": doc["mime_type"],
+                "folder_id": doc.get("folder_id"),
+                "created_at": doc["created_at"],
+                "ocr_text": doc.get("ocr_preview"),
+                "score": hit["_score"],
+                "filename_highlight": highlight.get("filename", [doc["filename"]])[0],
+                "snippets": highlight.get("ocr_text", [])
+            })
+        return results, next_cursor
+
+    def _ensure_index(self):
+        if self._index_ready:
+            return
+        if not self.sync_client.indices.exists(index=self.index):
+            self.sync_client.options(ignore_status=400).indices.create(index=self.index, mappings=self.MAPPINGS)
+        self._index_ready = True
+
+    def index_file(self, file: File):
+        self._ensure_index()
+        self.sync_client.index(
+            index=self.index,
+            id=str(file.id),
+            document={
+                "id": str(file.id),
+                "owner_user_id": str(file.owner_user_id),
+                "folder_id": str(file.folder_id) if file.folder_id else None,
+                "filename": file.filename,
+                "description": file.description,
+                "ocr_text": file.ocr_text,
+                "ocr_preview": file.ocr_text[:PREVIEW_CHARS] if file.ocr_text else None,
+                "mime_type": file.mime_type,
+                "size_bytes": file.size_bytes,
+                "created_at": file.created_at.isoformat(),
+            }
+        )
+
+    def remove_file(self, file_id: str):
+        self.sync_client.options(ignore_status=404).delete(index=self.index, id=str(file_id))
+
+def schedule_index(db, *file_ids):
+    """Queue search index updates for files changed in db's transaction (no-op for postgres)"""
+    if not get_search_backend().external_index:
+        return
+    for file_id in file_ids:
+        enqueue(db, "index_file_search", str(file_id))
+
+_backend = None
+
+def get_search_backend() -> SearchBackend:
+    """The configured search backend (created on first use)"""
+    global _backend
+    if _backend is None:
+        if settings.SEARCH_BACKEND == "elasticsearch":
+            _backend = ElasticsearchSearchBackend(settings.ELASTICSEARCH_URL, settings.ELASTICSEARCH_INDEX)
+        elif settings.SEARCH_BACKEND == "postgres":
+            _backend = PostgresSearchBackend()
+        else:
+            raise ValueError(f"Unknown SEARCH_BACKEND: {settings.SEARCH_BACKEND}")
+    return _backend
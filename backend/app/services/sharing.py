@@ -0,0 +1,489 @@
+"""
+Share delivery as a single set-based statement.
+
+Sending a file used to be a chain of round-trips - load the file, find the
+recipient, find or create the target folder, work out its position, then
+insert the share, the recipient's copy and the counters - and the
+find-or-create raced under concurrency. ``deliver_share`` does all of it in
+one ``WITH`` statement: the target folder is an ``INSERT ... ON CONFLICT`` on
+the unique (owner_user_id, name) key, and the recipient's storage and the
+blob's reference count are incremented in place.
+"""
+import uuid
+from datetime import datetime
+from sqlalchemy import select, insert, update, func, literal, true, false, case, exists, values, column, bindparam, and_, or_, String, Integer
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.user import User
+from app.models.file import File
+from app.models.folder import Folder
+from app.models.share import Share
+from app.models.blob import Blob
+from app.core.security import generate_transaction_id
+from app.services.blobs import add_blob_refs_many
+
+SHAREABLE_STATUSES = ("uploaded", "hidden")
+
+def _shareable():
+    # Direct-to-storage uploads stay unshareable until finalize_uploaded_file
+    # has hashed them, since it may still repoint and delete their object
+    return and_(File.status.in_(SHAREABLE_STATUSES), File.checksum_sha256.is_distinct_from("pending"))
+
+# Processing results carried over to the recipient's copy of the same bytes
+COPIED_FILE_COLUMNS = (
+    "filename", "original_filename", "size_bytes", "mime_type", "storage_key",
+    "storage_bucket", "checksum_sha256", "virus_scan_status", "ocr_text",
+    "ocr_completed", "extracted_metadata", "thumbnail_url", "preview_urls",
+)
+
+# Several INSERT/UPDATE CTEs share one statement, so column defaults are
+# spelled out as literals - SQLAlchemy's per-statement default parameters
+# would collide across them.
+
+def _delivery_stmt(
+    sender: User,
+    file_id,
+    recipient_email: str | None,
+    recipient_phone: str | None,
+    target_folder_name: str,
+    message: str | None,
+    share_type: str
+):
+    now = literal(datetime.utcnow())
+
+    src = select(File.id, *(File.__table__.c[name] for name in COPIED_FILE_COLUMNS)).where(
+        File.id == file_id,
+        File.owner_user_id == sender.id,
+        File.deleted_at.is_(None),
+        _shareable()
+    ).cte("src")
+
+    rcpt = select(User.id, User.name).where(
+        User.email == recipient_email if recipient_email else false()
+    ).cte("rcpt")
+
+    # Recipient's target folder: created on first delivery, reused after
+    next_position = (
+        select(func.coalesce(func.max(Folder.position) + 1, 0))
+        .where(Folder.owner_user_id == rcpt.c.id)
+        .scalar_subquery()
+    )
+    folder_insert = pg_insert(Folder).from_select(
+        [
+            "id", "owner_user_id", "name", "icon", "color", "position", "visibility",
+            "default_retention_days", "auto_categorize", "created_at", "updated_at",
+        ],
+        select(
+            literal(uuid.uuid4()),
+            rcpt.c.id,
+            literal(target_folder_name),
+            literal("📁"),
+            literal("#667eea"),
+            next_position,
+            literal("private"),
+            literal(365),
+            true(),
+            now,
+            now
+        ).where(exists(select(src.c.id))),
+        include_defaults=False
+    )
+    folder_ins = folder_insert.on_conflict_do_update(
+        index_elements=[Folder.owner_user_id, Folder.name],
+        # No-op update so RETURNING yields the existing folder's id
+        set_={"updated_at": Folder.updated_at}
+    ).returning(Folder.id).cte("folder_ins")
+
+    # Recipient's copy points at the same blob
+    file_ins = pg_insert(File).from_select(
+        [
+            "id", "owner_user_id", "folder_id", "status", "version", "encrypted",
+            "tags", "custom_metadata", "created_at", "updated_at", *COPIED_FILE_COLUMNS,
+        ],
+        select(
+            literal(uuid.uuid4()),
+            rcpt.c.id,
+            folder_ins.c.id,
+            literal("uploaded"),
+            literal(1),
+            false(),
+            literal([], File.tags.type),
+            literal({}, File.custom_metadata.type),
+            now,
+            now,
+            *(src.c[name] for name in COPIED_FILE_COLUMNS)
+        ).select_from(src.join(rcpt, true()).join(folder_ins, true())),
+        include_defaults=False
+    ).returning(File.id, File.owner_user_id).cte("file_ins")
+
+    delivered = rcpt.c.id.isnot(None)
+    share_ins = pg_insert(Share).from_select(
+        [
+            "id", "file_id", "sender_user_id", "sender_name", "sender_email",
+            "recipient_user_id", "recipient_email", "recipient_phone", "recipient_name",
+            "target_folder_id", "target_folder_name", "message", "share_type",
+            "transaction_id", "status", "delivered_at", "view_count", "permissions",
+            "share_metadata", "created_at", "updated_at",
+        ],
+        select(
+            literal(uuid.uuid4()),
+            src.c.id,
+            literal(sender.id),
+            literal(sender.name),
+            literal(sender.email),
+            rcpt.c.id,
+            literal(recipient_email, Share.recipient_email.type),
+            literal(recipient_phone, Share.recipient_phone.type),
+            rcpt.c.name,
+            folder_ins.c.id,
+            literal(target_folder_name),
+            literal(message, Share.message.type),
+            literal(share_type),
+            literal(generate_transaction_id()),
+            case((delivered, "delivered"), else_="sent"),
+            case((delivered, now), else_=None),
+            literal(0),
+            literal({"view": True, "download": True, "share": False}, Share.permissions.type),
+            literal({}, Share.share_metadata.type),
+            now,
+            now
+        ).select_from(
+            src.outerjoin(rcpt, true()).outerjoin(folder_ins, true())
+        ),
+        include_defaults=False
+    ).returning(Share).cte("share_ins")
+
+    # Counters move in place, so concurrent deliveries never lose updates
+    usage = (
+        update(User)
+        .where(User.id == file_ins.c.owner_user_id)
+        .values(
+            storage_used_bytes=User.storage_used_bytes + select(src.c.size_bytes).scalar_subquery(),
+            updated_at=now
+        )
+        .returning(User.id)
+        .cte("usage")
+    )
+    refs = (
+        update(Blob)
+        .where(Blob.sha256 == src.c.checksum_sha256, exists(select(file_ins.c.id)))
+        .values(ref_count=Blob.ref_count + 1, updated_at=now)
+        .returning(Blob.sha256)
+        .cte("refs")
+    )
+
+    return (
+        select(
+            share_ins,
+            src.c.filename,
+            file_ins.c.id.label("recipient_file_id"),
+            usage.c.id.label("charged_user_id"),
+            refs.c.sha256.label("blob_sha256")
+        )
+        .select_from(
+            share_ins
+            .join(src, true())
+            .outerjoin(file_ins, true())
+            .outerjoin(usage, true())
+            .outerjoin(refs, true())
+        )
+    )
+
+async def deliver_share(
+    db: AsyncSession,
+    sender: User,
+    file_id,
+    recipient_email: str | None,
+    recipient_phone: str | None,
+    target_folder_name: str,
+    message: str | None = None,
+    share_type: str = "direct"
+):
+    """
+    Record a share and, when the recipient has an account, file a copy into
+    their target folder - all in one statement. Returns the result row, or
+    None when the sender has no shareable file with this id.
+    """
+    result = await db.execute(
+        _delivery_stmt(
+            sender, file_id, recipient_email, recipient_phone,
+            target_folder_name, message, share_type
+        )
+    )
+    return result.first()
+
+# Batch delivery
+#
+# Sending many files to many people resolves recipients and target folders
+# with one statement each, then writes every share, recipient copy and
+# counter change as bulk executemany batches - a fixed handful of statements
+# however many deliveries the batch holds.
+
+MAX_BATCH_DELIVERIES = 1000
+
+_charge_storage_stmt = (
+    update(User.__table__)
+    .where(User.__table__.c.id == bindparam("u_id"))
+    .values(
+        storage_used_bytes=User.__table__.c.storage_used_bytes + bindparam("u_bytes"),
+        updated_at=bindparam("u_now")
+    )
+)
+
+def _upsert_folders_stmt(owner_names: list):
+    """Find-or-create each (owner_user_id, name) folder, returning (id, owner_user_id, name)"""
+    now = datetime.utcnow()
+    # New folders go after the owner's existing ones, in the order given
+    offsets = {}
+    rows = []
+    for owner_id, name in owner_names:
+        offsets[owner_id] = offsets.get(owner_id, -1) + 1
+        rows.append((uuid.uuid4(), owner_id, name, offsets[owner_id]))
+    wanted = values(
+        column("id", UUID(as_uuid=True)),
+        column("owner_user_id", UUID(as_uuid=True)),
+        column("name", String),
+        column("n", Integer),
+        name="wanted"
+    ).data(rows)
+    next_position = (
+        select(func.coalesce(func.max(Folder.position) + 1, 0))
+        .where(Folder.owner_user_id == wanted.c.owner_user_id)
+        .scalar_subquery()
+    )
+    stmt = pg_insert(Folder).from_select(
+        [
+            "id", "owner_user_id", "name", "icon", "color", "position", "visibility",
+            "default_retention_days", "auto_categorize", "created_at", "updated_at",
+        ],
+        select(
+            wanted.c.id,
+            wanted.c.owner_user_id,
+            wanted.c.name,
+            literal("📁"),
+            literal("#667eea"),
+            next_position + wanted.c.n,
+            literal("private"),
+            literal(365),
+            true(),
+            literal(now),
+            literal(now)
+        ),
+        include_defaults=False
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[Folder.owner_user_id, Folder.name],
+        set_={"updated_at": Folder.updated_at}
+    ).returning(Folder.id, Folder.owner_user_id, Folder.name)
+
+async def deliver_shares_batch(
+    db: AsyncSession,
+    sender: User,
+    file_ids: list,
+    recipients: list,
+    target_folder_name: str,
+    message: str | None = None,
+    share_type: str = "direct"
+) -> list[dict]:
+    """
+    Share every file with every recipient in the caller's transaction.
+
+    ``recipients`` holds (email, phone) pairs. Raises LookupError naming any
+    file the sender can't share. Returns one dict per delivery with its
+    transaction id and status.
+    """
+    file_ids = list(dict.fromkeys(str(f) for f in file_ids))
+    result = await db.execute(
+        select(File.id, *(File.__table__.c[name] for name in COPIED_FILE_COLUMNS)).where(
+            File.id.in_(file_ids),
+            File.owner_user_id == sender.id,
+            File.deleted_at.is_(None),
+            _shareable()
+        )
+    )
+    files = {str(row.id): row for row in result.all()}
+    missing = [f for f in file_ids if f not in files]
+    if missing:
+        raise LookupError(missing)
+
+    emails = sorted({email for email, _ in recipients if email})
+    users = {}
+    if emails:
+        result = await db.execute(select(User.id, User.email, User.name).where(User.email.in_(emails)))
+        users = {row.email: row for row in result.all()}
+
+    folders = {}
+    if users:
+        result = await db.execute(
+            _upsert_folders_stmt([(user_id, target_folder_name) for user_id in sorted({u.id for u in users.values()})])
+        )
+        folders = {row.owner_user_id: row.id for row in result.all()}
+
+    now = datetime.utcnow()
+    share_rows, file_rows, deliveries = [], [], []
+    charged = {}
+    for email, phone in recipients:
+        recipient = users.get(email)
+        for file_id in file_ids:
+            src = files[file_id]
+            share_row = {
+                "id": uuid.uuid4(),
+                "file_id": src.id,
+                "sender_user_id": sender.id,
+                "sender_name": sender.name,
+                "sender_email": sender.email,
+                "recipient_user_id": None,
+                "recipient_email": email,
+                "recipient_phone": phone,
+                "recipient_name": None,
+                "target_folder_id": None,
+                "target_folder_name": target_folder_name,
+                "message": message,
+                "share_type": share_type,
+                "transaction_id": generate_transaction_id(),
+                "status": "sent",
+                "delivered_at": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            if recipient:
+                share_row.update(
+                    recipient_user_id=recipient.id,
+                    recipient_name=recipient.name,
+                    target_folder_id=folders[recipient.id],
+                    status="delivered",
+                    delivered_at=now
+                )
+                file_rows.append({
+                    "id": uuid.uuid4(),
+                    "owner_user_id": recipient.id,
+                    "folder_id": folders[recipient.id],
+                    "status": "uploaded",
+                    "created_at": now,
+                    "updated_at": now,
+                    **{name: getattr(src, name) for name in COPIED_FILE_COLUMNS}
+                })
+                charged[recipient.id] = charged.get(recipient.id, 0) + src.size_bytes
+            share_rows.append(share_row)
+            deliveries.append({
+                "id": str(share_row["id"]),
+                "transaction_id": share_row["transaction_id"],
+                "file_id": file_id,
+                "filename": src.filename,
+                "recipient_email": email,
+                "recipient_phone": phone,
+                "recipient_name": share_row["recipient_name"],
+                "recipient_user_id": share_row["recipient_user_id"],
+                "recipient_file_id": str(file_rows[-1]["id"]) if recipient else None,
+                "status": share_row["status"],
+            })
+
+    # Every row carries the same keys, so each insert is one executemany batch
+    if file_rows:
+        await db.execute(insert(File), file_rows)
+        await add_blob_refs_many(db, [row["checksum_sha256"] for row in file_rows])
+        await db.execute(
+            _charge_storage_stmt,
+            # In id order, like every other multi-user lock, so batches can't deadlock
+            [{"u_id": user_id, "u_bytes": n, "u_now": now} for user_id, n in sorted(charged.items())]
+        )
+    await db.execute(insert(Share), share_rows)
+
+    return deliveries
+
+# Claiming shares sent before the recipient had an account
+#
+# A share to an unknown email or phone stays "sent" with no recipient. When
+# an account with that email or phone appears (or logs in), every such share
+# is delivered at once: pending shares are locked, the target folders
+# upserted in one statement, and the recipient copies, share updates and
+# counters written as executemany batches. After that the inbox only has to
+# look at recipient_user_id.
+
+_claim_share_stmt = (
+    update(Share.__table__)
+    .where(
+        Share.__table__.c.id == bindparam("s_id"),
+        Share.__table__.c.recipient_user_id.is_(None)
+    )
+    .values(
+        recipient_user_id=bindparam("s_user"),
+        recipient_name=bindparam("s_name"),
+        target_folder_id=bindparam("s_folder"),
+        status="delivered",
+        delivered_at=bindparam("s_now"),
+        updated_at=bindparam("s_now")
+    )
+)
+
+def _pending_shares_stmt(user: User):
+    addressed = [Share.recipient_email == user.email]
+    if user.phone:
+        addressed.append(Share.recipient_phone == user.phone)
+    return (
+        select(
+            Share.id.label("share_id"),
+            Share.target_folder_name,
+            File.id,
+            *(File.__table__.c[name] for name in COPIED_FILE_COLUMNS)
+        )
+        .join(File, File.id == Share.file_id)
+        .where(
+            Share.recipient_user_id.is_(None),
+            Share.status == "sent",
+            or_(*addressed),
+            File.deleted_at.is_(None),
+            _shareable()
+        )
+        .order_by(Share.created_at, Share.id)
+        # A concurrent claim for the same user skips rows this one holds
+        .with_for_update(of=Share, skip_locked=True)
+    )
+
+async def claim_pending_shares(db: AsyncSession, user: User) -> list:
+    """
+    Deliver every pending share addressed to the user's email or phone, in
+    the caller's transaction. Returns the ids of the recipient copies.
+    """
+    result = await db.execute(_pending_shares_stmt(user))
+    pending = result.all()
+    if not pending:
+        return []
+
+    names = list(dict.fromkeys(row.target_folder_name for row in pending))
+    result = await db.execute(_upsert_folders_stmt([(user.id, name) for name in names]))
+    folders = {row.name: row.id for row in result.all()}
+
+    now = datetime.utcnow()
+    file_rows = [
+        {
+            "id": uuid.uuid4(),
+            "owner_user_id": user.id,
+            "folder_id": folders[row.target_folder_name],
+            "status": "uploaded",
+            "created_at": now,
+            "updated_at": now,
+            **{name: getattr(row, name) for name in COPIED_FILE_COLUMNS}
+        }
+        for row in pending
+    ]
+    await db.execute(insert(File), file_rows)
+    await add_blob_refs_many(db, [row["checksum_sha256"] for row in file_rows])
+    await db.execute(
+        _claim_share_stmt,
+        [
+            {
+                "s_id": row.share_id,
+                "s_user": user.id,
+                "s_name": user.name,
+                "s_folder": folders[row.target_folder_name],
+                "s_now": now,
+            }
+            for row in pending
+        ]
+    )
+    await db.execute(
+        _charge_storage_stmt,
+        [{"u_id": user.id, "u_bytes": sum(row.size_bytes for row in pending), "u_now": now}]
+    )
+    return [row["id"] for row in file_rows]
@@ -0,0 +1,35 @@
+"""
+Object storage behind one interface, picked by ``Settings.STORAGE_BACKEND``:
+
+* ``b2`` (default) - Backblaze B2 or any S3-compatible service, with
+  presigned URLs for direct client uploads and downloads.
+* ``local`` - files under ``Settings.LOCAL_STORAGE_PATH``, served zero-copy
+  through the download proxy.
+* ``memory`` - an in-process dict, for tests and benchmarks.
+
+The backend is created on first use, so importing this package never opens a
+connection or touches the disk.
+"""
+from app.config import settings
+from app.services.storage.base import StorageBackend, storage_executor, run_storage_io
+
+_backend = None
+
+def get_storage() -> StorageBackend:
+    """The configured storage backend (created on first use)"""
+    global _backend
+    if _backend is None:
+        if settings.STORAGE_BACKEND == "b2":
+            from app.services.storage.b2 import B2StorageBackend
+            _backend = B2StorageBackend()
+        elif settings.STORAGE_BACKEND == "local":
+            from app.services.storage.local import LocalStorageBackend
+            _backend = LocalStorageBackend(settings.LOCAL_STORAGE_PATH)
+        elif settings.STORAGE_BACKEND == "memory":
+            from app.services.storage.memory import MemoryStorageBackend
+            _backend = MemoryStorageBackend()
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+    return _backend
+
+__all__ = ["StorageBackend", "get_storage", "storage_executor", "run_storage_io"]
@@ -0,0 +1,419 @@
+"""
+Backblaze B2 (or any S3-compatible service) through boto3.
+
+The only backend that supports presigned URLs, so clients upload and
+download straight to and from the bucket.
+"""
+import time
+from datetime import datetime
+from typing import Optional
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.core.cache import LocalTTLCache
+from app.services.presign import SigV4Presigner
+from app.services.storage.base import StorageBackend, DEFAULT_CHUNK_SIZE
+
+# DeleteObjects takes at most this many keys per request
+DELETE_BATCH_SIZE = 1000
+
+class B2StorageBackend(StorageBackend):
+    name = "b2"
+    presigned_uploads = True
+    
+    def __init__(self):
+        self.key_id = settings.B2_KEY_ID
+        self.app_key = settings.B2_APP_KEY
+        self.bucket = settings.B2_BUCKET_NAME
+        self.endpoint_url = settings.B2_ENDPOINT_URL
+        
+        if not self.key_id or not self.app_key:
+            print("WARNING: B2 Credentials not set. Storage service may fail.")
+
+        self.s3_client = boto3.client(
+            's3',
+            endpoint_url=self.endpoint_url,
+            aws_access_key_id=self.key_id,
+            aws_secret_access_key=self.app_key,
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=settings.STORAGE_IO_WORKERS
+            )
+        )
+        
+        self.presigner = SigV4Presigner(
+            self.s3_client.meta.endpoint_url,
+            self.bucket,
+            self.key_id,
+            self.app_key,
+            self.s3_client.meta.region_name
+        )
+        self._presigned_urls = LocalTTLCache(maxsize=settings.PRESIGNED_URL_CACHE_SIZE)
+    
+    def create_presigned_upload_url(
+        self,
+        storage_key: str,
+        content_type: str,
+        expires_in: int = None
+    ) -> str:
+        """Generate presigned URL for direct upload"""
+        if expires_in is None:
+            expires_in = settings.S3_PRESIGNED_URL_EXPIRY
+        
+        try:
+            url = self.s3_client.generate_presigned_url(
+                'put_object',
+                Params={
+                    'Bucket': self.bucket,
+                    'Key': storage_key,
+                    'ContentType': content_type,
+                },
+                ExpiresIn=expires_in
+            )
+            return url
+        except ClientError as e:
+            raise Exception(f"Failed to generate upload URL: {str(e)}")
+    
+    def create_presigned_download_url(
+        self,
+        storage_key: str,
+        expires_in: int = None,
+        filename: Optional[str] = None
+    ) -> str:
+        """Generate presigned URL for download/view"""
+        if expires_in is None:
+            expires_in = settings.S3_PRESIGNED_URL_EXPIRY
+        
+        params = {
+            'Bucket': self.bucket,
+            'Key': storage_key
+        }
+        
+        if filename:
+            # If filename is provided, we can force download, 
+            # BUT for "viewing" (inline), we might want to omit this or set it to inline.
+            # The API calls this with filename for "download".
+            # For "view", we might need a separate method or flag.
+            # However, the current API usage for "view_url" in files.py calls the proxy endpoint,
+            # which then calls this. 
+            # Wait, the proxy endpoint in files.py calls this? 
+            # No, files.py proxy endpoint calls `storage_service.create_presigned_download_url`.
+            # If we want inline viewing, we should allow `ResponseContentDisposition` to be 'inline'.
+            
+            # Let's check how files.py uses it.
+            # It calls: storage_service.create_presigned_download_url(file.storage_key, filename=file.original_filename)
+            # This forces attachment.
+            
+            # We should probably allow passing 'disposition' type.
+            pass
+
+        # To support the 'inline' vs 'attachment' toggle from the controller:
+        # We'll rely on the controller to pass the right params or we'll modify this signature.
+        # For now, let's keep it compatible but maybe check if filename is passed.
+        
+        if filename:
+             params['ResponseContentDisposition'] = f'attachment; filename="{filename}"'
+        
+        if expires_in == settings.S3_PRESIGNED_URL_EXPIRY:
+            return self._cached_presigned_get(storage_key, params.get('ResponseContentDisposition'), None)
+        
+        try:
+            url = self.s3_client.generate_presigned_url(
+                'get_object',
+                Params=params,
+                ExpiresIn=expires_in
+            )
+            return url
+        except ClientError as e:
+            raise Exception(f"Failed to generate download URL: {str(e)}")
+            
+    def create_presigned_view_url(self, storage_key: str, content_type: str, expires_in: int = None) -> str:
+        """Generate presigned URL for inline viewing"""
+        if expires_in is None:
+            return self.create_presigned_view_urls([(storage_key, content_type)])[0]
+            
+        params = {
+            'Bucket': self.bucket,
+            'Key': storage_key,
+            'ResponseContentType': content_type,
+            'ResponseContentDisposition': 'inline'
+        }
+        
+        try:
+            url = self.s3_client.generate_presigned_url(
+                'get_object',
+                Params=params,
+                ExpiresIn=expires_in
+            )
+            return url
+        except ClientError as e:
+            raise Exception(f"Failed to generate view URL: {str(e)}")
+    
+    def create_presigned_view_urls(self, items: list) -> list:
+        """
+        Presign inline-view URLs for many (storage_key, content_type) pairs at once.
+        
+        All URLs in a call share one signing key and one time bucket, and are
+        cached until the bucket rolls over, so repeated listings return
+        byte-identical URLs that browsers can cache.
+        """
+        signed_at, ttl = self._signing_window()
+        return [
+            self._cached_presigned_get(storage_key, 'inline', content_type, signed_at, ttl)
+            for storage_key, content_type in items
+        ]
+    
+    def _signing_window(self):
+        """Start of the current time bucket and the seconds left in it"""
+        expires_in = settings.S3_PRESIGNED_URL_EXPIRY
+        bucket_seconds = min(settings.PRESIGNED_URL_BUCKET_SECONDS, expires_in // 2) or 1
+        now = time.time()
+        bucket_start = int(now // bucket_seconds) * bucket_seconds
+        return datetime.utcfromtimestamp(bucket_start), bucket_start + bucket_seconds - now
+    
+    def _cached_presigned_get(self, storage_key: str, disposition: str, content_type: str, signed_at=None, ttl=None) -> str:
+        if signed_at is None:
+            signed_at, ttl = self._signing_window()
+        
+        cache_key = (storage_key, disposition, content_type)
+        url = self._presigned_urls.get(cache_key)
+        if url is None:
+            params = {}
+            if content_type:
+                params['response-content-type'] = content_type
+            if disposition:
+                params['response-content-disposition'] = disposition
+            url = self.presigner.presign_get(storage_key, params, signed_at, settings.S3_PRESIGNED_URL_EXPIRY)
+            self._presigned_urls.set(cache_key, url, ttl=ttl)
+        return url
+    
+    def delete_file(self, storage_key: str) -> bool:
+        """Delete file from B2"""
+        try:
+            self.s3_client.delete_object(Bucket=self.bucket, Key=storage_key)
+            return True
+        except ClientError as e:
+            raise Exception(f"Failed to delete file: {str(e)}")
+    
+    def delete_files(self, storage_keys: list) -> list:
+        """Delete many objects, 1000 keys per DeleteObjects request"""
+        failed = []
+        for i in range(0, len(storage_keys), DELETE_BATCH_SIZE):
+            batch = storage_keys[i:i + DELETE_BATCH_SIZE]
+            try:
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+                )
+            except ClientError:
+                failed.extend(batch)
+                continue
+            failed.extend(error['Key'] for error in response.get('Errors', []))
+        return failed
+    
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every object under a key prefix, 1000 keys per request"""
+        deleted = 0
+        try:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                keys = [{'Key': obj['Key']} for obj in page.get('Contents', [])]
+                if keys:
+                    self.s3_client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys, 'Quiet': True})
+                    deleted += len(keys)
+        except ClientError as e:
+            raise Exception(f"Failed to delete prefix {prefix}: {str(e)}")
+        return deleted
+    
+    def check_file_exists(self, storage_key: str) -> bool:
+        """Check if file exists in B2"""
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=storage_key)
+            return True
+        except ClientError:
+            return False
+
+    def download_file_obj(self, storage_key: str, file_obj):
+        """Download file to file-like object"""
+        try:
+            self.s3_client.download_fileobj(self.bucket, storage_key, file_obj)
+        except ClientError as e:
+            raise Exception(f"Failed to download file: {str(e)}")
+
+    def stat(self, storage_key: str) -> dict | None:
+        """Size, ETag, modification time and content type from a HEAD request"""
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=storage_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise Exception(f"Failed to stat file: {str(e)}")
+        return {
+            'size': head['ContentLength'],
+            'etag': head['ETag'].strip('"'),
+            'last_modified': head['LastModified'],
+            'content_type': head.get('ContentType'),
+        }
+
+    def iter_range(self, storage_key: str, start: int = 0, end: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """Stream a byte range of an object from B2 with a single ranged GET"""
+        params = {'Bucket': self.bucket, 'Key': storage_key}
+        if start or end is not None:
+            params['Range'] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            body = self.s3_client.get_object(**params)['Body']
+        except ClientError as e:
+            raise Exception(f"Failed to read file: {str(e)}")
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+    def upload_file_obj(self, file_obj, storage_key: str, content_type: str = None):
+        """Upload file-like object to B2"""
+        extra_args = {
+            'ServerSideEncryption': 'AES256'
+        }
+        if content_type:
+            extra_args['ContentType'] = content_type
+            
+        try:
+            self.s3_client.upload_fileobj(
+                file_obj, 
+                self.bucket, 
+                storage_key,
+                ExtraArgs=extra_args
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {str(e)}")
+
+    def put_object_bytes(self, data: bytes, storage_key: str, content_type: str = None, cache_control: str = None):
+        """Upload an in-memory payload to B2 in a single request"""
+        params = {
+            'Bucket': self.bucket,
+            'Key': storage_key,
+            'Body': data,
+            'ServerSideEncryption': 'AES256'
+        }
+        if content_type:
+            params['ContentType'] = content_type
+        if cache_control:
+            params['CacheControl'] = cache_control
+        
+        try:
+            self.s3_client.put_object(**params)
+        except ClientError as e:
+            raise Exception(f"Failed to upload file: {str(e)}")
+
+    def create_multipart_upload(self, storage_key: str, content_type: str = None) -> str:
+        """Start a multipart upload and return its upload ID"""
+        params = {
+            'Bucket': self.bucket,
+            'Key': storage_key,
+            'ServerSideEncryption': 'AES256'
+        }
+        if content_type:
+            params['ContentType'] = content_type
+        
+        try:
+            response = self.s3_client.create_multipart_upload(**params)
+            return response['UploadId']
+        except ClientError as e:
+            raise Exception(f"Failed to start multipart upload: {str(e)}")
+
+    def create_presigned_part_url(
+        self,
+        storage_key: str,
+        upload_id: str,
+        part_number: int,
+        expires_in: int = None
+    ) -> str:
+        """Generate presigned URL for uploading one part of a multipart upload"""
+        if expires_in is None:
+            expires_in = settings.S3_PRESIGNED_URL_EXPIRY
+        
+        try:
+            return self.s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': self.bucket,
+                    'Key': storage_key,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number,
+                },
+                ExpiresIn=expires_in
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to generate part upload URL: {str(e)}")
+
+    def list_parts(self, storage_key: str, upload_id: str) -> list:
+        """List parts already uploaded for a multipart upload"""
+        parts = []
+        marker = 0
+        try:
+            while True:
+                response = self.s3_client.list_parts(
+                    Bucket=self.bucket,
+                    Key=storage_key,
+                    UploadId=upload_id,
+                    PartNumberMarker=marker
+                )
+                parts.extend(response.get('Parts', []))
+                if not response.get('IsTruncated'):
+                    return parts
+                marker = response['NextPartNumberMarker']
+        except ClientError as e:
+            raise Exception(f"Failed to list parts: {str(e)}")
+
+    def list_multipart_uploads(self, prefix: str = "") -> list:
+        """List multipart uploads that were started but never completed or aborted"""
+        uploads = []
+        params = {'Bucket': self.bucket, 'Prefix': prefix}
+        try:
+            while True:
+                response = self.s3_client.list_multipart_uploads(**params)
+                uploads.extend(response.get('Uploads', []))
+                if not response.get('IsTruncated'):
+                    return uploads
+                params['KeyMarker'] = response['NextKeyMarker']
+                params['UploadIdMarker'] = response['NextUploadIdMarker']
+        except ClientError as e:
+            raise Exception(f"Failed to list multipart uploads: {str(e)}")
+
+    def upload_part(self, storage_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """Upload a single part and return its ETag"""
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket,
+                Key=storage_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            return response['ETag']
+        except ClientError as e:
+            raise Exception(f"Failed to upload part {part_number}: {str(e)}")
+
+    def complete_multipart_upload(self, storage_key: str, upload_id: str, parts: list):
+        """Complete a multipart upload from a list of {PartNumber, ETag} dicts"""
+        try:
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=storage_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': sorted(parts, key=lambda p: p['PartNumber'])}
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to complete multipart upload: {str(e)}")
+
+    def abort_multipart_upload(self, storage_key: str, upload_id: str):
+        """Abort a multipart upload and discard its uploaded parts"""
+        try:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=storage_key,
+                UploadId=upload_id
+            )
+        except ClientError as e:
+            raise Exception(f"Failed to abort multipart upload: {str(e)}")
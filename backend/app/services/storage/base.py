@@ -0,0 +1,206 @@
+"""
+The storage backend interface.
+
+Every backend implements the blocking methods below; Celery tasks call them
+directly. Request handlers use the ``a``-prefixed async twins, which run the
+blocking call on the bounded storage I/O pool - or inline for backends whose
+calls never block - so storage I/O never stalls the event loop.
+"""
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from urllib.parse import quote
+from app.config import settings
+from app.core.metrics import observe_storage
+
+# Bounded pool for blocking storage calls so storage I/O never runs on the event loop
+storage_executor = ThreadPoolExecutor(
+    max_workers=settings.STORAGE_IO_WORKERS,
+    thread_name_prefix="storage-io"
+)
+
+async def run_storage_io(func, *args, **kwargs):
+    """Run a blocking storage call on the storage I/O pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor, partial(func, *args, **kwargs))
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+def _offloaded(name: str):
+    """Async twin of the blocking method ``name``"""
+    async def method(self, *args, **kwargs):
+        func = getattr(self, name)
+        start = time.perf_counter()
+        try:
+            if not self.blocking_io:
+                result = func(*args, **kwargs)
+            else:
+                result = await run_storage_io(func, *args, **kwargs)
+        except Exception:
+            observe_storage(self.name, name, start, ok=False)
+            raise
+        observe_storage(self.name, name, start)
+        return result
+    method.__name__ = f"a{name}"
+    method.__doc__ = f"Async {name}"
+    return method
+
+class StorageBackend:
+    """Interface implemented by every storage backend"""
+    name = None
+    # False for backends whose calls never block (the async twins run inline)
+    blocking_io = True
+    # True when clients can upload straight to storage through presigned URLs
+    presigned_uploads = False
+
+    def generate_storage_key(self, user_id: str, filename: str) -> str:
+        """Generate a unique key for a user's upload"""
+        timestamp = datetime.utcnow().isoformat()
+        unique_id = hashlib.sha256(f"{user_id}{filename}{timestamp}".encode()).hexdigest()[:16]
+        return f"users/{user_id}/files/{unique_id}/{filename}"
+
+    # Objects
+
+    def put_object_bytes(self, data: bytes, storage_key: str, content_type: str = None, cache_control: str = None):
+        """Store an in-memory payload in a single request"""
+        raise NotImplementedError
+
+    def upload_file_obj(self, file_obj, storage_key: str, content_type: str = None):
+        """Store the contents of a readable file-like object"""
+        raise NotImplementedError
+
+    def stat(self, storage_key: str) -> dict | None:
+        """{size, etag, last_modified, content_type} of an object, or None when it doesn't exist"""
+        raise NotImplementedError
+
+    def iter_range(self, storage_key: str, start: int = 0, end: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """Yield the bytes from start to end (inclusive, None for the end of the object)"""
+        raise NotImplementedError
+
+    def delete_file(self, storage_key: str) -> bool:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every object under a key prefix, returning how many went"""
+        raise NotImplementedError
+
+    def delete_files(self, storage_keys: list) -> list:
+        """Delete many objects, returning the keys that could not be deleted"""
+        failed = []
+        for storage_key in storage_keys:
+            try:
+                self.delete_file(storage_key)
+            except Exception:
+                failed.append(storage_key)
+        return failed
+
+    def local_path(self, storage_key: str) -> str | None:
+        """Filesystem path of the object when it can be served zero-copy, else None"""
+        return None
+
+    def check_file_exists(self, storage_key: str) -> bool:
+        return self.stat(storage_key) is not None
+
+    def download_file_obj(self, storage_key: str, file_obj):
+        """Write an object into a writable file-like object"""
+        for chunk in self.iter_range(storage_key):
+            file_obj.write(chunk)
+
+    def compute_sha256(self, storage_key: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> tuple[int, str]:
+        """Stream an object and return (size_bytes, sha256 hexdigest)"""
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in self.iter_range(storage_key, chunk_size=chunk_size):
+            digest.update(chunk)
+            size += len(chunk)
+        return size, digest.hexdigest()
+
+    # Multipart uploads
+
+    def create_multipart_upload(self, storage_key: str, content_type: str = None) -> str:
+        """Start a multipart upload and return its upload ID"""
+        raise NotImplementedError
+
+    def upload_part(self, storage_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """Upload a single part and return its ETag"""
+        raise NotImplementedError
+
+    def list_parts(self, storage_key: str, upload_id: str) -> list:
+        """Parts already uploaded, as {PartNumber, ETag, Size} dicts"""
+        raise NotImplementedError
+
+    def complete_multipart_upload(self, storage_key: str, upload_id: str, parts: list):
+        """Assemble the object from a list of {PartNumber, ETag} dicts"""
+        raise NotImplementedError
+
+    def abort_multipart_upload(self, storage_key: str, upload_id: str):
+        """Abort a multipart upload and discard its uploaded parts"""
+        raise NotImplementedError
+
+    def list_multipart_uploads(self, prefix: str = "") -> list:
+        """Unfinished uploads, as {Key, UploadId, Initiated} dicts"""
+        raise NotImplementedError
+
+    # URLs - backends without presigning hand out authenticated proxy URLs
+
+    def create_presigned_upload_url(self, storage_key: str, content_type: str, expires_in: int = None) -> str:
+        raise NotImplementedError(f"{self.name} storage does not support presigned uploads")
+
+    def create_presigned_part_url(self, storage_key: str, upload_id: str, part_number: int, expires_in: int = None) -> str:
+        raise NotImplementedError(f"{self.name} storage does not support presigned uploads")
+
+    def create_presigned_download_url(self, storage_key: str, expires_in: int = None, filename: str = None) -> str:
+        return self._proxy_url(storage_key, "attachment")
+
+    def create_presigned_view_url(self, storage_key: str, content_type: str, expires_in: int = None) -> str:
+        return self._proxy_url(storage_key, "inline")
+
+    def create_presigned_view_urls(self, items: list) -> list:
+        """Inline-view URLs for many (storage_key, content_type) pairs at once"""
+        return [self.create_presigned_view_url(storage_key, content_type) for storage_key, content_type in items]
+
+    def _proxy_url(self, storage_key: str, disposition: str) -> str:
+        return f"{settings.API_V1_PREFIX}/files/download/proxy?key={quote(storage_key, safe='')}&disposition={disposition}"
+
+    # Async twins for request handlers
+
+    aput_object_bytes = _offloaded("put_object_bytes")
+    astat = _offloaded("stat")
+    adelete_file = _offloaded("delete_file")
+    adelete_prefix = _offloaded("delete_prefix")
+    acreate_multipart_upload = _offloaded("create_multipart_upload")
+    aupload_part = _offloaded("upload_part")
+    alist_parts = _offloaded("list_parts")
+    acomplete_multipart_upload = _offloaded("complete_multipart_upload")
+    aabort_multipart_upload = _offloaded("abort_multipart_upload")
+
+    async def aiter_range(self, storage_key: str, start: int = 0, end: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """Async iter_range - each chunk is fetched off the event loop"""
+        chunks = self.iter_range(storage_key, start, end, chunk_size)
+        if not self.blocking_io:
+            for chunk in chunks:
+                yield chunk
+            return
+
+        done = object()
+        # Latency is the time to the first chunk; the rest is paced by the consumer
+        requested = time.perf_counter()
+        try:
+            while True:
+                try:
+                    chunk = await run_storage_io(next, chunks, done)
+                except Exception:
+                    if requested is not None:
+                        observe_storage(self.name, "iter_range", requested, ok=False)
+                    raise
+                if requested is not None:
+                    observe_storage(self.name, "iter_range", requested)
+                    requested = None
+                if chunk is done:
+                    return
+                yield chunk
+        finally:
+            await run_storage_io(chunks.close)
@@ -0,0 +1,182 @@
+"""
+Objects as files under ``Settings.LOCAL_STORAGE_PATH`` (``./uploads`` by default).
+
+Lets the whole stack run on one box with no network, and serves hot files
+from local disk: downloads go out through ``local_path`` as file responses,
+which support range requests and hand the file to the server for zero-copy
+sending where it supports it. Writes land in a temporary file first and are
+renamed into place, so readers never see a partial object.
+"""
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime
+from pathlib import Path
+from app.services.storage.base import StorageBackend, DEFAULT_CHUNK_SIZE
+
+MULTIPART_DIR = ".multipart"
+
+class LocalStorageBackend(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = Path(root).resolve()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, storage_key: str) -> Path:
+        path = (self.root / storage_key).resolve()
+        if self.root not in path.parents or path.parts[len(self.root.parts)] == MULTIPART_DIR:
+            raise ValueError(f"Invalid storage key: {storage_key}")
+        return path
+
+    def _write(self, path: Path, write):
+        """Write through a temporary file in the target directory, then rename it into place"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                write(out)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put_object_bytes(self, data: bytes, storage_key: str, content_type: str = None, cache_control: str = None):
+        self._write(self._path(storage_key), lambda out: out.write(data))
+
+    def upload_file_obj(self, file_obj, storage_key: str, content_type: str = None):
+        self._write(self._path(storage_key), lambda out: shutil.copyfileobj(file_obj, out, DEFAULT_CHUNK_SIZE))
+
+    def stat(self, storage_key: str) -> dict | None:
+        try:
+            st = self._path(storage_key).stat()
+        except FileNotFoundError:
+            return None
+        return {
+            "size": st.st_size,
+            # Changes whenever the file is replaced, like nginx's ETags
+            "etag": f"{st.st_mtime_ns:x}-{st.st_size:x}",
+            "last_modified": datetime.utcfromtimestamp(st.st_mtime),
+            "content_type": None,
+        }
+
+    def iter_range(self, storage_key: str, start: int = 0, end: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        with open(self._path(storage_key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def local_path(self, storage_key: str) -> str | None:
+        return str(self._path(storage_key))
+
+    def delete_file(self, storage_key: str) -> bool:
+        try:
+            self._path(storage_key).unlink()
+        except FileNotFoundError:
+            pass
+        return True
+
+    def delete_prefix(self, prefix: str) -> int:
+        # Walk from the deepest directory the prefix names, matching the rest by name
+        base = self.root / prefix
+        top = (base if prefix.endswith("/") else base.parent).resolve()
+        if (top != self.root and self.root not in top.parents) or not top.is_dir():
+            return 0
+        deleted = 0
+        for dirpath, dirnames, filenames in os.walk(top):
+            if Path(dirpath) == self.root and MULTIPART_DIR in dirnames:
+                dirnames.remove(MULTIPART_DIR)
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                key = path.relative_to(self.root).as_posix()
+                if key.startswith(prefix) and not filename.startswith(".tmp-"):
+                    path.unlink(missing_ok=True)
+                    deleted += 1
+        return deleted
+
+    # Multipart uploads keep their parts under .multipart/{upload_id}/
+
+    def _upload_dir(self, upload_id: str) -> Path:
+        if not upload_id.isalnum():
+            raise ValueError(f"Invalid upload id: {upload_id}")
+        return self.root / MULTIPART_DIR / upload_id
+
+    def _check_upload(self, storage_key: str, upload_id: str) -> Path:
+        upload_dir = self._upload_dir(upload_id)
+        try:
+            if (upload_dir / "key").read_text() != storage_key:
+                raise FileNotFoundError(upload_id)
+        except FileNotFoundError:
+            raise Exception(f"No such upload: {upload_id}")
+        return upload_dir
+
+    def create_multipart_upload(self, storage_key: str, content_type: str = None) -> str:
+        self._path(storage_key)
+        upload_id = uuid.uuid4().hex
+        upload_dir = self._upload_dir(upload_id)
+        upload_dir.mkdir(parents=True)
+        (upload_dir / "key").write_text(storage_key)
+        return upload_id
+
+    def upload_part(self, storage_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        upload_dir = self._check_upload(storage_key, upload_id)
+        self._write(upload_dir / f"{part_number:05d}", lambda out: out.write(data))
+        return self._part_etag(upload_dir / f"{part_number:05d}")
+
+    def _part_etag(self, path: Path) -> str:
+        st = path.stat()
+        return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+    def list_parts(self, storage_key: str, upload_id: str) -> list:
+        upload_dir = self._check_upload(storage_key, upload_id)
+        return [
+            {"PartNumber": int(path.name), "ETag": self._part_etag(path), "Size": path.stat().st_size}
+            for path in sorted(upload_dir.iterdir())
+            if path.name.isdigit()
+        ]
+
+    def complete_multipart_upload(self, storage_key: str, upload_id: str, parts: list):
+        upload_dir = self._check_upload(storage_key, upload_id)
+        paths = []
+        for part in sorted(parts, key=lambda p: p["PartNumber"]):
+            path = upload_dir / f"{part['PartNumber']:05d}"
+            if not path.exists() or self._part_etag(path) != part["ETag"].strip('"'):
+                raise Exception(f"Invalid part {part['PartNumber']}")
+            paths.append(path)
+
+        def assemble(out):
+            for path in paths:
+                with open(path, "rb") as f:
+                    shutil.copyfileobj(f, out, DEFAULT_CHUNK_SIZE)
+
+        self._write(self._path(storage_key), assemble)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def abort_multipart_upload(self, storage_key: str, upload_id: str):
+        upload_dir = self._check_upload(storage_key, upload_id)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    def list_multipart_uploads(self, prefix: str = "") -> list:
+        uploads = []
+        multipart_dir = self.root / MULTIPART_DIR
+        if not multipart_dir.is_dir():
+            return uploads
+        for upload_dir in multipart_dir.iterdir():
+            try:
+                key = (upload_dir / "key").read_text()
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if key.startswith(prefix):
+                uploads.append({
+                    "Key": key,
+                    "UploadId": upload_dir.name,
+                    "Initiated": datetime.utcfromtimestamp(upload_dir.stat().st_ctime),
+                })
+        return uploads
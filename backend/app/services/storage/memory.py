@@ -0,0 +1,120 @@
+"""
+In-process storage for tests, benchmarks and single-process development.
+
+Objects live in a dict, so nothing survives a restart and separate processes
+(the API and a Celery worker) don't see each other's objects - run workers
+eagerly when using it with the full stack.
+"""
+import hashlib
+import threading
+import uuid
+from datetime import datetime
+from app.services.storage.base import StorageBackend, DEFAULT_CHUNK_SIZE
+
+class MemoryStorageBackend(StorageBackend):
+    name = "memory"
+    blocking_io = False
+
+    def __init__(self):
+        self._objects = {}  # key -> {data, etag, last_modified, content_type}
+        self._uploads = {}  # upload id -> {key, content_type, parts, initiated}
+        self._lock = threading.Lock()
+
+    def put_object_bytes(self, data: bytes, storage_key: str, content_type: str = None, cache_control: str = None):
+        data = bytes(data)
+        with self._lock:
+            self._objects[storage_key] = {
+                "data": data,
+                "etag": hashlib.md5(data).hexdigest(),
+                "last_modified": datetime.utcnow(),
+                "content_type": content_type,
+            }
+
+    def upload_file_obj(self, file_obj, storage_key: str, content_type: str = None):
+        self.put_object_bytes(file_obj.read(), storage_key, content_type)
+
+    def stat(self, storage_key: str) -> dict | None:
+        obj = self._objects.get(storage_key)
+        if obj is None:
+            return None
+        return {
+            "size": len(obj["data"]),
+            "etag": obj["etag"],
+            "last_modified": obj["last_modified"],
+            "content_type": obj["content_type"],
+        }
+
+    def iter_range(self, storage_key: str, start: int = 0, end: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        obj = self._objects.get(storage_key)
+        if obj is None:
+            raise FileNotFoundError(storage_key)
+        view = memoryview(obj["data"])[start:None if end is None else end + 1]
+        for offset in range(0, len(view), chunk_size):
+            yield bytes(view[offset:offset + chunk_size])
+
+    def delete_file(self, storage_key: str) -> bool:
+        with self._lock:
+            self._objects.pop(storage_key, None)
+        return True
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self._objects if key.startswith(prefix)]
+            for key in keys:
+                del self._objects[key]
+        return len(keys)
+
+    def create_multipart_upload(self, storage_key: str, content_type: str = None) -> str:
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {
+                "key": storage_key,
+                "content_type": content_type,
+                "parts": {},
+                "initiated": datetime.utcnow(),
+            }
+        return upload_id
+
+    def _upload(self, storage_key: str, upload_id: str) -> dict:
+        upload = self._uploads.get(upload_id)
+        if upload is None or upload["key"] != storage_key:
+            raise Exception(f"No such upload: {upload_id}")
+        return upload
+
+    def upload_part(self, storage_key: str, upload_id: str, part_number: int, data: bytes) -> str:
+        data = bytes(data)
+        etag = hashlib.md5(data).hexdigest()
+        with self._lock:
+            self._upload(storage_key, upload_id)["parts"][part_number] = (etag, data)
+        return etag
+
+    def list_parts(self, storage_key: str, upload_id: str) -> list:
+        parts = self._upload(storage_key, upload_id)["parts"]
+        return [
+            {"PartNumber": n, "ETag": etag, "Size": len(data)}
+            for n, (etag, data) in sorted(parts.items())
+        ]
+
+    def complete_multipart_upload(self, storage_key: str, upload_id: str, parts: list):
+        upload = self._upload(storage_key, upload_id)
+        stored = upload["parts"]
+        chunks = []
+        for part in sorted(parts, key=lambda p: p["PartNumber"]):
+            etag, data = stored.get(part["PartNumber"], (None, None))
+            if etag is None or etag != part["ETag"].strip('"'):
+                raise Exception(f"Invalid part {part['PartNumber']}")
+            chunks.append(data)
+        self.put_object_bytes(b"".join(chunks), storage_key, upload["content_type"])
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+    def abort_multipart_upload(self, storage_key: str, upload_id: str):
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+
+    def list_multipart_uploads(self, prefix: str = "") -> list:
+        return [
+            {"Key": upload["key"], "UploadId": upload_id, "Initiated": upload["initiated"]}
+            for upload_id, upload in list(self._uploads.items())
+            if upload["key"].startswith(prefix)
+        ]
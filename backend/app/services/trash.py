@@ -0,0 +1,69 @@
+"""
+The trash: deleted files are kept for TRASH_RETENTION_DAYS, then purged.
+
+Deleting a file only sets ``deleted_at`` (and gives the storage back), so it
+can be restored until the purge job removes it. Purging walks expired rows in
+keyset batches on (deleted_at, id), hard-deletes them and releases their blob
+references - ``gc_blobs`` then removes objects nothing points at any more.
+Objects that never became blobs (uploads abandoned before their checksum was
+known) are deleted straight away, in DeleteObjects-sized batches, unless
+another file row still points at the same key.
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, tuple_
+from app.config import settings
+from app.models.file import File
+from app.services.blobs import release_blob_refs_sync
+
+logger = logging.getLogger(__name__)
+
+def purge_after(deleted_at: datetime) -> datetime:
+    return deleted_at + timedelta(days=settings.TRASH_RETENTION_DAYS)
+
+def purge_expired_files_sync(db, storage, batch_size: int = 500, cutoff: datetime = None) -> int:
+    """
+    Hard-delete files deleted before cutoff (default: the retention window
+    ago), one batch per transaction. Returns how many rows went.
+    """
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=settings.TRASH_RETENTION_DAYS)
+    purged = 0
+    last = None
+    while True:
+        query = (
+            select(File.id, File.deleted_at, File.checksum_sha256, File.storage_key)
+            .where(File.deleted_at < cutoff)
+            .order_by(File.deleted_at, File.id)
+            .limit(batch_size)
+            # A restore racing the purge either wins or waits for this batch
+            .with_for_update(skip_locked=True)
+        )
+        if last is not None:
+            query = query.where(tuple_(File.deleted_at, File.id) > last)
+        rows = db.execute(query).all()
+        if not rows:
+            break
+        last = (rows[-1].deleted_at, rows[-1].id)
+
+        db.execute(
+            delete(File)
+            .where(File.id.in_([row.id for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        release_blob_refs_sync(db, [row.checksum_sha256 for row in rows])
+
+        # Keys outside the blob table are only safe to drop once no file uses them
+        unblobbed = {row.storage_key for row in rows if row.checksum_sha256 in (None, "pending")}
+        if unblobbed:
+            in_use = db.execute(
+                select(File.storage_key).where(File.storage_key.in_(unblobbed)).distinct()
+            ).scalars().all()
+            unblobbed.difference_update(in_use)
+        db.commit()
+        purged += len(rows)
+
+        if unblobbed:
+            failed = storage.delete_files(sorted(unblobbed))
+            if failed:
+                logger.warning(f"Failed to delete {len(failed)} purged objects, e.g. {failed[0]}")
+    return purged
@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+from app.config import settings
+
+class UploadTooLarge(Exception):
+    """Raised when a streamed upload exceeds its size limit"""
+    pass
+
+class StreamingUpload:
+    """
+    Stream an upload to storage in fixed-size parts.
+
+    Size and SHA-256 are computed as bytes pass through, parts are pushed to
+    storage on the bounded storage I/O pool, and at most
+    UPLOAD_MAX_PARTS_IN_FLIGHT parts are buffered at once. Uploads smaller than
+    one part are sent with a single PUT instead of a multipart upload.
+    """
+
+    def __init__(
+        self,
+        storage,
+        storage_key: str,
+        content_type: str = None,
+        max_size: int = None,
+        part_size: int = None,
+        max_in_flight: int = None
+    ):
+        self.storage = storage
+        self.storage_key = storage_key
+        self.content_type = content_type
+        self.max_size = max_size
+        self.part_size = part_size or settings.UPLOAD_PART_SIZE_MB * 1024 * 1024
+
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._next_part = 1
+        self._pending = set()
+        self._parts = []
+        self._error = None
+        self._slots = asyncio.Semaphore(max_in_flight or settings.UPLOAD_MAX_PARTS_IN_FLIGHT)
+
+    async def write(self, chunk: bytes):
+        """Feed the next chunk of the upload"""
+        if not chunk:
+            return
+
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise UploadTooLarge()
+
+        self._sha256.update(chunk)
+        self._buffer.extend(chunk)
+
+        while len(self._buffer) >= self.part_size:
+            data = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._send_part(data)
+
+    async def finish(self) -> tuple[int, str]:
+        """Flush remaining bytes and return (size_bytes, sha256 hexdigest)"""
+        if self._upload_id is None:
+            # Fits in a single part - skip the multipart round-trips
+            await self.storage.aput_object_bytes(
+                bytes(self._buffer),
+                self.storage_key,
+                self.content_type
+            )
+        else:
+            if self._buffer:
+                await self._send_part(bytes(self._buffer))
+            self._buffer.clear()
+            await self._drain()
+            await self.storage.acomplete_multipart_upload(
+                self.storage_key,
+                self._upload_id,
+                self._parts
+            )
+
+        return self.size, self._sha256.hexdigest()
+
+    async def abort(self):
+        """Discard anything already sent to storage"""
+        self._buffer.clear()
+        if self._upload_id is None:
+            return
+
+        # Let parts in flight finish first: cancelling the task doesn't stop the
+        # executor thread, and a part landing after the abort would outlive it
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        await self.storage.aabort_multipart_upload(self.storage_key, self._upload_id)
+
+    async def _send_part(self, data: bytes):
+        if self._upload_id is None:
+            self._upload_id = await self.storage.acreate_multipart_upload(
+                self.storage_key,
+                self.content_type
+            )
+
+        # Back-pressure: wait for a free slot before buffering another part
+        await self._slots.acquire()
+        if self._error:
+            self._slots.release()
+            raise self._error
+
+        part_number = self._next_part
+        self._next_part += 1
+        task = asyncio.create_task(self._upload_part(part_number, data))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _upload_part(self, part_number: int, data: bytes):
+        try:
+            etag = await self.storage.aupload_part(
+                self.storage_key,
+                self._upload_id,
+                part_number,
+                data
+            )
+            self._parts.append({'PartNumber': part_number, 'ETag': etag})
+        except Exception as e:
+            self._error = self._error or e
+        finally:
+            self._slots.release()
+
+    async def _drain(self):
+        if self._pending:
+            await asyncio.gather(*self._pending)
+        if self._error:
+            raise self._error
@@ -0,0 +1,59 @@
+"""
+Cached user principals for the auth dependency.
+
+An in-process LRU sits in front of Redis so the common path costs neither a
+database nor a network round-trip. The local TTL is kept short because other
+processes only learn about invalidations through Redis.
+"""
+import uuid
+from sqlalchemy.orm import make_transient_to_detached
+from app.config import settings
+from app.core.cache import LocalTTLCache, cache_get_json, cache_set_json, invalidate_on_commit
+from app.models.user import User
+
+PRINCIPAL_FIELDS = (
+    "email",
+    "phone",
+    "name",
+    "role",
+    "plan",
+    "is_active",
+    "is_verified",
+    "avatar_url",
+    "storage_used_bytes",
+    "storage_quota_bytes",
+)
+
+_local_principals = LocalTTLCache(maxsize=settings.USER_CACHE_LOCAL_SIZE, ttl=settings.USER_CACHE_LOCAL_TTL)
+
+def _principal_key(user_id) -> str:
+    return f"user:principal:{user_id}"
+
+async def get_cached_principal(user_id: str) -> dict | None:
+    key = _principal_key(user_id)
+    principal = _local_principals.get(key)
+    if principal is None:
+        principal = await cache_get_json(key)
+        if principal is not None:
+            _local_principals.set(key, principal)
+    return principal
+
+async def cache_principal(user: User):
+    principal = {"id": str(user.id)}
+    principal.update({field: getattr(user, field) for field in PRINCIPAL_FIELDS})
+    key = _principal_key(user.id)
+    _local_principals.set(key, principal)
+    await cache_set_json(key, principal, ttl=settings.USER_CACHE_TTL)
+
+def user_from_principal(principal: dict) -> User:
+    """Rebuild a detached User from a cached principal, ready for session.merge(load=False)"""
+    user = User(id=uuid.UUID(principal["id"]), **{field: principal[field] for field in PRINCIPAL_FIELDS})
+    make_transient_to_detached(user)
+    return user
+
+def invalidate_user(db, user_id):
+    """Drop the cached principal once the current transaction commits.
+
+    Call this whenever quota, plan, is_active or profile fields change.
+    """
+    invalidate_on_commit(db, _principal_key(user_id))
@@ -0,0 +1,85 @@
+"""
+Publishes the task outbox to the Celery broker.
+
+    python -m app.workers.outbox_relay
+
+Run one next to the Celery workers (more are safe - they claim disjoint
+batches). Full batches are sent back to back; otherwise the relay polls every
+OUTBOX_POLL_SECONDS. It holds off while the Celery queues are deeper than
+OUTBOX_MAX_QUEUE_DEPTH, and backs off exponentially while the broker or the
+database is unreachable - messages wait in the table meanwhile.
+"""
+import logging
+import signal
+import threading
+import redis
+from app.config import settings
+from app.core.celery_app import celery_app
+from app.core.metrics import celery_queues, serve_metrics
+from app.db.session import SessionLocal
+from app.services.outbox import OutboxPublishError, relay_batch_sync, retry_delay
+
+logger = logging.getLogger(__name__)
+
+class Relay:
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.stop = threading.Event()
+        self._broker = redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=2, socket_connect_timeout=2)
+        self._queues = sorted(celery_queues())
+
+    def queue_depth(self) -> int:
+        with self._broker.pipeline(transaction=False) as pipe:
+            for queue in self._queues:
+                pipe.llen(queue)
+            return sum(pipe.execute())
+
+    def relay_once(self) -> int:
+        """Publish one batch over a single broker connection"""
+        db = SessionLocal()
+        try:
+            with celery_app.producer_or_acquire() as producer:
+                return relay_batch_sync(
+                    db,
+                    lambda task_name, args: celery_app.send_task(task_name, args=args, producer=producer),
+                    self.batch_size
+                )
+        finally:
+            db.close()
+
+    def run(self):
+        failures = 0
+        while not self.stop.is_set():
+            try:
+                if self.queue_depth() >= settings.OUTBOX_MAX_QUEUE_DEPTH:
+                    # Back-pressure: let the workers catch up before adding more
+                    self.stop.wait(settings.OUTBOX_POLL_SECONDS)
+                    continue
+                sent = self.relay_once()
+            except (OutboxPublishError, redis.RedisError) as e:
+                failures += 1
+                logger.warning(f"Outbox relay: broker unavailable, retrying: {e}")
+                self.stop.wait(retry_delay(failures).total_seconds())
+                continue
+            except Exception:
+                failures += 1
+                logger.exception("Outbox relay failed")
+                self.stop.wait(retry_delay(failures).total_seconds())
+                continue
+            
+            failures = 0
+            if sent < self.batch_size:
+                self.stop.wait(settings.OUTBOX_POLL_SECONDS)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    relay = Relay()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: relay.stop.set())
+    if settings.OUTBOX_RELAY_METRICS_PORT:
+        serve_metrics(settings.OUTBOX_RELAY_METRICS_PORT)
+    logger.info(f"Outbox relay started (batches of {relay.batch_size})")
+    relay.run()
+
+if __name__ == "__main__":
+    main()
@@ -1,127 +1,393 @@
-import io
-import pytesseract
-from PIL import Image
-from pdf2image import convert_from_bytes
+import tempfile
+import time
 from celery import shared_task
 from app.core.celery_app import celery_app
-from app.services.storage import storage_service
+from app.services import media
+from app.services.storage import get_storage, storage_executor
+from app.services.renditions import rendition_key, pick_rendition
 # from app.db.session import SessionLocal
+from app.models import user, folder, share, upload
 from app.models.file import File
-from sqlalchemy import update
+from app.models.upload import UploadSession
+from app.models.blob import Blob
+from app.services.blobs import acquire_blob_sync
+from app.services.quota import adjust_storage_sync, charge_storage_sync, reconcile_storage_sync
+from app.services.trash import purge_expired_files_sync
+from app.services.folder_tree import invalidate_folder_tree
+from app.services.user_cache import invalidate_user
+from app.services.search import schedule_index
+from app.services.outbox import enqueue
+from app.config import settings
+from sqlalchemy import select, update, delete, or_
+from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
-@shared_task(name="process_file_ocr")
-def process_file_ocr(file_id: str, storage_key: str, mime_type: str):
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _store_renditions(content_id: str, renditions: list) -> tuple[dict, str]:
+    """Upload renditions and return (preview_urls, legacy thumbnail key)"""
+    entries = []
+    uploads = []
+    for rendition in renditions:
+        key = rendition_key(content_id, rendition["width"], rendition["format"])
+        entries.append({
+            "width": rendition["width"],
+            "height": rendition["height"],
+            "format": rendition["format"],
+            "content_type": rendition["content_type"],
+            "key": key,
+            "size_bytes": len(rendition["data"]),
+        })
+        uploads.append(storage_executor.submit(
+            get_storage().put_object_bytes,
+            rendition["data"],
+            key,
+            rendition["content_type"],
+            IMMUTABLE_CACHE_CONTROL
+        ))
+    for future in uploads:
+        future.result()
+    
+    preview_urls = {"renditions": entries}
+    thumbnail = pick_rendition(preview_urls, settings.THUMBNAIL_DEFAULT_WIDTH, {"jpeg"})
+    return preview_urls, thumbnail["key"] if thumbnail else None
+
+def _run_media_pipeline(file_id: str, stages=media.STAGES):
     """
-    Extract text from image or PDF and update file record.
+    Download a file once and run the requested media stages over it, skipping
+    work that is already done for this file or for another copy of its blob.
     """
-    logger.info(f"Starting OCR for file {file_id}")
+    from app.db.session import SessionLocal
     
+    db = SessionLocal()
     try:
-        # Download file
-        file_obj = io.BytesIO()
-        storage_service.download_file_obj(storage_key, file_obj)
-        file_obj.seek(0)
+        file = db.execute(select(File).where(File.id == file_id)).scalar_one_or_none()
+        if file is None or not media.is_processable(file.mime_type):
+            return
         
-        extracted_text = ""
+        storage_key, mime_type, checksum = file.storage_key, file.mime_type, file.checksum_sha256
+        metadata = dict(file.extracted_metadata or {})
+        has_renditions = bool((file.preview_urls or {}).get("renditions"))
+        same_content = File.checksum_sha256 == checksum if checksum != "pending" else File.id == file_id
+        without_renditions = or_(File.preview_urls.is_(None), ~File.preview_urls.has_key("renditions"))
         
-        if mime_type.startswith("image/"):
-            image = Image.open(file_obj)
-            extracted_text = pytesseract.image_to_string(image)
-            
-        elif mime_type == "application/pdf":
-            # Convert PDF to images
-            images = convert_from_bytes(file_obj.read())
-            for image in images:
-                extracted_text += pytesseract.image_to_string(image) + "\n"
-        
-        if extracted_text:
-            # Update database
-            # Note: In a real app, we might want to store this in a separate table or search index
-            # For now, we'll assume there's a 'content_text' column or similar, 
-            # or we just log it as a proof of concept if the column doesn't exist yet.
+        # Reuse results from any earlier copy of the same blob
+        reused = {}
+        if "ocr" in stages and not file.ocr_completed:
+            done = db.execute(
+                select(File.ocr_text).where(same_content, File.ocr_completed.is_(True)).limit(1)
+            ).first()
+            if done is not None:
+                reused["ocr"] = done.ocr_text
+        if "renditions" in stages and not has_renditions:
+            done = db.execute(
+                select(File.preview_urls, File.thumbnail_url).where(same_content, ~without_renditions).limit(1)
+            ).first()
+            if done is not None:
+                reused["renditions"] = (done.preview_urls, done.thumbnail_url)
+        if reused:
+            logger.info(f"Reusing {', '.join(reused)} for {file_id} from blob {checksum}")
+        
+        todo = tuple(
+            stage for stage in stages
+            if stage not in reused
+            and not (stage == "ocr" and file.ocr_completed)
+            and not (stage == "renditions" and has_renditions)
+        )
+        if not todo and not reused:
+            return
+        db.rollback()  # don't sit in a transaction while the file is processed
+        
+        ocr_text = reused.get("ocr")
+        preview_urls, thumbnail_key = reused.get("renditions", (None, None))
+        
+        if todo:
+            logger.info(f"Processing {file_id}: {', '.join(todo)}")
+            timings = {}
+            start = time.perf_counter()
+            # Spool to disk so large PDFs are never fully held in memory
+            with tempfile.NamedTemporaryFile(suffix=".media") as tmp:
+                get_storage().download_file_obj(storage_key, tmp)
+                tmp.flush()
+                timings["download"] = round((time.perf_counter() - start) * 1000, 1)
+                
+                result = media.process_media(tmp.name, mime_type, todo)
             
-            # Let's check if we can update the File model. 
-            # Since I haven't added the column yet, I will just log it for now 
-            # and TODO: Add content_text column to File model.
-            logger.info(f"OCR Complete for {file_id}. Extracted {len(extracted_text)} chars.")
+            if "ocr" in todo:
+                ocr_text = (result.ocr_text or "").strip() or None
+            if result.renditions:
+                upload_start = time.perf_counter()
+                # Content-addressed, so every copy of the blob shares them
+                content_id = checksum if checksum != "pending" else str(file_id)
+                preview_urls, thumbnail_key = _store_renditions(content_id, result.renditions)
+                timings["upload_renditions"] = round((time.perf_counter() - upload_start) * 1000, 1)
             
-            from app.db.session import SessionLocal
-            db = SessionLocal()
-            # try:
-            #     stmt = update(File).where(File.id == file_id).values(content_text=extracted_text)
-            #     db.execute(stmt)
-            #     db.commit()
-            # finally:
-            #     db.close()
-                
+            timings.update(result.timings)
+            metadata.update(result.metadata)
+            metadata["pipeline"] = {
+                "stages": list(todo),
+                "timings_ms": timings,
+                "processed_at": datetime.utcnow().isoformat()
+            }
+            logger.info(f"Processed {file_id} in {round((time.perf_counter() - start) * 1000, 1)}ms: {timings}")
+            db.execute(update(File).where(File.id == file_id).values(extracted_metadata=metadata))
+        
+        # One statement per result for every file backed by this blob
+        updated = []
+        if "ocr" in todo or "ocr" in reused:
+            updated = db.execute(
+                update(File)
+                .where(same_content, File.ocr_completed.isnot(True))
+                .values(ocr_text=ocr_text, ocr_completed=True)
+                .returning(File.id)
+                .execution_options(synchronize_session=False)
+            ).scalars().all()
+        if preview_urls:
+            db.execute(
+                update(File)
+                .where(same_content, without_renditions)
+                .values(preview_urls=preview_urls, thumbnail_url=thumbnail_key)
+                .execution_options(synchronize_session=False)
+            )
+        schedule_index(db, *updated)
+        db.commit()
     except Exception as e:
-        logger.error(f"OCR failed for {file_id}: {str(e)}")
+        logger.error(f"Media processing failed for {file_id}: {str(e)}")
         # Don't raise, just log error so task doesn't retry indefinitely on bad files
+    finally:
+        db.close()
+
+@shared_task(name="process_media")
+def process_media(file_id: str):
+    """Renditions, OCR and metadata extraction from a single download"""
+    _run_media_pipeline(file_id)
+
+# Kept for messages queued before the fused pipeline; new uploads use process_media
+
+@shared_task(name="process_file_ocr")
+def process_file_ocr(file_id: str, storage_key: str = None, mime_type: str = None):
+    _run_media_pipeline(file_id, ("ocr",))
 
 @shared_task(name="generate_thumbnail")
-def generate_thumbnail(file_id: str, storage_key: str, mime_type: str):
+def generate_thumbnail(file_id: str, storage_key: str = None, mime_type: str = None):
+    _run_media_pipeline(file_id, ("renditions",))
+
+@shared_task(name="abort_stale_multipart_uploads")
+def abort_stale_multipart_uploads():
     """
-    Generate thumbnail for image/PDF and upload to S3.
+    Abort multipart uploads that were never completed so their parts stop
+    accruing storage, and drop the placeholder file records.
     """
-    logger.info(f"Generating thumbnail for {file_id}")
+    from app.db.session import SessionLocal
     
+    now = datetime.utcnow()
+    db = SessionLocal()
     try:
-        if not (mime_type.startswith("image/") or mime_type == "application/pdf"):
+        stale = db.execute(
+            select(UploadSession).where(
+                UploadSession.status == "active",
+                UploadSession.expires_at < now
+            ).limit(500)
+        ).scalars().all()
+        
+        for upload_session in stale:
+            try:
+                get_storage().abort_multipart_upload(upload_session.storage_key, upload_session.upload_id)
+            except Exception as e:
+                # Already gone in storage - still clean up the DB side
+                logger.warning(f"Abort failed for upload {upload_session.upload_id}: {str(e)}")
+        
+        if stale:
+            session_ids = [s.id for s in stale]
+            file_ids = [s.file_id for s in stale]
+            db.execute(
+                update(UploadSession).where(UploadSession.id.in_(session_ids)).values(status="aborted")
+            )
+            # Sessions cascade with their placeholder file rows
+            db.execute(
+                delete(File).where(File.id.in_(file_ids), File.status == "uploading")
+            )
+            db.commit()
+        
+        # Orphaned uploads storage knows about but no session tracks
+        # (e.g. a streaming upload whose worker died mid-transfer)
+        active_ids = set(db.execute(
+            select(UploadSession.upload_id).where(UploadSession.status == "active")
+        ).scalars().all())
+        cutoff = now - timedelta(hours=settings.MULTIPART_UPLOAD_EXPIRY_HOURS)
+        orphans = 0
+        
+        for pending in get_storage().list_multipart_uploads(prefix="users/"):
+            initiated = pending["Initiated"].replace(tzinfo=None)
+            if pending["UploadId"] in active_ids or initiated >= cutoff:
+                continue
+            try:
+                get_storage().abort_multipart_upload(pending["Key"], pending["UploadId"])
+                orphans += 1
+            except Exception as e:
+                logger.warning(f"Abort failed for orphaned upload {pending['UploadId']}: {str(e)}")
+        
+        logger.info(f"Aborted {len(stale)} stale and {orphans} orphaned multipart uploads")
+    finally:
+        db.close()
+
+@shared_task(name="finalize_uploaded_file")
+def finalize_uploaded_file(file_id: str):
+    """
+    Hash a file that was uploaded straight to storage, fold it into an
+    existing blob when the bytes are already stored, then start processing.
+    Until then the file can't be shared, so its row is the only one using the
+    uploaded object.
+    """
+    from app.db.session import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        storage_key = db.execute(
+            select(File.storage_key).where(File.id == file_id, File.checksum_sha256 == "pending")
+        ).scalar_one_or_none()
+        db.commit()
+        if storage_key is None:
             return
-            
-        # Download file
-        file_obj = io.BytesIO()
-        storage_service.download_file_obj(storage_key, file_obj)
-        file_obj.seek(0)
         
-        image = None
+        # Reading the whole object can take a while - hash it before locking the row
+        size_bytes, checksum = get_storage().compute_sha256(storage_key)
         
-        if mime_type.startswith("image/"):
-            image = Image.open(file_obj)
-            
-        elif mime_type == "application/pdf":
-            # Get first page
-            images = convert_from_bytes(file_obj.read(), first_page=1, last_page=1)
-            if images:
-                image = images[0]
-        
-        if image:
-            # Resize
-            image.thumbnail((300, 300))
-            
-            # Save to bytes
-            thumb_io = io.BytesIO()
-            image.save(thumb_io, format="JPEG", quality=85)
-            thumb_io.seek(0)
-            
-            # Upload thumbnail
-            thumb_key = storage_key.rsplit('.', 1)[0] + "_thumb.jpg"
-            storage_service.upload_file_obj(thumb_io, thumb_key, "image/jpeg")
-            
-            # Update DB
-            from app.db.session import SessionLocal
-            db = SessionLocal()
+        file = db.execute(
+            select(File).where(File.id == file_id).with_for_update()
+        ).scalar_one_or_none()
+        if not file or file.checksum_sha256 != "pending" or file.storage_key != storage_key:
+            # Finalized or removed by someone else meanwhile
+            db.rollback()
+            return
+        
+        # Charged at the size seen on completion, but a presigned URL can still
+        # have replaced the object since - anything extra must fit the quota
+        delta = size_bytes - file.size_bytes
+        if size_bytes > settings.MAX_MULTIPART_FILE_SIZE_MB * 1024 * 1024 or (
+            delta > 0 and not charge_storage_sync(db, file.owner_user_id, delta)
+        ):
+            adjust_storage_sync(db, file.owner_user_id, -file.size_bytes)
+            invalidate_user(db, file.owner_user_id)
+            invalidate_folder_tree(db, file.owner_user_id)
+            db.execute(delete(File).where(File.id == file.id))
+            db.commit()
+            get_storage().delete_file(storage_key)
+            logger.warning(f"Deleted upload {file_id}: {size_bytes} bytes exceed the size limit or quota")
+            return
+        if delta:
+            if delta < 0:
+                adjust_storage_sync(db, file.owner_user_id, delta)
+            invalidate_user(db, file.owner_user_id)
+            invalidate_folder_tree(db, file.owner_user_id)
+            file.size_bytes = size_bytes
+        
+        canonical_key, created = acquire_blob_sync(db, checksum, size_bytes, file.storage_key, file.mime_type)
+        
+        duplicate_key = None
+        if not created and canonical_key != file.storage_key:
+            duplicate_key = file.storage_key
+            file.storage_key = canonical_key
+        
+        file.checksum_sha256 = checksum
+        enqueue(db, "process_media", file_id)
+        schedule_index(db, file_id)
+        db.commit()
+        
+        if duplicate_key:
+            get_storage().delete_file(duplicate_key)
+            logger.info(f"File {file_id} deduplicated onto blob {checksum}")
+    except Exception as e:
+        logger.error(f"Finalizing upload failed for {file_id}: {str(e)}")
+    finally:
+        db.close()
+
+@shared_task(name="gc_blobs")
+def gc_blobs(batch_size: int = 500):
+    """Delete blobs no file references any more, along with their stored objects"""
+    from app.db.session import SessionLocal
+    
+    # Grace period so a blob isn't collected between a release and a re-upload
+    cutoff = datetime.utcnow() - timedelta(hours=1)
+    db = SessionLocal()
+    try:
+        # Rows go first: anyone claiming the blob afterwards finds nothing and
+        # uploads fresh bytes instead of pointing at an object we're deleting.
+        deleted = db.execute(
+            delete(Blob)
+            .where(
+                Blob.sha256.in_(
+                    select(Blob.sha256)
+                    .where(Blob.ref_count <= 0, Blob.updated_at < cutoff)
+                    .limit(batch_size)
+                    .with_for_update(skip_locked=True)
+                ),
+                Blob.ref_count <= 0
+            )
+            .returning(Blob.sha256, Blob.storage_key)
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.commit()
+        
+        storage = get_storage()
+        failed = storage.delete_files([storage_key for _, storage_key in deleted])
+        if failed:
+            logger.warning(f"Failed to delete {len(failed)} blob objects, e.g. {failed[0]}")
+        for sha256, _ in deleted:
             try:
-                # We need to construct the full URL or just the key. 
-                # The model expects thumbnail_url.
-                # Assuming public read or presigned url generation on fly.
-                # For now, let's store the key or a flag.
-                # Actually, the FileResponse generates the URL. 
-                # So we should probably store the key or just update a 'has_thumbnail' flag?
-                # Looking at FileResponse in files.py: "thumbnail_url": file.thumbnail_url
-                # So it expects a URL string in the DB.
-                
-                # Let's assume we store the relative path or key.
-                stmt = update(File).where(File.id == file_id).values(thumbnail_url=thumb_key)
-                db.execute(stmt)
-                db.commit()
-            finally:
-                db.close()
-                
-            logger.info(f"Thumbnail generated for {file_id}")
-            
+                storage.delete_prefix(f"renditions/{sha256}/")
+            except Exception as e:
+                logger.warning(f"Failed to delete renditions of {sha256}: {str(e)}")
+        
+        logger.info(f"Garbage-collected {len(deleted)} blobs")
+    finally:
+        db.close()
+
+@shared_task(name="purge_trash")
+def purge_trash():
+    """Permanently remove files that have been in the trash past the retention window"""
+    from app.db.session import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        purged = purge_expired_files_sync(db, get_storage(), settings.TRASH_PURGE_BATCH_SIZE)
+        logger.info(f"Purged {purged} files from the trash")
+    finally:
+        db.close()
+
+@shared_task(name="reconcile_storage_usage")
+def reconcile_storage_usage():
+    """Recompute every user's storage usage from their files, repairing drift"""
+    from app.db.session import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        fixed = reconcile_storage_sync(db)
+        if fixed:
+            logger.warning(f"Storage usage reconciled for {fixed} users")
+    finally:
+        db.close()
+
+@shared_task(name="index_file_search")
+def index_file_search(file_id: str):
+    """Push a file's current state to an external search index (or drop it)"""
+    from app.db.session import SessionLocal
+    from app.services.search import get_search_backend
+    
+    backend = get_search_backend()
+    if not backend.external_index:
+        return
+    
+    db = SessionLocal()
+    try:
+        file = db.execute(select(File).where(File.id == file_id)).scalar_one_or_none()
+        if file is None or file.deleted_at is not None:
+            backend.remove_file(file_id)
+        else:
+            backend.index_file(file)
     except Exception as e:
-        logger.error(f"Thumbnail generation failed for {file_id}: {str(e)}")
+        logger.error(f"Search indexing failed for {file_id}: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,194 @@
+"""
+EXPLAIN regression check for the hot endpoint queries.
+
+Seeds a synthetic dataset inside a transaction, ANALYZEs it and runs EXPLAIN
+on the query each endpoint issues. Exits non-zero if any of them falls back
+to a sequential scan on one of the application tables. Everything is rolled
+back at the end, so it is safe to point at a migrated development database:
+
+    cd backend && python -m benchmarks.explain_check --users 200 --files 100
+"""
+import argparse
+import json
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, or_, text
+from sqlalchemy.dialects import postgresql
+from app.db.session import SessionLocal
+from app.models import user, folder, file, share, upload, blob
+from app.models.user import User
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.share import Share
+from app.core.pagination import created_before, encode_cursor
+from app.services.folder_tree import _tree_query
+
+CHECKED_TABLES = {"users", "files", "folders", "shares"}
+PAGE = 51
+
+def seed(db, users: int, files_per_user: int, folders_per_user: int):
+    now = datetime.utcnow()
+    user_rows = [
+        {
+            "id": uuid.uuid4(),
+            "email": f"explain-{i}-{uuid.uuid4().hex[:8]}@example.com",
+            "name": f"User {i}",
+            "password_hash": "x",
+        }
+        for i in range(users)
+    ]
+    db.execute(insert(User), user_rows)
+
+    folder_rows = [
+        {"id": uuid.uuid4(), "owner_user_id": u["id"], "name": f"Folder {j}", "position": j}
+        for u in user_rows
+        for j in range(folders_per_user)
+    ]
+    db.execute(insert(Folder), folder_rows)
+    folders_by_owner = {}
+    for f in folder_rows:
+        folders_by_owner.setdefault(f["owner_user_id"], []).append(f["id"])
+
+    file_rows = []
+    for u in user_rows:
+        for j in range(files_per_user):
+            sha = uuid.uuid4().hex * 2
+            file_rows.append({
+                "id": uuid.uuid4(),
+                "owner_user_id": u["id"],
+                "folder_id": random.choice(folders_by_owner[u["id"]]),
+                "filename": f"document-{j}.pdf",
+                "original_filename": f"document-{j}.pdf",
+                "size_bytes": random.randint(1024, 10 * 1024 * 1024),
+                "mime_type": "application/pdf",
+                "storage_key": f"blobs/{sha[:2]}/{sha}",
+                "storage_bucket": "explain",
+                "checksum_sha256": sha,
+                "status": "active",
+                "deleted_at": now if j % 20 == 0 else None,
+                "created_at": now - timedelta(minutes=random.randint(0, 60 * 24 * 365)),
+            })
+    db.execute(insert(File), file_rows)
+
+    share_rows = []
+    for f in random.sample(file_rows, len(file_rows) // 2):
+        recipient = random.choice(user_rows)
+        share_rows.append({
+            "id": uuid.uuid4(),
+            "file_id": f["id"],
+            "sender_user_id": f["owner_user_id"],
+            "recipient_user_id": recipient["id"],
+            "recipient_email": recipient["email"],
+            "transaction_id": f"TXN{uuid.uuid4().hex[:16].upper()}",
+            "created_at": f["created_at"],
+        })
+    db.execute(insert(Share), share_rows)
+
+    for table in sorted(CHECKED_TABLES):
+        db.execute(text(f"ANALYZE {table}"))
+
+    return random.choice(user_rows), random.choice(file_rows), random.choice(share_rows)
+
+def endpoint_queries(user_row, file_row, share_row) -> dict:
+    """The statement each endpoint runs, keyed by endpoint"""
+    user_id = user_row["id"]
+    cursor = encode_cursor(file_row["created_at"], file_row["id"])
+    live_files = select(File).where(
+        File.owner_user_id == user_id,
+        File.deleted_at.is_(None),
+        File.status != "hidden"
+    )
+    newest = (File.created_at.desc(), File.id.desc())
+    live_download = select(File).where(File.owner_user_id == user_id, File.deleted_at.is_(None))
+
+    return {
+        "GET /files": live_files.order_by(*newest).limit(PAGE),
+        "GET /files?cursor": live_files.where(created_before(File.created_at, File.id, cursor)).order_by(*newest).limit(PAGE),
+        "GET /files?folder_id": live_files.where(File.folder_id == file_row["folder_id"]).order_by(*newest).limit(PAGE),
+        "GET /files/{id}": select(File).where(File.id == file_row["id"], File.owner_user_id == user_id),
+        "GET /files/download/proxy": live_download.where(File.storage_key == file_row["storage_key"]).limit(1),
+        "GET /files/download/proxy (rendition)": (
+            live_download.where(File.checksum_sha256 == file_row["checksum_sha256"]).limit(1)
+        ),
+        "GET /folders": (
+            select(
+                Folder.id,
+                Folder.parent_folder_id,
+                Folder.name,
+                Folder.description,
+                Folder.icon,
+                Folder.color,
+                Folder.position,
+                Folder.file_count,
+                Folder.total_bytes
+            )
+            .where(Folder.owner_user_id == user_id)
+            .order_by(Folder.position)
+        ),
+        "GET /folders/tree": _tree_query(user_id),
+        "folder by name": select(Folder).where(Folder.owner_user_id == user_id, Folder.name == "Personal"),
+        "DELETE /folders/{id}": select(File.checksum_sha256).where(File.folder_id == file_row["folder_id"]),
+        "GET /shares/sent": (
+            select(Share, File)
+            .join(File, Share.file_id == File.id)
+            .where(Share.sender_user_id == user_id)
+            .order_by(Share.created_at.desc(), Share.id.desc())
+            .limit(PAGE)
+        ),
+        "GET /shares/received": (
+            select(Share, File)
+            .join(File, Share.file_id == File.id)
+            .where(Share.recipient_user_id == user_id)
+            .order_by(Share.created_at.desc(), Share.id.desc())
+            .limit(PAGE)
+        ),
+        "GET /shares/{transaction_id}": (
+            select(Share, File)
+            .join(File, Share.file_id == File.id)
+            .where(
+                Share.transaction_id == share_row["transaction_id"],
+                or_(Share.sender_user_id == user_id, Share.recipient_user_id == user_id)
+            )
+        ),
+        "GET /auth/me": select(User).where(User.email == user_row["email"]),
+    }
+
+def seq_scans(plan: dict) -> list:
+    """Relations read with a sequential scan anywhere in an EXPLAIN JSON plan"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in CHECKED_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--files", type=int, default=100, help="files per user")
+    parser.add_argument("--folders", type=int, default=10, help="folders per user")
+    args = parser.parse_args()
+
+    dialect = postgresql.dialect()
+    failures = 0
+    db = SessionLocal()
+    try:
+        rows = seed(db, args.users, args.files, args.folders)
+        for name, stmt in endpoint_queries(*rows).items():
+            sql = str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+            result = db.execute(text("EXPLAIN (FORMAT JSON) " + sql)).scalar()
+            plan = (json.loads(result) if isinstance(result, str) else result)[0]["Plan"]
+            scanned = seq_scans(plan)
+            status = "FAIL" if scanned else "ok"
+            print(f"{status:4}  {name}" + (f"  (seq scan on {', '.join(scanned)})" if scanned else ""))
+            failures += bool(scanned)
+    finally:
+        db.rollback()
+        db.close()
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Event loop responsiveness during a login storm.
+
+Fires a burst of concurrent password checks at an in-process app while a
+probe keeps hitting an unrelated endpoint, and reports the probe's latency
+before the storm and during it - once with bcrypt run inline on the event
+loop (how login used to work) and once on the password hashing pool
+(``averify_password``, what login does now). Offloaded, probe latency should
+stay near the baseline; inline, the probe stalls for most of the storm.
+
+Needs no database or Redis - the storm endpoints do exactly the hashing the
+login handler does, at BCRYPT_ROUNDS:
+
+    cd backend && python -m benchmarks.login_storm --logins 64 --concurrency 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+from fastapi import FastAPI
+from app.config import settings
+from app.core.security import averify_password, get_password_hash, verify_password
+
+PASSWORD = "correct horse battery staple"
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    password_hash = get_password_hash(PASSWORD)
+
+    @app.post("/login/inline")
+    async def login_inline():
+        return {"ok": verify_password(PASSWORD, password_hash)}
+
+    @app.post("/login")
+    async def login():
+        return {"ok": await averify_password(PASSWORD, password_hash)}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+async def probe(client: httpx.AsyncClient, stop: asyncio.Event, interval: float) -> list:
+    latencies = []
+    while not stop.is_set():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        await client.get("/ping")
+        # Counted from when the probe was due, so time the loop spent blocked shows up
+        latencies.append(time.perf_counter() - due)
+    return latencies
+
+async def measure(client: httpx.AsyncClient, path: str | None, logins: int, concurrency: int,
+                  interval: float, baseline_seconds: float) -> tuple[list, float]:
+    """Probe latencies while path is stormed (or for baseline_seconds when path is None)"""
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(client, stop, interval))
+    start = time.perf_counter()
+    if path is None:
+        await asyncio.sleep(baseline_seconds)
+    else:
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with slots:
+                response = await client.post(path)
+                response.raise_for_status()
+
+        await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return await prober, elapsed
+
+def summary(label: str, latencies: list, elapsed: float, logins: int = 0) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+    rate = f"  {logins / elapsed:.0f} logins/s" if logins else ""
+    return (f"{label:<10} probe ms: p50 {statistics.median(latencies) * 1000:7.1f}  "
+            f"p95 {p95 * 1000:7.1f}  max {latencies[-1] * 1000:7.1f}  ({len(latencies)} probes){rate}")
+
+async def run_benchmark(logins: int, concurrency: int, interval: float):
+    transport = httpx.ASGITransport(app=build_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"bcrypt rounds {settings.BCRYPT_ROUNDS}, {settings.PASSWORD_HASH_WORKERS} hashing threads, "
+              f"{logins} logins at concurrency {concurrency}")
+        baseline, elapsed = await measure(client, None, logins, concurrency, interval, 1.0)
+        print(summary("baseline", baseline, elapsed))
+        inline, elapsed = await measure(client, "/login/inline", logins, concurrency, interval, 0)
+        print(summary("inline", inline, elapsed, logins))
+        offloaded, elapsed = await measure(client, "/login", logins, concurrency, interval, 0)
+        print(summary("offloaded", offloaded, elapsed, logins))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between probes")
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.logins, args.concurrency, args.interval))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Concurrency benchmark for share delivery.
+
+Many senders deliver files to one recipient at once, all into the same
+(initially missing) target folder. Reports throughput and latency, then
+checks the invariants the single-statement delivery path guarantees:
+
+* exactly one target folder was created,
+* every delivery filed exactly one copy into it,
+* the recipient's storage grew by exactly the delivered bytes,
+* the shared blob gained exactly one reference per delivery.
+
+All rows it creates are removed afterwards. Point it at a migrated
+development database:
+
+    cd backend && python -m benchmarks.share_concurrency --senders 50 --shares 20 --concurrency 32
+"""
+import argparse
+import asyncio
+import hashlib
+import statistics
+import sys
+import time
+import uuid
+from sqlalchemy import select, delete, func
+from app.db.session import AsyncSessionLocal, dispose_engines, pool_status
+from app.models import user, folder, file, share, upload, blob
+from app.models.user import User
+from app.models.folder import Folder
+from app.models.file import File
+from app.models.share import Share
+from app.models.blob import Blob
+from app.services.sharing import deliver_share
+
+FILE_SIZE = 1024 * 1024
+
+async def seed(senders: int):
+    run = uuid.uuid4().hex[:8]
+    checksum = hashlib.sha256(run.encode()).hexdigest()
+    async with AsyncSessionLocal() as db:
+        recipient = User(email=f"bench-recipient-{run}@example.com", name="Recipient", password_hash="x")
+        users = [
+            User(email=f"bench-sender-{run}-{i}@example.com", name=f"Sender {i}", password_hash="x")
+            for i in range(senders)
+        ]
+        db.add_all([recipient, *users])
+        await db.flush()
+
+        files = [
+            File(
+                owner_user_id=u.id,
+                filename="report.pdf",
+                original_filename="report.pdf",
+                size_bytes=FILE_SIZE,
+                mime_type="application/pdf",
+                storage_key=f"blobs/{checksum}",
+                storage_bucket="bench",
+                checksum_sha256=checksum,
+                status="uploaded"
+            )
+            for u in users
+        ]
+        db.add_all(files)
+        db.add(Blob(
+            sha256=checksum,
+            size_bytes=FILE_SIZE,
+            storage_key=f"blobs/{checksum}",
+            storage_bucket="bench",
+            ref_count=len(files)
+        ))
+        await db.commit()
+        return run, recipient, list(zip(users, files)), checksum
+
+async def send(sender: User, file_id, recipient_email: str, folder_name: str, latencies: list):
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        row = await deliver_share(db, sender, file_id, recipient_email, None, folder_name)
+        await db.commit()
+    latencies.append(time.perf_counter() - start)
+    return row is not None
+
+async def run_benchmark(senders: int, shares_per_sender: int, concurrency: int) -> int:
+    run, recipient, pairs, checksum = await seed(senders)
+    folder_name = f"Bench {run}"
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def limited(sender, file_id):
+        async with slots:
+            return await send(sender, file_id, recipient.email, folder_name, latencies)
+
+    jobs = [limited(sender, f.id) for sender, f in pairs for _ in range(shares_per_sender)]
+    start = time.perf_counter()
+    results = await asyncio.gather(*jobs, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    delivered = sum(1 for r in results if r is True)
+
+    failures = []
+    try:
+        async with AsyncSessionLocal() as db:
+            folders = (await db.execute(
+                select(Folder.id).where(Folder.owner_user_id == recipient.id, Folder.name == folder_name)
+            )).scalars().all()
+            copies = (await db.execute(
+                select(func.count()).select_from(File).where(File.owner_user_id == recipient.id)
+            )).scalar()
+            used = (await db.execute(
+                select(User.storage_used_bytes).where(User.id == recipient.id)
+            )).scalar()
+            refs = (await db.execute(select(Blob.ref_count).where(Blob.sha256 == checksum))).scalar()
+
+        if len(folders) != 1:
+            failures.append(f"expected 1 target folder, found {len(folders)}")
+        if copies != delivered:
+            failures.append(f"expected {delivered} copies, found {copies}")
+        if (used or 0) != delivered * FILE_SIZE:
+            failures.append(f"expected {delivered * FILE_SIZE} bytes charged, found {used}")
+        if refs != len(pairs) + delivered:
+            failures.append(f"expected {len(pairs) + delivered} blob refs, found {refs}")
+    finally:
+        async with AsyncSessionLocal() as db:
+            user_ids = [recipient.id, *(s.id for s, _ in pairs)]
+            await db.execute(delete(Share).where(Share.sender_user_id.in_(user_ids)))
+            await db.execute(delete(File).where(File.owner_user_id.in_(user_ids)))
+            await db.execute(delete(Folder).where(Folder.owner_user_id.in_(user_ids)))
+            await db.execute(delete(User).where(User.id.in_(user_ids)))
+            await db.execute(delete(Blob).where(Blob.sha256 == checksum))
+            await db.commit()
+        pool = pool_status()["api"]
+        await dispose_engines()
+
+    latencies.sort()
+    print(f"deliveries: {delivered}/{len(jobs)} ok, {len(errors)} errors in {elapsed:.2f}s "
+          f"({delivered / elapsed:.0f}/s at concurrency {concurrency})")
+    if latencies:
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"latency ms: p50 {statistics.median(latencies) * 1000:.1f}  "
+              f"p95 {p95 * 1000:.1f}  max {latencies[-1] * 1000:.1f}")
+    print(f"pool: {pool['checkouts']} checkouts, waited {pool['wait_seconds_total']:.2f}s total "
+          f"(max {pool['wait_seconds_max'] * 1000:.1f} ms), {pool['timeouts']} timeouts")
+    for error in errors[:5]:
+        print(f"error: {error!r}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+
+    return 1 if failures or errors else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--shares", type=int, default=20, help="deliveries per sender")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    return asyncio.run(run_benchmark(args.senders, args.shares, args.concurrency))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,7 @@ import asyncio
 from sqlalchemy.ext.asyncio import create_async_engine
 from app.config import settings
 from app.db.base import Base
-from app.models import user, folder, file, share
+from app.models import user, folder, file, share, upload, blob, outbox
 
 async def init_db():
     print("Creating database tables...")